@@ -0,0 +1,111 @@
+# Bytes and time per tick for the ways Actions can be sent. Run from the
+# repository root:
+#   python benchmarks/actions_encoding.py
+import json
+import os
+import sys
+import timeit
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from api import Actions
+from route import Route
+
+
+class LegacyActions:
+    # Actions as they were before: every body encoded when added, then each action
+    # and the whole line encoded again when sent
+    def __init__(self) -> None:
+        self.actions : list[dict[str, Any]] = []
+
+    def _addToActions(self, actionType : int, body : dict[str, Any]) -> None:
+        self.actions.append({"actionType" : actionType, "jsonBody" : json.dumps(body)})
+
+    def setVelocities(self, left : float, right : float) -> None:
+        self._addToActions(0, {"left" : left, "right" : right})
+
+    def setCellValue(self, x : int, y : int, value : int) -> None:
+        self._addToActions(2, {"x" : x, "y" : y, "value" : value})
+
+    def setExplored(self, x : int, y : int, explored : bool) -> None:
+        self._addToActions(1, {"x" : x, "y" : y, "explored" : explored})
+
+    def debugPrint(self, message : str) -> None:
+        self._addToActions(3, {"message" : message})
+
+    def displayRoute(self, route : Route) -> None:
+        self.actions.append({"actionType" : 5, "jsonBody" : route.to_json()})
+
+    def encode(self) -> str:
+        actionsToSend = [json.dumps(action) for action in self.actions]
+        return json.dumps({"actions" : actionsToSend})
+
+
+def exampleRoute() -> Route:
+    route = Route()
+    for index in range(40):
+        route.add_curve(((0, index), (0, index + 0.5), (0, index + 1)))
+    return route
+
+
+def controlTick(actions : Any) -> None:
+    # A route following tick, velocities and a debug line
+    actions.setVelocities(0.1, 0.12)
+    actions.debugPrint("Tagential error: 0.0123, Direction error: 1.5")
+
+def explorationTick(actions : Any) -> None:
+    # A maze tick redrawing every flood value and explored flag
+    actions.setVelocities(0.1, 0.1)
+    for x in range(16):
+        for y in range(16):
+            actions.setCellValue(x, y, x + y)
+            actions.setExplored(x, y, (x + y) % 3 == 0)
+
+ROUTE = exampleRoute()
+
+def routeTick(actions : Any) -> None:
+    actions.displayRoute(ROUTE)
+    actions.setVelocities(0.1, 0.1)
+
+
+def timePerTick(function : Callable[[], object]) -> float:
+    # Best of 5, in microseconds
+    runs = 200
+    return min(timeit.repeat(function, number=runs, repeat=5)) / runs * 1e6
+
+
+def main() -> None:
+    ticks : list[tuple[str, Callable[[Any], None]]] = [
+        ("control", controlTick),
+        ("exploration", explorationTick),
+        ("display route", routeTick),
+    ]
+
+    print(f"{'tick':<15}{'encoder':<10}{'bytes':>8}{'us/tick':>10}")
+    for name, fill in ticks:
+        def legacyTick() -> str:
+            tick = LegacyActions()
+            fill(tick)
+            return tick.encode()
+
+        def jsonTick() -> str:
+            tick = Actions()
+            fill(tick)
+            return tick.encode()
+
+        def binaryTick() -> bytes:
+            tick = Actions()
+            fill(tick)
+            return tick.encodeBinary()
+
+        assert jsonTick() == legacyTick()
+
+        # The JSON lines also carry a newline
+        print(f"{name:<15}{'legacy':<10}{len(legacyTick()) + 1:>8}{timePerTick(legacyTick):>10.1f}")
+        print(f"{name:<15}{'json':<10}{len(jsonTick()) + 1:>8}{timePerTick(jsonTick):>10.1f}")
+        print(f"{name:<15}{'binary':<10}{len(binaryTick()):>8}{timePerTick(binaryTick):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Micro-benchmark of the lookup tables in src/cell.py against the match based
+# functions they replaced. Run from the repository root:
+#   python benchmarks/cell_tables.py
+import os
+import sys
+import timeit
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.cell import Direction, MouseDirection, Cell, CLEAR_DIRECTIONS, DIRECTION_VECTORS, OPPOSITE_DIRECTIONS, TURNS, neighbourTable
+
+
+# Previous implementations, kept here as the reference to compare against
+def legacyFromMouseDirection(mouseDirection : Direction, relativeDirection : MouseDirection) -> Direction:
+    return Direction((mouseDirection.value + relativeDirection.value) % 4)
+
+def legacyVector(direction : Direction) -> tuple[int, int]:
+    match (direction.value):
+        case Direction.WEST.value:
+            return (-1, 0)
+        case Direction.NORTH.value:
+            return (0, 1)
+        case Direction.EAST.value:
+            return (1, 0)
+        case Direction.SOUTH.value:
+            return (0, -1)
+        case _:
+            return (0,0)
+
+def legacyOpposite(direction : Direction) -> Direction:
+    match (direction.value):
+        case Direction.WEST.value:
+            return Direction.EAST
+        case Direction.NORTH.value:
+            return Direction.SOUTH
+        case Direction.EAST.value:
+            return Direction.WEST
+        case Direction.SOUTH.value:
+            return Direction.NORTH
+        case _:
+            return Direction.NORTH
+
+def legacyTurnsTo(direction : Direction, turnTo : Direction) -> list[MouseDirection]:
+    match (turnTo.value - direction.value):
+        case 0:
+            return []
+        case -1 | 3:
+            return [MouseDirection.LEFT]
+        case -2 | 2:
+            return [MouseDirection.LEFT, MouseDirection.LEFT]
+        case -3 | 1:
+            return [MouseDirection.RIGHT]
+        case _:
+            raise Exception("Invalid turnTo")
+
+def legacyGetClearDirections(cellValue : int) -> list[Direction]:
+    directions = []
+    if cellValue & (1 << 3) == 0:
+        directions.append(Direction.NORTH)
+    if cellValue & (1 << 2) == 0:
+        directions.append(Direction.WEST)
+    if cellValue & (1 << 1) == 0:
+        directions.append(Direction.EAST)
+    if cellValue & (1 << 0) == 0:
+        directions.append(Direction.SOUTH)
+    return directions
+
+def legacyNeighbours(x : int, y : int, cellValue : int) -> list[tuple[int, int]]:
+    neighbours = []
+    for direction in legacyGetClearDirections(cellValue):
+        dx, dy = legacyVector(direction)
+        nx = x + dx
+        ny = y + dy
+        if nx < 0 or nx >= 16 or ny < 0 or ny >= 16:
+            continue
+        neighbours.append((nx, ny))
+    return neighbours
+
+
+def timePerCall(function : Callable[[], object], calls : int) -> float:
+    # Best of 5 runs, in nanoseconds per call
+    return min(timeit.repeat(function, number=1, repeat=5)) / calls * 1e9
+
+
+def main() -> None:
+    directions = list(Direction)
+    mouseDirections = list(MouseDirection)
+    neighbours = neighbourTable(16, 16)
+    cellValues = range(16)
+    cases : list[tuple[str, Callable[[], object], Callable[[], object], int]] = [
+        (
+            "fromMouseDirection",
+            lambda: [legacyFromMouseDirection(d, m) for d in directions for m in mouseDirections],
+            lambda: [Direction.fromMouseDirection(d, m) for d in directions for m in mouseDirections],
+            16,
+        ),
+        (
+            "vector",
+            lambda: [legacyVector(d) for d in directions],
+            lambda: [DIRECTION_VECTORS[d.value] for d in directions],
+            4,
+        ),
+        (
+            "opposite",
+            lambda: [legacyOpposite(d) for d in directions],
+            lambda: [OPPOSITE_DIRECTIONS[d.value] for d in directions],
+            4,
+        ),
+        (
+            "turnsTo",
+            lambda: [legacyTurnsTo(d, t) for d in directions for t in directions],
+            lambda: [TURNS[d.value][t.value] for d in directions for t in directions],
+            16,
+        ),
+        (
+            "getClearDirections",
+            lambda: [legacyGetClearDirections(v) for v in cellValues],
+            lambda: [CLEAR_DIRECTIONS[v] for v in cellValues],
+            16,
+        ),
+        (
+            "neighbours",
+            lambda: [legacyNeighbours(x, y, 0) for x in range(16) for y in range(16)],
+            lambda: [neighbours[x][y][0] for x in range(16) for y in range(16)],
+            256,
+        ),
+    ]
+
+    print(f"{'function':<20}{'match (ns)':>12}{'table (ns)':>12}{'speedup':>10}")
+    for name, legacy, table, calls in cases:
+        legacyTime = timePerCall(lambda: [legacy() for _ in range(1000)], calls * 1000)
+        tableTime = timePerCall(lambda: [table() for _ in range(1000)], calls * 1000)
+        print(f"{name:<20}{legacyTime:>12.1f}{tableTime:>12.1f}{legacyTime / tableTime:>9.1f}x")
+
+    # Cell.getClearDirections keeps returning a fresh list for existing callers
+    assert all(Cell.getClearDirections(v) == legacyGetClearDirections(v) for v in cellValues)
+
+
+if __name__ == "__main__":
+    main()
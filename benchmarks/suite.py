@@ -0,0 +1,352 @@
+# Benchmarks of the solver, route tracker and protocol hot paths. Reports
+# operations per second and peak memory of one operation for each, saves the
+# results as JSON and compares them against a stored baseline. Run from the
+# repository root:
+#   python benchmarks/suite.py                    compare against benchmarks/baseline.json
+#   python benchmarks/suite.py --save out.json    also save this run
+#   python benchmarks/suite.py --update-baseline  make this run the baseline
+#   python benchmarks/suite.py --filter route     only benchmarks with route in their name
+# Exits with 1 when a benchmark is slower than the baseline by more than --threshold.
+# The baseline is only meaningful on the machine it was recorded on
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Iterator
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from old_main import Maze, MazeOverlay, NumpyMaze, centreGoal
+from src.cell import Direction
+from src.path import Path
+from src.snapshot import Snapshot, readJsonMaze, readJsonRoutes, writeSnapshot
+from api import Actions
+from route import Route
+from primitives import route_from_cells
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+MAZE_FILE = os.path.join(ROOT, "outputs", "maze.json")
+ROUTES_FILE = os.path.join(ROOT, "outputs", "bestRoutes.json")
+
+# name -> function to time, built once before timing
+Benchmark = tuple[str, Callable[[], object]]
+
+
+def generateMaze(seed : int, loops : int = 0, width : int = 16, height : int = 16) -> list[list[int]]:
+    # Random maze, cells[x][y] wall bits. A perfect maze carved by depth first
+    # search, with loops extra walls knocked out so there is more than one route
+    rng = random.Random(seed)
+    cells = [[15] * height for _ in range(width)]
+    seen = [[False] * height for _ in range(width)]
+    # (dx, dy, wall bit, neighbour's wall bit)
+    sides = [(0, 1, 8, 1), (-1, 0, 4, 2), (1, 0, 2, 4), (0, -1, 1, 8)]
+
+    stack = [(0, 0)]
+    seen[0][0] = True
+    while stack:
+        x, y = stack[-1]
+        options = [(x + dx, y + dy, wall, other) for dx, dy, wall, other in sides if 0 <= x + dx < width and 0 <= y + dy < height and not seen[x + dx][y + dy]]
+        if not options:
+            stack.pop()
+            continue
+        nx, ny, wall, other = rng.choice(options)
+        cells[x][y] &= ~wall
+        cells[nx][ny] &= ~other
+        seen[nx][ny] = True
+        stack.append((nx, ny))
+
+    while loops:
+        x, y = rng.randrange(1, width - 1), rng.randrange(1, height - 1)
+        dx, dy, wall, other = rng.choice(sides)
+        if cells[x][y] & wall:
+            cells[x][y] &= ~wall
+            cells[x + dx][y + dy] &= ~other
+            loops -= 1
+    return cells
+
+
+def loadMaze(mazeType : type[Maze], cells : list[list[int]], explored : list[list[bool]] | None = None) -> Maze:
+    width, height = len(cells), len(cells[0])
+    maze = mazeType(None, width, height)
+    maze.cells = [row.copy() for row in cells]
+    maze.explored = [row.copy() for row in explored] if explored is not None else [[True] * height for _ in range(width)]
+    return maze
+
+
+def zigzagRoute(curves : int) -> Route:
+    # Alternating quarter turns like the example route in route.py, one cell per curve
+    route = Route()
+    x, y = 0.0, 0.0
+    for index in range(curves):
+        side = 0.5 if index % 2 == 0 else -0.5
+        route.add_curve(((x, y), (x, y + 0.5), (x + side, y + 1)))
+        x, y = x + side, y + 1
+    return route
+
+
+@contextlib.contextmanager
+def quiet() -> Iterator[None]:
+    # log and Actions.send write to stdout, which would drown the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def alternateGoals(maze : Maze, goal : list[tuple[int, int]]) -> Callable[[], object]:
+    # Back and forth between the goals of a run with no new walls, served from the flood cache
+    def alternate() -> object:
+        maze.recalculate(goal, updateDisplay=False)
+        maze.recalculate([(0, 0)], updateDisplay=False)
+        return maze.flood
+    return alternate
+
+
+def solverBenchmarks() -> list[Benchmark]:
+    with open(MAZE_FILE, "r") as f:
+        saved = json.load(f)
+    mazes = [
+        ("maze.json", saved["cells"], saved["explored"]),
+        ("perfect", generateMaze(1), None),
+        ("loops", generateMaze(2, loops=30), None),
+        ("loops32", generateMaze(4, loops=120, width=32, height=32), None),
+        ("loops64", generateMaze(5, loops=480, width=64, height=64), None),
+    ]
+
+    benchmarks : list[Benchmark] = []
+    for name, cells, explored in mazes:
+        goal = centreGoal(len(cells), len(cells[0]))
+        for mazeType in (Maze, NumpyMaze):
+            maze = loadMaze(mazeType, cells, explored)
+            benchmarks.append((
+                f"recalculate/{mazeType.__name__}/{name}",
+                functools.partial(maze.recalculate, goal, updateDisplay=False, incremental=False),
+            ))
+
+            maze = loadMaze(mazeType, cells, explored)
+            benchmarks.append((f"alternateGoals/{mazeType.__name__}/{name}", alternateGoals(maze, goal)))
+
+        for alternatives in (False, True):
+            maze = loadMaze(Maze, cells, explored)
+            benchmarks.append((
+                f"calculateBestRoutes/{'alternatives' if alternatives else 'best'}/{name}",
+                functools.partial(maze.calculateBestRoutes, (0, 0), Direction.NORTH, goal, alternatives),
+            ))
+
+        maze = loadMaze(Maze, cells, explored)
+        benchmarks.append((f"fastestRoute/{name}", functools.partial(maze.fastestRoute, (0, 0), Direction.NORTH, goal)))
+
+    # No walls inside, where the vectorised fill reaches the most cells per step
+    for size in (16, 32, 64):
+        cells = Maze(None, size, size).cells
+        goal = centreGoal(size, size)
+        for mazeType in (Maze, NumpyMaze):
+            maze = loadMaze(mazeType, cells)
+            benchmarks.append((
+                f"recalculate/{mazeType.__name__}/open{size}",
+                functools.partial(maze.recalculate, goal, updateDisplay=False, incremental=False),
+            ))
+    return benchmarks
+
+
+def overlayBenchmarks() -> list[Benchmark]:
+    # Trying out one more wall, on an overlay and on a full copy of the maze
+    goal = centreGoal(16, 16)
+    maze = loadMaze(Maze, generateMaze(2, loops=30))
+    maze.recalculate(goal, updateDisplay=False)
+
+    def overlay() -> object:
+        whatIf = MazeOverlay(maze)
+        whatIf.addWall(3, 4, Direction.NORTH)
+        whatIf.recalculate(goal, updateDisplay=False)
+        return whatIf.flood
+
+    def copy() -> object:
+        whatIf = loadMaze(Maze, maze.cells, maze.explored)
+        whatIf.addWall(3, 4, Direction.NORTH)
+        whatIf.recalculate(goal, updateDisplay=False)
+        return whatIf.flood
+
+    return [
+        ("MazeOverlay/loops", lambda: MazeOverlay(maze)),
+        ("loadMaze/loops", lambda: loadMaze(Maze, maze.cells, maze.explored)),
+        ("whatIfWall/MazeOverlay/loops", overlay),
+        ("whatIfWall/copy/loops", copy),
+    ]
+
+
+def routeBenchmarks() -> list[Benchmark]:
+    benchmarks : list[Benchmark] = []
+    rng = random.Random(3)
+    for curves in (10, 100, 1000, "near100"):
+        route = zigzagRoute(100 if curves == "near100" else int(curves))
+        if curves == "near100":
+            # Points just off the route, as while following it
+            samples = route.sample_points.tolist()
+            points = [(x + rng.gauss(0, 0.05), y + rng.gauss(0, 0.05)) for x, y in rng.sample(samples, 64)]
+        else:
+            # Points scattered around the route, cycled through so every call does a real search
+            points = [(rng.uniform(-1, 1), rng.uniform(0, int(curves))) for _ in range(64)]
+        for analytic in (False, True):
+            def errors(route : Route = route, points : list[tuple[float, float]] = points, analytic : bool = analytic, index : list[int] = [0]) -> object:
+                index[0] = (index[0] + 1) % len(points)
+                return route.calculate_errors(points[index[0]], 1.0, analytic)
+            benchmarks.append((f"calculate_errors/{'analytic' if analytic else 'sampled'}/{curves}", errors))
+
+    # The same snake over the whole maze as pathBenchmarks, as a route to follow
+    cells = [(x, y if x % 2 == 0 else 15 - y) for x in range(16) for y in range(16)]
+    benchmarks.append(("route_from_cells/256", lambda: route_from_cells(cells)))
+    return benchmarks
+
+
+def pathBenchmarks() -> list[Benchmark]:
+    # A path snaking over the whole maze, turning at the end of every column
+    cells = [(x, y if x % 2 == 0 else 15 - y) for x in range(16) for y in range(16)]
+    path = Path(cells)
+    return [
+        ("Path/hash/256", lambda: hash(path)),
+        ("Path/getNumberOfTurns/256", path.getNumberOfTurns),
+        ("Path/build/256", lambda: Path(cells)),
+        ("Path/copy+append/256", lambda: path.copy().append((16, 0))),
+    ]
+
+
+def snapshotBenchmarks() -> list[Benchmark]:
+    # Reading the saved maze and routes as JSON against a snapshot of them
+    cells, explored = readJsonMaze(MAZE_FILE)
+    routes = readJsonRoutes(ROUTES_FILE)
+    maze = loadMaze(Maze, cells, explored)
+    maze.recalculate(centreGoal(16, 16), updateDisplay=False)
+    snapshotFile = os.path.join(tempfile.mkdtemp(), "maze.mzs")
+    writeSnapshot(snapshotFile, maze.cells, maze.explored, maze.flood, centreGoal(16, 16), routes)
+    snapshot = Snapshot.open(snapshotFile)
+
+    def openSnapshot() -> object:
+        snapshot = Snapshot.open(snapshotFile)
+        return snapshot.cells, snapshot.explored, snapshot.flood
+
+    return [
+        ("readJsonMaze/maze.json", lambda: readJsonMaze(MAZE_FILE)),
+        ("Snapshot.open/maze.json", openSnapshot),
+        ("readJsonRoutes/bestRoutes.json", lambda: readJsonRoutes(ROUTES_FILE)),
+        ("Snapshot.routes/bestRoutes.json", snapshot.routes),
+    ]
+
+
+def actionsBenchmarks() -> list[Benchmark]:
+    def control() -> None:
+        actions = Actions()
+        actions.setVelocities(0.1, 0.12)
+        actions.debugPrint("Tagential error: 0.0123, Direction error: 1.5")
+        actions.send()
+
+    def exploration() -> None:
+        # What one exploring move changes on the display
+        actions = Actions()
+        actions.setVelocities(0.1, 0.1)
+        for index in range(16):
+            actions.setCellValue(index, 3, index)
+        actions.setExplored(3, 4, True)
+        actions.setWall(3, 4, 1)
+        actions.send()
+
+    def redraw() -> None:
+        # Every cell value and explored flag, as after loading a maze
+        actions = Actions()
+        for x in range(16):
+            for y in range(16):
+                actions.setCellValue(x, y, x + y)
+                actions.setExplored(x, y, True)
+        actions.send()
+
+    return [
+        ("Actions.send/2", control),
+        ("Actions.send/19", exploration),
+        ("Actions.send/512", redraw),
+    ]
+
+
+def measure(function : Callable[[], object], minTime : float) -> dict[str, float]:
+    with quiet():
+        # Warm up, also lets anything a benchmark caches on its first call settle
+        function()
+
+        timer = timeit.Timer(function)
+        number = 1
+        while True:
+            elapsed = timer.timeit(number)
+            if elapsed >= minTime:
+                break
+            number *= 2 if elapsed == 0 else max(2, min(10, int(minTime / elapsed) + 1))
+        best = min([elapsed] + timer.repeat(repeat=4, number=number)) / number
+
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {"ops_per_sec" : 1 / best, "us_per_op" : best * 1e6, "peak_kib" : peak / 1024}
+
+
+def compare(results : dict[str, dict[str, float]], baseline : dict[str, dict[str, float]], threshold : float) -> list[str]:
+    # Names of benchmarks more than threshold slower than the baseline
+    return [
+        name for name, result in results.items()
+        if name in baseline and result["ops_per_sec"] < baseline[name]["ops_per_sec"] * (1 - threshold)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the solver, route tracker and protocol hot paths")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", help="save the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown counted as a regression, 0.25 is 25%%")
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds per timing run")
+    args = parser.parse_args()
+
+    baseline : dict[str, dict[str, float]] = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+
+    benchmarks = solverBenchmarks() + overlayBenchmarks() + routeBenchmarks() + pathBenchmarks() + snapshotBenchmarks() + actionsBenchmarks()
+    results : dict[str, dict[str, float]] = {}
+    print(f"{'benchmark':<46}{'ops/s':>12}{'us/op':>12}{'peak KiB':>10}{'vs base':>9}")
+    for name, function in benchmarks:
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(function, args.min_time)
+        change = f"{result['ops_per_sec'] / baseline[name]['ops_per_sec']:>8.2f}x" if name in baseline else f"{'-':>9}"
+        print(f"{name:<46}{result['ops_per_sec']:>12.1f}{result['us_per_op']:>12.1f}{result['peak_kib']:>10.1f}{change}")
+
+    report = {
+        "python" : platform.python_version(),
+        "machine" : platform.machine(),
+        "time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results" : results,
+    }
+    for path in [args.save] + ([args.baseline] if args.update_baseline else []):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+
+    regressions = compare(results, baseline, args.threshold)
+    for name in regressions:
+        print(f"Regression: {name} is {1 - results[name]['ops_per_sec'] / baseline[name]['ops_per_sec']:.0%} slower than the baseline")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
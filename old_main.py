@@ -1,64 +1,125 @@
-import copy
+import heapq
+import math
+import struct
 import src.api as api
+from src.api import INSTRUMENTS, log
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from enum import Enum
-from src.cell import Direction, MouseDirection, Cell
-from src.route import Route
+from src.cell import Direction, MouseDirection, Cell, DIRECTION_VECTORS, TURNS, WALL_BITS, neighbourTable
+from src.display import Display
+from src.path import Path, countTurns
+from src.snapshot import Snapshot, isSnapshot, writeSnapshot
 from typing import Final
-import time
 import json
 
 
 class MouseState(Enum):
     EXPLORING = 0
 
-REACH_FINISH_GOAL = [(7,7), (7,8), (8,7), (8,8)]
+def centreGoal(width : int, height : int) -> list[tuple[int, int]]:
+    # The middle cells of a maze, 2x2 for even sizes and one wide along odd sides
+    xs = [width // 2] if width % 2 else [width // 2 - 1, width // 2]
+    ys = [height // 2] if height % 2 else [height // 2 - 1, height // 2]
+    return [(x, y) for x in xs for y in ys]
+
+REACH_FINISH_GOAL = centreGoal(16, 16)
 REACH_START_GOAL = [(0,0)]
+
+# Floods kept per maze, enough for both goals of a run and a few what-ifs
+FLOOD_CACHE_SIZE = 4
  
 
 class Mouse:
     ORDER_TO_CHECK : Final[list[MouseDirection]] = [MouseDirection.FORWARD, MouseDirection.LEFT, MouseDirection.RIGHT, MouseDirection.BACKWARD]
 
-    def __init__(self) -> None:
-        self.maze = Maze()
+    def __init__(self, useNumpyMaze : bool = False, width : int = 16, height : int = 16, goal : list[tuple[int, int]] | None = None) -> None:
+        self.mazeType : type[Maze] = NumpyMaze if useNumpyMaze else Maze
+        self.display = Display(width, height)
+        self.maze = self.mazeType(self.display, width, height)
+        self.goal = goal if goal is not None else centreGoal(width, height)
         self.x = 0
         self.y = 0
         self.direction = Direction.NORTH
         self.state = MouseState.EXPLORING
+        # Cells the mouse has read the sensors in. Their walls are all known, the
+        # one behind being the way in, so passing through again tells it nothing
+        self.sensedCells : set[tuple[int, int]] = set()
 
     def run(self) -> None:
         while (True):
             match self.state:
                 case MouseState.EXPLORING:
-                    complete = self.exploringMove(REACH_FINISH_GOAL, False, MouseState.RETURNING)
+                    complete = self.exploringMove(self.goal, False, MouseState.RETURNING)
                     if (complete):
                         self.markOutCenter()
 
+    @INSTRUMENTS.timed("exploringMove")
     def exploringMove(self, goal : list[tuple[int, int]], shouldEnterGoal : bool, nextState : MouseState) -> bool:
         if (shouldEnterGoal and (self.x, self.y) in goal):
             log("Entered goal")
             self.state = nextState
             return True
         
-        self.addMouseWalls()
-        self.maze.setExplored(self.x, self.y)
+        known = (self.x, self.y) in self.sensedCells
+        if not known:
+            self.addMouseWalls()
+            self.maze.setExplored(self.x, self.y)
+            self.sensedCells.add((self.x, self.y))
 
         self.maze.recalculate(goal)
         self.drawRoute()
+        self.flushDisplay()
 
         bestDirection = self.FindBestDirection()
 
         # Check if mouse will complete maze
         dx, dy = bestDirection.vector
-        if not shouldEnterGoal and (self.x + dx, self.y + dy) in REACH_FINISH_GOAL:
+        if not shouldEnterGoal and (self.x + dx, self.y + dy) in self.goal:
             log("Can enter goal")
             self.state = nextState
             return True
         
-        self.TurnMouse(bestDirection)
-        self.MoveForward()
+        if known:
+            # No walls can show up until the mouse leaves the sensed cells, so the
+            # moves through them are all decided now and driven without sensing
+            self.followPlan(self.planKnownMoves(goal, shouldEnterGoal))
+        else:
+            self.TurnMouse(bestDirection)
+            self.MoveForward()
 
         return False
 
+    def planKnownMoves(self, goal : list[tuple[int, int]], shouldEnterGoal : bool) -> list[Direction]:
+        # The moves exploringMove would make one at a time from here, up to and
+        # including the one into the first cell that has not been sensed. The
+        # flood can't change on the way, so each step picks what it would have
+        x, y, direction = self.x, self.y, self.direction
+        moves : list[Direction] = []
+        while (x, y) in self.sensedCells and not (shouldEnterGoal and (x, y) in goal):
+            direction = self.bestDirectionFrom(x, y, direction)
+            dx, dy = direction.vector
+            if not shouldEnterGoal and (x + dx, y + dy) in self.goal:
+                break
+            moves.append(direction)
+            x += dx
+            y += dy
+        return moves
+
+    def followPlan(self, moves : list[Direction]) -> None:
+        # Drives planned moves, each straight run as one forward command rather
+        # than a command and three sensor reads per cell
+        log(f"Following {len(moves)} known moves from ({self.x}, {self.y})")
+        index = 0
+        while index < len(moves):
+            run = 1
+            while index + run < len(moves) and moves[index + run] == moves[index]:
+                run += 1
+            self.TurnMouse(moves[index])
+            self.MoveForward(run)
+            index += run
+
     def addMouseWalls(self) -> None:
         left, front, right = self.getSensors()
         log(f"Sensors detected at ({self.x}, {self.y}). Facing {self.direction.name}. left: {left}, front {front}, right {right}")
@@ -72,41 +133,27 @@ class Mouse:
             self.maze.addWall(self.x, self.y, Direction.fromMouseDirection(self.direction, MouseDirection.RIGHT))
 
     def FindBestDirection(self) -> Direction:
-        # Get next direction
-        currentCell = self.maze.cells[self.x][self.y]
-        clearDirectionsAbsolute = Cell.getClearDirections(currentCell)
-        
-        # Convert to relative directions, to prioritize front over left over right over back
-        clearDirections = []
-
-        forwardAbsolute = Direction.fromMouseDirection(self.direction, MouseDirection.FORWARD)
-        leftAbsolute = Direction.fromMouseDirection(self.direction, MouseDirection.LEFT)
-        rightAbsolute = Direction.fromMouseDirection(self.direction, MouseDirection.RIGHT)
-        backwardAbsolute = Direction.fromMouseDirection(self.direction, MouseDirection.BACKWARD)
-
-        if forwardAbsolute in clearDirectionsAbsolute:
-            clearDirections.append(forwardAbsolute)
-        if leftAbsolute in clearDirectionsAbsolute:
-            clearDirections.append(leftAbsolute)
-        if rightAbsolute in clearDirectionsAbsolute:
-            clearDirections.append(rightAbsolute)
-        if backwardAbsolute in clearDirectionsAbsolute:
-            clearDirections.append(backwardAbsolute)
+        bestDirection = self.bestDirectionFrom(self.x, self.y, self.direction)
+        log(f"Best direction calculated: {bestDirection.name}")
+        return bestDirection
 
-        log(f"Clear directions at ({self.x}, {self.y}): {clearDirections}")
+    def bestDirectionFrom(self, x : int, y : int, facing : Direction) -> Direction:
+        # Get next direction, prioritizing front over left over right over back
+        currentCell = self.maze.cells[x][y]
+        clearDirections = [direction for direction in DIRECTIONS_TO_CHECK[facing.value] if not currentCell & WALL_BITS[direction.value]]
 
         bestDirection = clearDirections[0]
         bestDirectionValue = 999999
         for direction in clearDirections:
             # Get vector
-            dx, dy = direction.vector
+            dx, dy = DIRECTION_VECTORS[direction.value]
 
             # Get new position
-            nx = self.x + dx
-            ny = self.y + dy
+            nx = x + dx
+            ny = y + dy
 
             # Check if in bounds
-            if nx < 0 or nx >= 16 or ny < 0 or ny >= 16:
+            if nx < 0 or nx >= self.maze.width or ny < 0 or ny >= self.maze.height:
                 raise Exception("Clear direction detected in out of bounds")
                         
             shortestPrediction = self.maze.flood[nx][ny] < bestDirectionValue
@@ -117,7 +164,6 @@ class Mouse:
                 bestDirection = direction
                 bestDirectionValue = self.maze.flood[nx][ny]
 
-        log(f"Best direction calculated: {bestDirection.name}")
         return bestDirection
 
     def TurnMouse(self, newDirection : Direction) -> None:
@@ -132,40 +178,40 @@ class Mouse:
         
         self.direction = newDirection
 
-    def MoveForward(self) -> None:
-        api.moveForward()
+    def MoveForward(self, cells : int = 1) -> None:
+        api.moveForward(cells)
 
         # Update position
         dx, dy = self.direction.vector
-        self.x += dx
-        self.y += dy
+        self.x += dx * cells
+        self.y += dy * cells
             
 
     def getSensors(self) -> tuple[bool, bool, bool]:
         return (api.wallLeft(), api.wallFront(), api.wallRight())
 
 
+    @INSTRUMENTS.timed("drawRoute")
     def drawRoute(self) -> None:
-        api.clearAllColor()
+        self.display.clearAllColor()
 
         x, y = self.x, self.y
         direction = self.direction
         currentValue = self.maze.flood[x][y]
         while (True):
-            api.setColor(x, y, "g")
+            self.display.setColor(x, y, "g")
             if (currentValue == 0):
                 break
 
-            clearDirections = Cell.getClearDirections(self.maze.cells[x][y])
-            for directionToCheck in Mouse.ORDER_TO_CHECK:
-                possibleNewDirection = Direction.fromMouseDirection(direction, directionToCheck)
-                if possibleNewDirection not in clearDirections:
+            currentCell = self.maze.cells[x][y]
+            for possibleNewDirection in DIRECTIONS_TO_CHECK[direction.value]:
+                if currentCell & WALL_BITS[possibleNewDirection.value]:
                     continue
 
-                dx, dy = possibleNewDirection.vector
+                dx, dy = DIRECTION_VECTORS[possibleNewDirection.value]
                 nx = x + dx
                 ny = y + dy
-                if (nx < 0 or nx >= 16 or ny < 0 or ny >= 16):
+                if (nx < 0 or nx >= self.maze.width or ny < 0 or ny >= self.maze.height):
                     continue
 
                 if (self.maze.flood[nx][ny] == currentValue - 1):
@@ -175,22 +221,25 @@ class Mouse:
                     break
         
     def markOutCenter(self) -> None:
-        # Mark out center square
+        # Mark out center square, a 2x2 goal with a single entrance
+        (left, bottom), (right, top) = min(self.goal), max(self.goal)
+        assert right == left + 1 and top == bottom + 1, "Only 2x2 goals can be marked out"
+
         directionToCenter = self.FindBestDirection()
         dx, dy = directionToCenter.vector
         centerWithEntrance = (self.x + dx, self.y + dy)
-        if centerWithEntrance != (7,7):
-            self.maze.addWall(7,7, Direction.WEST)
-            self.maze.addWall(7,7, Direction.SOUTH)
-        if centerWithEntrance != (7,8):
-            self.maze.addWall(7,8, Direction.WEST)
-            self.maze.addWall(7,8, Direction.NORTH)
-        if centerWithEntrance != (8,7):
-            self.maze.addWall(8,7, Direction.EAST)
-            self.maze.addWall(8,7, Direction.SOUTH)
-        if centerWithEntrance != (8,8):
-            self.maze.addWall(8,8, Direction.EAST)
-            self.maze.addWall(8,8, Direction.NORTH)
+        if centerWithEntrance != (left,bottom):
+            self.maze.addWall(left,bottom, Direction.WEST)
+            self.maze.addWall(left,bottom, Direction.SOUTH)
+        if centerWithEntrance != (left,top):
+            self.maze.addWall(left,top, Direction.WEST)
+            self.maze.addWall(left,top, Direction.NORTH)
+        if centerWithEntrance != (right,bottom):
+            self.maze.addWall(right,bottom, Direction.EAST)
+            self.maze.addWall(right,bottom, Direction.SOUTH)
+        if centerWithEntrance != (right,top):
+            self.maze.addWall(right,top, Direction.EAST)
+            self.maze.addWall(right,top, Direction.NORTH)
 
         # Add center square without entrance
         possibleWallToAdd = [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
@@ -203,109 +252,282 @@ class Mouse:
         elif (dy == -1):
             possibleWallToAdd.remove(Direction.NORTH)
         
-        if centerWithEntrance[0] == 7:
+        if centerWithEntrance[0] == left:
             possibleWallToAdd.remove(Direction.EAST)
-        elif centerWithEntrance[0] == 8:
+        elif centerWithEntrance[0] == right:
             possibleWallToAdd.remove(Direction.WEST)
 
-        if centerWithEntrance[1] == 7:
+        if centerWithEntrance[1] == bottom:
             possibleWallToAdd.remove(Direction.NORTH)
-        elif centerWithEntrance[1] == 8:
+        elif centerWithEntrance[1] == top:
             possibleWallToAdd.remove(Direction.SOUTH)
 
         assert len(possibleWallToAdd) == 1
 
         self.maze.addWall(centerWithEntrance[0], centerWithEntrance[1], possibleWallToAdd.pop())
 
-        self.maze.setExplored(7, 7)
-        self.maze.setExplored(7, 8)
-        self.maze.setExplored(8, 7)
-        self.maze.setExplored(8, 8)
+        for x, y in self.goal:
+            self.maze.setExplored(x, y)
 
     def loadMaze(self, filename : str) -> None:
-        with open(filename, "r") as f:
-            maze = json.loads(f.read())
-            self.maze = Maze()
+        # A JSON maze like outputs/maze.json, or a snapshot from src/snapshot.py,
+        # whose saved flood is used instead of filling it again when the goal matches
+        snapshot = Snapshot.open(filename) if isSnapshot(filename) else None
+        if snapshot is None:
+            with open(filename, "r") as f:
+                maze = json.loads(f.read())
+            width, height = len(maze["cells"]), len(maze["cells"][0])
+        else:
+            width, height = snapshot.width, snapshot.height
+
+        # The maze file decides the size, the goal follows it unless it was given
+        if (width, height) != (self.maze.width, self.maze.height):
+            if self.goal == centreGoal(self.maze.width, self.maze.height):
+                self.goal = centreGoal(width, height)
+            self.display = Display(width, height)
+        self.maze = self.mazeType(self.display, width, height)
+        # Walls sensed so far belong to the maze being replaced
+        self.sensedCells.clear()
+        if snapshot is None:
             self.maze.cells = maze["cells"]
             self.maze.explored = maze["explored"]
-            self.maze.recalculate(REACH_FINISH_GOAL)
-            api.clearAllColor()
+        else:
+            self.maze.loadSnapshot(snapshot)
+        self.maze.recalculate(self.goal)
+        self.display.clearAllColor()
+        self.flushDisplay()
+
+    def flushDisplay(self) -> None:
+        # Send everything drawn since the last flush as one batch
+        actions = api.Actions()
+        if self.display.flush(actions):
+            actions.send()
             
+# DIRECTIONS_TO_CHECK[direction.value], Mouse.ORDER_TO_CHECK as absolute directions
+DIRECTIONS_TO_CHECK : Final[tuple[tuple[Direction, ...], ...]] = tuple(
+    tuple(Direction.fromMouseDirection(direction, directionToCheck) for directionToCheck in Mouse.ORDER_TO_CHECK) for direction in Direction
+)
+
+# Time to drive a route, in seconds. The mouse enters and leaves every straight
+# run at turnSpeed, accelerating towards topSpeed and braking again in time, so
+# each extra cell of a run is quicker than the one before until top speed is
+# reached. Turning in place adds turnTime per quarter turn
+class DriveModel:
+    def __init__(self, turnSpeed : float = 1.0, topSpeed : float = 4.0, acceleration : float = 4.0, turnTime : float = 0.3) -> None:
+        # Speeds in cells per second, acceleration in cells per second squared
+        self.turnSpeed = turnSpeed
+        self.topSpeed = topSpeed
+        self.acceleration = acceleration
+        self.turnTime = turnTime
+
+        # Runs at least this long reach top speed, every cell past it costs the same
+        self.longestRun = max(1, math.ceil((topSpeed ** 2 - turnSpeed ** 2) / acceleration))
+        self.runTimes = [self.runTime(cells) for cells in range(self.longestRun + 1)]
+
+    def runTime(self, cells : int) -> float:
+        # Time to drive a straight run of cells, starting and ending at turnSpeed
+        v0, vmax, a = self.turnSpeed, self.topSpeed, self.acceleration
+        rampDistance = (vmax ** 2 - v0 ** 2) / a
+        if cells >= rampDistance:
+            return 2 * (vmax - v0) / a + (cells - rampDistance) / vmax
+        return 2 * (math.sqrt(v0 ** 2 + a * cells) - v0) / a
+
+    def extendRun(self, run : int) -> float:
+        # Extra time for driving one more cell after a run of run cells. Adding these
+        # up over a run gives its runTime
+        if run >= self.longestRun:
+            return 1 / self.topSpeed
+        return self.runTimes[run + 1] - self.runTimes[run]
+
+    def routeTime(self, route : list[tuple[int, int]], startDirection : Direction) -> float:
+        # Time to drive route, starting in its first cell facing startDirection
+        elapsed = 0.0
+        direction = startDirection
+        run = 0
+        for index in range(len(route) - 1):
+            newDirection = Direction.fromVector((route[index + 1][0] - route[index][0], route[index + 1][1] - route[index][1]))
+            if newDirection != direction:
+                elapsed += self.turnTime * len(direction.turnsTo(newDirection))
+                direction = newDirection
+                run = 0
+            elapsed += self.extendRun(run)
+            run += 1
+        return elapsed
+
+
 # Class for storing and displaying maze data
 # As well as calculating the shortest path
 # And active updating based on cells detected
 class Maze:
     # Cell states
-    def __init__(self) -> None:
-        self.cells = [[0 for _ in range (16)] for _ in range(16)]
+    def __init__(self, display : Display | None = None, width : int = 16, height : int = 16) -> None:
+        self.width = width
+        self.height = height
+        self.display = display if display is not None else Display(width, height)
+
+        # Cells whose walls changed since the last flood fill, and the goal
+        # that flood fill was for, used to repair the flood incrementally
+        self.changedCells : set[tuple[int, int]] = set()
+        self.floodGoal : list[tuple[int, int]] | None = None
+        # Bumped whenever a wall is added, so floods filled since then can be reused
+        # by goal and version, most recently used last
+        self.wallVersion = 0
+        self.floodCache : OrderedDict[tuple[frozenset[tuple[int, int]], int], list[list[int]]] = OrderedDict()
+
+        self.neighbours = neighbourTable(width, height)
+        self.cells = [[0] * height for _ in range(width)]
 
         # Add edges of maze
-        for x in range(16):
+        for x in range(width):
             self.addWall(x, 0, Direction.SOUTH)
-            self.addWall(x, 15, Direction.NORTH)
+            self.addWall(x, height - 1, Direction.NORTH)
 
-        for y in range(16):
+        for y in range(height):
             self.addWall(0, y, Direction.WEST)
-            self.addWall(15, y, Direction.EAST)
+            self.addWall(width - 1, y, Direction.EAST)
 
-        self.flood = [[-1 for _ in range (16)] for _ in range(16)]
+        self.flood = [[-1] * height for _ in range(width)]
 
-        self.explored = [[False for _ in range (16)] for _ in range(16)]
+        self.explored = [[False] * height for _ in range(width)]
         self.explored[0][0] = True
 
-    def recalculate(self, goal : list[tuple[int, int]], updateDisplay : bool = True) -> None:
+    @INSTRUMENTS.timed("recalculate")
+    def recalculate(self, goal : list[tuple[int, int]], updateDisplay : bool = True, incremental : bool = True) -> None:
+        key = (frozenset(goal), self.wallVersion)
+        cached = self.floodCache.get(key) if incremental else None
+        if cached is not None:
+            # Filled for this goal since the last wall was added
+            self.floodCache.move_to_end(key)
+            if cached is not self.flood:
+                self.flood = cached
+        else:
+            if incremental and self.floodGoal == goal:
+                if self.changedCells:
+                    self.repairFlood()
+                # Otherwise nothing changed since the last solve, flood is still correct
+            else:
+                self.fullFlood(goal)
+
+            # Repairs write over the flood in place, but only once a wall has been
+            # added, so never one cached for the current version
+            self.floodCache[key] = self.flood
+            if len(self.floodCache) > FLOOD_CACHE_SIZE:
+                self.floodCache.popitem(last=False)
+
+        self.floodGoal = list(goal)
+        self.changedCells.clear()
+
+        if updateDisplay:
+            self.updateDisplay()
+
+    def fullFlood(self, goal : list[tuple[int, int]]) -> None:
         # Flood fill
-        self.flood = [[-1 for _ in range (16)] for _ in range(16)]
+        self.flood = [[-1] * self.height for _ in range(self.width)]
 
         for point in goal:
             self.flood[point[0]][point[1]] = 0
 
         # Set initial search points
-        search = goal.copy()
-        while (True):
+        search = deque(goal)
+        neighbours = self.neighbours
+        cells = self.cells
+        flood = self.flood
+        while search:
             # Get next search point
-            if len(search) == 0:
-                break
-            x, y = search.pop(0)
+            x, y = search.popleft()
 
-            # Get current distance
-            distance = self.flood[x][y]
+            # Get new distance
+            distance = flood[x][y] + 1
 
             # Check in free directions
-            for direction in Cell.getClearDirections(self.cells[x][y]):
-                # Get vector
-                dx, dy = direction.vector
-
-                # Get new position
-                nx = x + dx
-                ny = y + dy
-
-                # Check if in bounds
-                if nx < 0 or nx >= 16 or ny < 0 or ny >= 16:
-                    continue
-
+            for _, nx, ny in neighbours[x][y][cells[x][y]]:
                 # Check if already visited
-                if self.flood[nx][ny] != -1:
+                if flood[nx][ny] != -1:
                     continue
 
                 # Set distance
-                self.flood[nx][ny] = distance + 1
+                flood[nx][ny] = distance
 
                 # Add to search
                 search.append((nx, ny))
 
-        if updateDisplay:
-            self.updateDisplay()
+    def repairFlood(self) -> None:
+        # Walls are only ever added, so distances can only grow. Only cells that
+        # lost every neighbour one step closer to the goal need to be resolved again
+        flood = self.flood
+
+        # Any cell next to a changed cell may have lost the edge it was reached through
+        search = []
+        for x, y in self.changedCells:
+            for dx, dy in [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)]:
+                nx, ny = x + dx, y + dy
+                if nx < 0 or nx >= self.width or ny < 0 or ny >= self.height:
+                    continue
+                if flood[nx][ny] > 0:
+                    search.append((flood[nx][ny], nx, ny))
+        heapq.heapify(search)
+
+        # Find invalidated cells, closest first so a cell's parents are always settled before it
+        checked = set()
+        invalid = set()
+        while search:
+            distance, x, y = heapq.heappop(search)
+            if (x, y) in checked:
+                continue
+            checked.add((x, y))
+
+            if any(flood[px][py] == distance - 1 and (px, py) not in invalid for px, py in self.getOpenParents(x, y)):
+                continue
+
+            invalid.add((x, y))
+            for nx, ny in self.getOpenNeighbours(x, y):
+                if flood[nx][ny] == distance + 1:
+                    heapq.heappush(search, (distance + 1, nx, ny))
+
+        if not invalid:
+            return
+
+        # Resolve invalidated cells from the cells around them that kept their distance
+        for x, y in invalid:
+            flood[x][y] = -1
+
+        for x, y in invalid:
+            parentDistances = [flood[px][py] for px, py in self.getOpenParents(x, y) if flood[px][py] != -1]
+            if parentDistances:
+                search.append((min(parentDistances) + 1, x, y))
+        heapq.heapify(search)
+
+        while search:
+            distance, x, y = heapq.heappop(search)
+            if flood[x][y] != -1:
+                continue
+            flood[x][y] = distance
+
+            for nx, ny in self.getOpenNeighbours(x, y):
+                if flood[nx][ny] == -1 and (nx, ny) in invalid:
+                    heapq.heappush(search, (distance + 1, nx, ny))
+
+    def getOpenNeighbours(self, x : int, y : int) -> list[tuple[int, int]]:
+        # Cells that can be reached from (x, y)
+        return [(nx, ny) for _, nx, ny in self.neighbours[x][y][self.cells[x][y]]]
+
+    def getOpenParents(self, x : int, y : int) -> list[tuple[int, int]]:
+        # Cells that (x, y) can be reached from, the flood fill moves along the
+        # clear directions of the cell it comes from
+        return [
+            (px, py) for direction, px, py in self.neighbours[x][y][0]
+            if not self.cells[px][py] & WALL_BITS[direction.opposite.value]
+        ]
 
     def blockUnexplored(self) -> None:
-        for x in range(16):
-            for y in range(16):
+        for x in range(self.width):
+            for y in range(self.height):
                 if not self.explored[x][y]:
                     # Check if all cells around it are explored
                     allNeighboursExplored = True
                     for direction in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
                         nx, ny = x + direction[0], y + direction[1]
-                        if nx < 0 or nx >= 16 or ny < 0 or ny >= 16:
+                        if nx < 0 or nx >= self.width or ny < 0 or ny >= self.height:
                             continue
 
                         if not self.getExplored(nx, ny):
@@ -313,15 +535,18 @@ class Maze:
                     
                     if not allNeighboursExplored:
                         self.cells[x][y] = 15
+                        self.changedCells.add((x, y))
+                        self.wallVersion += 1
 
                     self.setExplored(x, y)
         self.updateDisplay()
 
-    def calculateBestRoutes(self, start : tuple[int, int], startDirection : Direction, goal : list[tuple[int, int]], tryCalcuateAlternatives : bool = False) -> list[Route]:
+    def calculateBestRoutes(self, start : tuple[int, int], startDirection : Direction, goal : list[tuple[int, int]], tryCalcuateAlternatives : bool = False, maxRoutes : int = 16, workers : int = 1) -> list[Path]:
         self.recalculate(goal, updateDisplay=False)
         
         bestRoutes = []
-        stack = [(start, startDirection, Route([start]))]
+        stack = [(start, startDirection, Path([start]))]
+        width, height = self.width, self.height
 
         while stack:
             current, currentDirection, route = stack.pop()
@@ -332,27 +557,28 @@ class Maze:
 
             x, y = current
             # time.sleep(0.1)
-            api.clearAllColor()
-            api.setColor(x, y, "g")
+            self.display.clearAllColor()
+            self.display.setColor(x, y, "g")
 
             mustCopyRoute = False
-            clearDirections = Cell.getClearDirections(self.cells[x][y])
-            for directionToCheck in Mouse.ORDER_TO_CHECK:
-                possibleNewDirection = Direction.fromMouseDirection(currentDirection, directionToCheck)
-                if possibleNewDirection not in clearDirections:
+            currentCell = self.cells[x][y]
+            for possibleNewDirection in DIRECTIONS_TO_CHECK[currentDirection.value]:
+                if currentCell & WALL_BITS[possibleNewDirection.value]:
                     continue
 
-                dx, dy = possibleNewDirection.vector
+                dx, dy = DIRECTION_VECTORS[possibleNewDirection.value]
                 nx = x + dx
                 ny = y + dy
-                if (nx < 0 or nx >= 16 or ny < 0 or ny >= 16):
+                if (nx < 0 or nx >= width or ny < 0 or ny >= height):
                     continue
 
                 if not self.getExplored(nx, ny):
                     # Check if all cells around it are explored
                     allNeighboursExplored = True
                     for direction in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                        if not self.getExplored(nx + direction[0], ny + direction[1]):
+                        # Outside the maze there is nothing left to explore
+                        ex, ey = nx + direction[0], ny + direction[1]
+                        if 0 <= ex < width and 0 <= ey < height and not self.getExplored(ex, ey):
                             allNeighboursExplored = False
                     
                     if not allNeighboursExplored:
@@ -360,48 +586,253 @@ class Maze:
 
                     self.setExplored(nx, ny)
 
-                api.setColor(nx, ny, "y")
+                self.display.setColor(nx, ny, "y")
                 if (self.flood[nx][ny] == self.flood[x][y] - 1):
                     if mustCopyRoute:
                         route = route.copy()
                     mustCopyRoute = True
                     route.append((nx, ny))
                     stack.append(((nx, ny), possibleNewDirection, route))
-                    api.setColor(nx, ny, "g")
+                    self.display.setColor(nx, ny, "g")
 
                     break
         
-        # Save maze cells to bring back after
-        if tryCalcuateAlternatives:
-            for route in bestRoutes[:]:
-                for index in range(len(route) - 1):
-                    testingMaze = Maze()
-                    testingMaze.cells = copy.deepcopy(self.cells)
-                    testingMaze.explored = copy.deepcopy(self.explored)
-                    
-                    x, y = route[index]
-                    dx, dy = route[index + 1][0] - x, route[index + 1][1] - y
-
-                    testingMaze.addWall(x, y, Direction.fromVector((dx, dy)))
-                    try:
-                        otherBestRoutes = testingMaze.calculateBestRoutes(start, startDirection, goal, False)
-                        bestRoutes.extend(otherBestRoutes)
-                    except:
-                        continue
-            
-            log(f"Had len(bestRoutes) = {len(bestRoutes)}")
-            bestRoutes = list(set(bestRoutes))
-            log(f"Now len(bestRoutes) = {len(bestRoutes)}")
+        if tryCalcuateAlternatives and bestRoutes:
+            bestRoutes = self.kShortestRoutes(start, goal, maxRoutes, bestRoutes[0], workers)
+            log(f"Found {len(bestRoutes)} routes")
 
+        return bestRoutes
 
 
 
-        return bestRoutes
+        # Find best route, when reaches a branch find both route from there, using depth first search approach
 
 
+    def kShortestRoutes(self, start : tuple[int, int], goal : list[tuple[int, int]], k : int, firstRoute : Path | None = None, workers : int = 1) -> list[Path]:
+        # Yen's algorithm, the k shortest loopless routes from start to the goal,
+        # shortest first and ties with fewer turns first. Each new route branches off
+        # one already found at some cell (the spur), with the moves other routes took
+        # from the same prefix ruled out. Nothing is copied, each spur search just
+        # skips the ruled out moves and cells, guided by the flood distances.
+        # With more than one worker the spur searches of each round are split over a
+        # process pool, the result is the same as with one
+        self.recalculate(goal, updateDisplay=False)
+        goalCells = set(goal)
+        passable = self.passableCells()
+
+        # Routes are worked on as tuples of cells, only the ones returned become Paths
+        firstCells = tuple(firstRoute) if firstRoute is not None else self.shortestRouteAvoiding(start, goalCells, set(), set(), passable, math.inf)
+        if firstCells is None:
+            return []
+
+        def rank(route : tuple[tuple[int, int], ...]) -> tuple[int, int, tuple[tuple[int, int], ...]]:
+            return (len(route), countTurns(route), route)
+
+        pool = ProcessPoolExecutor(workers) if workers > 1 else None
+        state = self.packState(passable) if pool is not None else b""
+
+        found = [firstCells]
+        candidates : list[tuple[int, int, tuple[tuple[int, int], ...]]] = []
+        seen = {firstCells}
+        try:
+            while len(found) < k:
+                previous = found[-1]
+                # A candidate longer than the worst one that could still be picked can be skipped
+                stillNeeded = k - len(found)
+                longest = heapq.nsmallest(stillNeeded, candidates)[-1][0] if len(candidates) >= stillNeeded else math.inf
+
+                spurs = len(previous) - 1
+                if pool is None:
+                    routes = self.spurRoutes(found, 0, spurs, goalCells, passable, longest)
+                else:
+                    # Later spurs have shorter searches, so there are a few chunks per worker to even out the load
+                    size = max(1, -(-spurs // (workers * 4)))
+                    chunks = [(state, found, first, min(first + size, spurs), goal, longest) for first in range(0, spurs, size)]
+                    routes = [route for chunk in pool.map(_spurRoutesWorker, chunks) for route in chunk]
 
-        # Find best route, when reaches a branch find both route from there, using depth first search approach
+                for route in routes:
+                    if route in seen:
+                        continue
+                    seen.add(route)
+                    heapq.heappush(candidates, rank(route))
+
+                if not candidates:
+                    break
+                found.append(heapq.heappop(candidates)[2])
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        return [Path(route) for route in found]
+
+    def spurRoutes(self, found : list[tuple[tuple[int, int], ...]], first : int, last : int, goal : set[tuple[int, int]], passable : list[list[bool]], longest : float) -> list[tuple[tuple[int, int], ...]]:
+        # The routes branching off the newest found route at each spur index from first
+        # up to last, see kShortestRoutes
+        previous = found[-1]
+        # Routes sharing previous up to the spur, narrowed as the spur moves along
+        sharing = [route for route in found if route[:first] == previous[:first]]
+        removedCells = set(previous[:first])
+        routes = []
+        for index in range(first, last):
+            spur = previous[index]
+            sharing = [route for route in sharing if len(route) > index + 1 and route[index] == spur]
+            removedMoves = {(spur, route[index + 1]) for route in sharing}
+
+            spurRoute = self.shortestRouteAvoiding(spur, goal, removedMoves, removedCells, passable, longest - index)
+            removedCells.add(spur)
+            if spurRoute is not None:
+                routes.append(previous[:index] + spurRoute)
+        return routes
+
+    def shortestRouteAvoiding(self, start : tuple[int, int], goal : set[tuple[int, int]], removedMoves : set[tuple[tuple[int, int], tuple[int, int]]], removedCells : set[tuple[int, int]], passable : list[list[bool]], maxLength : float) -> tuple[tuple[int, int], ...] | None:
+        # A* from start to the closest goal cell without the removed moves and cells,
+        # or None if there is no route of at most maxLength cells. Walls only ever
+        # block moves, so the flood distance is a lower bound on the remaining length
+        flood = self.flood
+        cells = self.cells
+        neighbours = self.neighbours
+
+        sx, sy = start
+        if flood[sx][sy] == -1 or flood[sx][sy] + 1 > maxLength:
+            return None
+
+        parents : dict[tuple[int, int], tuple[int, int] | None] = {start : None}
+        lengths = {start : 1}
+        # Ties go to the longest route so far, which heads straight down the flood
+        search = [(flood[sx][sy] + 1, -1, start)]
+        while search:
+            estimate, negativeLength, current = heapq.heappop(search)
+            if -negativeLength != lengths[current]:
+                continue
+            if current in goal:
+                backwards = []
+                node : tuple[int, int] | None = current
+                while node is not None:
+                    backwards.append(node)
+                    node = parents[node]
+                return tuple(reversed(backwards))
 
+            x, y = current
+            length = lengths[current] + 1
+            for _, nx, ny in neighbours[x][y][cells[x][y]]:
+                neighbour = (nx, ny)
+                if flood[nx][ny] == -1 or not passable[nx][ny] or neighbour in removedCells or (current, neighbour) in removedMoves:
+                    continue
+                if length + flood[nx][ny] > maxLength or length >= lengths.get(neighbour, length + 1):
+                    continue
+                lengths[neighbour] = length
+                parents[neighbour] = current
+                heapq.heappush(search, (length + flood[nx][ny], -length, neighbour))
+        return None
+
+    def fastestRoute(self, start : tuple[int, int], startDirection : Direction, goal : list[tuple[int, int]], model : DriveModel | None = None) -> Path | None:
+        # The quickest route to drive from start to the goal under model, found in one
+        # A* search over (cell, heading, straight run length) instead of listing every
+        # shortest route and ranking them. Runs are counted up to model.longestRun,
+        # past that every cell costs the same. The flood distance at top speed is
+        # the heuristic, so the search heads for the goal first
+        model = model if model is not None else DriveModel()
+        self.recalculate(goal, updateDisplay=False)
+        goalCells = set(goal)
+        passable = self.passableCells()
+        flood = self.flood
+        cells = self.cells
+        neighbours = self.neighbours
+        cellTime = 1 / model.topSpeed
+        turnTimes = [[model.turnTime * len(TURNS[fromValue][toValue]) for toValue in range(4)] for fromValue in range(4)]
+
+        sx, sy = start
+        if flood[sx][sy] == -1:
+            return None
+
+        # State = (x, y, heading, run). A run's time already includes braking at its
+        # end, so times add up one cell at a time
+        startState = (sx, sy, startDirection.value, 0)
+        times = {startState : 0.0}
+        parents : dict[tuple[int, int, int, int], tuple[int, int, int, int] | None] = {startState : None}
+        search = [(flood[sx][sy] * cellTime, startState)]
+        while search:
+            estimate, state = heapq.heappop(search)
+            x, y, heading, run = state
+            elapsed = times[state]
+            if estimate > elapsed + flood[x][y] * cellTime + 1e-12:
+                continue
+
+            if (x, y) in goalCells:
+                backwards = []
+                node : tuple[int, int, int, int] | None = state
+                while node is not None:
+                    backwards.append((node[0], node[1]))
+                    node = parents[node]
+                return Path(reversed(backwards))
+
+            for direction, nx, ny in neighbours[x][y][cells[x][y]]:
+                if flood[nx][ny] == -1 or not passable[nx][ny]:
+                    continue
+                if direction.value == heading:
+                    newRun = min(run + 1, model.longestRun)
+                    newTime = elapsed + model.extendRun(run)
+                else:
+                    newRun = 1
+                    newTime = elapsed + turnTimes[heading][direction.value] + model.extendRun(0)
+                newState = (nx, ny, direction.value, newRun)
+                if newTime < times.get(newState, math.inf):
+                    times[newState] = newTime
+                    parents[newState] = state
+                    heapq.heappush(search, (newTime + flood[nx][ny] * cellTime, newState))
+        return None
+
+    def packState(self, passable : list[list[bool]]) -> bytes:
+        # What a spur search needs, sent to worker processes as one bytes object:
+        # width and height, then cells (uint8), flood (int32) and passable (bool) x major
+        return (
+            struct.pack("<HH", self.width, self.height)
+            + np.asarray(self.cells, dtype=np.uint8).tobytes()
+            + np.asarray(self.flood, dtype=np.int32).tobytes()
+            + np.asarray(passable, dtype=bool).tobytes()
+        )
+
+    @classmethod
+    def unpackState(cls, state : bytes) -> tuple["Maze", list[list[bool]]]:
+        width, height = struct.unpack_from("<HH", state)
+        size = width * height
+        maze = cls(None, width, height)
+        maze.cells = np.frombuffer(state, dtype=np.uint8, count=size, offset=4).reshape(width, height).tolist()
+        maze.flood = np.frombuffer(state, dtype=np.int32, count=size, offset=4 + size).reshape(width, height).tolist()
+        passable = np.frombuffer(state, dtype=bool, count=size, offset=4 + 5 * size).reshape(width, height).tolist()
+        return maze, passable
+
+    def loadSnapshot(self, snapshot : Snapshot) -> None:
+        # Walls and explored cells from the snapshot. Its flood, if it has one,
+        # stands in for the next recalculate to the same goal
+        self.cells = snapshot.cells.tolist()
+        self.explored = snapshot.explored.tolist()
+        self.changedCells.clear()
+        self.wallVersion += 1
+        self.floodGoal = None
+        if snapshot.flood is not None:
+            self.flood = snapshot.flood.tolist()
+            self.floodGoal = snapshot.goal
+
+    def saveSnapshot(self, filename : str, routes : list[Path] | None = None) -> None:
+        # The flood is only saved while it is up to date with the walls
+        flood, goal = (self.flood, self.floodGoal) if self.floodGoal is not None and not self.changedCells else (None, [])
+        writeSnapshot(filename, self.cells, self.explored, flood, goal, routes or [])
+
+    def passableCells(self) -> list[list[bool]]:
+        # Cells a route may use, the explored ones and those whose neighbours all are
+        width, height = self.width, self.height
+        explored = self.explored
+        return [
+            [
+                bool(explored[x][y]) or all(
+                    explored[nx][ny] for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+                    if 0 <= nx < width and 0 <= ny < height
+                )
+                for y in range(height)
+            ]
+            for x in range(width)
+        ]
 
     def setExplored(self, x : int, y : int) -> None:
         self.explored[x][y] = True
@@ -413,56 +844,223 @@ class Maze:
         # Get cell
         cell = self.cells[x][y]
         # Edit cell
-        cell = Cell.addWall(cell, direction)
-        self.cells[x][y] = cell
+        newCell = Cell.addWall(cell, direction)
+        if newCell != cell:
+            self.cells[x][y] = newCell
+            self.changedCells.add((x, y))
+            self.wallVersion += 1
 
 
         # Edit neighbor
         dx, dy = direction.vector
         nx = x + dx
         ny = y + dy
-        if nx < 0 or nx >= 16 or ny < 0 or ny >= 16:
+        if nx < 0 or nx >= self.width or ny < 0 or ny >= self.height:
             # Neighbour not in bounds
             return
 
         neighbor = self.cells[nx][ny]
-        neighbor = Cell.addWall(neighbor, direction.opposite)
-        self.cells[nx][ny] = neighbor
+        newNeighbor = Cell.addWall(neighbor, direction.opposite)
+        if newNeighbor != neighbor:
+            self.cells[nx][ny] = newNeighbor
+            self.changedCells.add((nx, ny))
+            self.wallVersion += 1
 
 
+    @INSTRUMENTS.timed("updateDisplay")
     def updateDisplay(self) -> None:
-        # Draw maze
-        for x in range(16):
-            for y in range(16):
-                # Get distance
-                distance = self.flood[x][y]
-
-                # Check if visited
-                if distance == -1:
-                    api.setText(x, y, "X")
-                    raise Exception("Flood fill algorithm did not complete maze")
-                else:
-                    api.setText(x, y, str(distance))
-
-        for x in range(16):
-            for y in range(16):
-                # Get cell
-                cell = self.cells[x][y]
-
-                # Check if visited
-                clearDirections = Cell.getClearDirections(cell)
-                if Direction.NORTH not in clearDirections:
-                    api.setWall(x, y, "n")
-                if Direction.EAST not in clearDirections:
-                    api.setWall(x, y, "e")
-                if Direction.SOUTH not in clearDirections:
-                    api.setWall(x, y, "s")
-                if Direction.WEST not in clearDirections:
-                    api.setWall(x, y, "w")
+        # Draw maze, the display only sends what changed since it was last flushed
+        self.display.showGrids(self.flood, self.cells, self.explored)
 
-                if not self.explored[x][y]:
-                    api.setColor(x, y, "r")
+        if any(-1 in row for row in self.flood):
+            raise Exception("Flood fill algorithm did not complete maze")
         
+
+# Maze backend keeping walls and distances in numpy arrays, the flood fill
+# expands a whole frontier per step with array masks instead of cell by cell.
+# Each step costs the same dozen array operations however few cells it reaches,
+# so it only beats the list BFS on large open mazes, where there are many cells
+# per step. It is slower on 16x16 mazes and on winding ones of any size, and it
+# fills again from scratch rather than repairing the flood
+class NumpyMaze(Maze):
+    @property # type: ignore[override]
+    def cells(self) -> np.ndarray:
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells : list[list[int]] | np.ndarray) -> None:
+        self._cells = np.array(cells, dtype=np.uint8)
+
+    @property # type: ignore[override]
+    def flood(self) -> np.ndarray:
+        return self._flood
+
+    @flood.setter
+    def flood(self, flood : list[list[int]] | np.ndarray) -> None:
+        self._flood = np.array(flood, dtype=np.int32)
+
+    @property # type: ignore[override]
+    def explored(self) -> np.ndarray:
+        return self._explored
+
+    @explored.setter
+    def explored(self, explored : list[list[bool]] | np.ndarray) -> None:
+        self._explored = np.array(explored, dtype=bool)
+
+    def loadSnapshot(self, snapshot : Snapshot) -> None:
+        # As Maze.loadSnapshot, straight from the snapshot's arrays without going through lists
+        self.cells = snapshot.cells
+        self.explored = snapshot.explored
+        self.changedCells.clear()
+        self.wallVersion += 1
+        self.floodGoal = None
+        if snapshot.flood is not None:
+            self.flood = snapshot.flood
+            self.floodGoal = snapshot.goal
+
+    def fullFlood(self, goal : list[tuple[int, int]]) -> None:
+        # Works on the grids flattened x major, so north and south are shifts of
+        # one and east and west shifts of a column. The walls round the edge
+        # stop a shift carrying on into the next column
+        width, height = self._cells.shape
+        cells = self._cells.reshape(-1)
+        size = cells.size
+        openNorth = (cells & WALL_BITS[Direction.NORTH.value]) == 0
+        openSouth = (cells & WALL_BITS[Direction.SOUTH.value]) == 0
+        openEast = (cells & WALL_BITS[Direction.EAST.value]) == 0
+        openWest = (cells & WALL_BITS[Direction.WEST.value]) == 0
+
+        flood = np.full(size, -1, dtype=np.int32)
+        frontier = np.zeros(size, dtype=bool)
+        for x, y in goal:
+            frontier[x * height + y] = True
+        flood[frontier] = 0
+        unvisited = ~frontier
+
+        # Every step writes into these, nothing is allocated per level
+        reached = np.empty_like(frontier)
+        moved = np.empty_like(frontier)
+        distance = 0
+        while True:
+            np.logical_and(frontier[:-1], openNorth[:-1], out=reached[1:])
+            reached[0] = False
+            np.logical_and(frontier[1:], openSouth[1:], out=moved[:-1])
+            np.logical_or(reached[:-1], moved[:-1], out=reached[:-1])
+            np.logical_and(frontier[:-height], openEast[:-height], out=moved[height:])
+            np.logical_or(reached[height:], moved[height:], out=reached[height:])
+            np.logical_and(frontier[height:], openWest[height:], out=moved[:-height])
+            np.logical_or(reached[:-height], moved[:-height], out=reached[:-height])
+            np.logical_and(reached, unvisited, out=reached)
+            if not reached.any():
+                break
+
+            distance += 1
+            flood[reached] = distance
+            np.logical_xor(unvisited, reached, out=unvisited)
+            frontier, reached = reached, frontier
+
+        self._flood = flood.reshape(width, height)
+
+    def repairFlood(self) -> None:
+        # A whole vectorised solve is cheaper than repairing cell by cell through numpy scalars
+        assert self.floodGoal is not None
+        self.fullFlood(self.floodGoal)
+
+
+# A what-if view of a list based Maze, for trying out walls or explored cells
+# without touching the maze. Its cells and explored grids start as lists of the
+# base's columns, and a column is only copied when the overlay first changes it,
+# so making or dropping an overlay costs a few references. The flood is shared
+# until the overlay recalculates. Overlays can be stacked, and the base must not
+# change while an overlay on it is in use
+class MazeOverlay(Maze):
+    def __init__(self, base : Maze) -> None:
+        if isinstance(base, NumpyMaze):
+            raise TypeError("Overlays need a list based Maze")
+        self.base = base
+        self.width = base.width
+        self.height = base.height
+        self.neighbours = base.neighbours
+
+        self.cells = list(base.cells)
+        self.explored = list(base.explored)
+        self.flood = base.flood
+        # Only an up to date flood can be repaired from
+        self.floodGoal = base.floodGoal if not base.changedCells else None
+        self.changedCells = set()
+        # The base's floods hold until the overlay adds a wall
+        self.wallVersion = base.wallVersion
+        self.floodCache = OrderedDict(base.floodCache)
+
+        # Columns this overlay has its own copies of, and the flood it last filled
+        self.ownCells : set[int] = set()
+        self.ownExplored : set[int] = set()
+        self.ownFlood : list[list[int]] | None = None
+        # A what-if must not show up on the mouse's display, so an overlay draws on
+        # its own. Most overlays never draw, so it is only made by the drawing calls
+        self._display : Display | None = None
+
+    def ownDisplay(self) -> None:
+        if self._display is None:
+            self._display = self.display = Display(self.width, self.height)
+
+    def updateDisplay(self) -> None:
+        self.ownDisplay()
+        super().updateDisplay()
+
+    def calculateBestRoutes(self, start : tuple[int, int], startDirection : Direction, goal : list[tuple[int, int]], tryCalcuateAlternatives : bool = False, maxRoutes : int = 16, workers : int = 1) -> list[Path]:
+        self.ownDisplay()
+        return super().calculateBestRoutes(start, startDirection, goal, tryCalcuateAlternatives, maxRoutes, workers)
+
+    def ownCellsColumn(self, x : int) -> None:
+        if x not in self.ownCells and 0 <= x < self.width:
+            self.cells[x] = self.cells[x].copy()
+            self.ownCells.add(x)
+
+    def addWall(self, x : int, y : int, direction : Direction) -> None:
+        # The wall is added on both sides, and the neighbour may be in the next column
+        self.ownCellsColumn(x)
+        self.ownCellsColumn(x + direction.vector[0])
+        super().addWall(x, y, direction)
+
+    def setExplored(self, x : int, y : int) -> None:
+        if x not in self.ownExplored:
+            self.explored[x] = self.explored[x].copy()
+            self.ownExplored.add(x)
+        super().setExplored(x, y)
+
+    def blockUnexplored(self) -> None:
+        for x in range(self.width):
+            if not all(self.explored[x]):
+                self.ownCellsColumn(x)
+        super().blockUnexplored()
+
+    def fullFlood(self, goal : list[tuple[int, int]]) -> None:
+        # Fills a new flood, the shared one is left alone
+        super().fullFlood(goal)
+        self.ownFlood = self.flood
+
+    def repairFlood(self) -> None:
+        # Repairs in place, so a flood shared with the base, or taken back from
+        # the cache, is copied first
+        if self.flood is not self.ownFlood:
+            self.flood = [column.copy() for column in self.flood]
+            self.ownFlood = self.flood
+        super().repairFlood()
+
+
+# The maze a worker process last unpacked, kept while the state it came from is unchanged
+_workerState : tuple[bytes, Maze, list[list[bool]]] | None = None
+
+def _spurRoutesWorker(task : tuple[bytes, list[tuple[tuple[int, int], ...]], int, int, list[tuple[int, int]], float]) -> list[tuple[tuple[int, int], ...]]:
+    global _workerState
+    state, found, first, last, goal, longest = task
+    if _workerState is None or _workerState[0] != state:
+        _workerState = (state, *Maze.unpackState(state))
+    _, maze, passable = _workerState
+    return maze.spurRoutes(found, first, last, set(goal), passable, longest)
+
+
 def main() -> None:
     mouse = Mouse()
     # mouse.loadMaze("maze.json")
@@ -1,7 +1,14 @@
+import contextlib
+import functools
 import json
+import math
+import os
+import struct
 import sys
+import time
+from json.encoder import encode_basestring_ascii  # type: ignore[attr-defined]
 from enum import Enum
-from typing import Any, TYPE_CHECKING
+from typing import Any, Callable, Iterator, TextIO, TypeVar, TYPE_CHECKING
 
 import numpy as np
 
@@ -9,6 +16,122 @@ if TYPE_CHECKING:
     from route import Route
 
 
+class Histogram:
+    # Durations in nanoseconds, counted in power of two buckets. Bucket i holds
+    # durations whose bit length is i, so [2^(i-1), 2^i)
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, nanoseconds: int) -> None:
+        self.buckets[nanoseconds.bit_length()] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def percentile(self, fraction: float) -> int:
+        # Upper bound of the bucket holding that fraction of the durations, at most the largest seen
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= wanted:
+                return min((1 << index) - 1, self.max)
+        return self.max
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "count" : self.count,
+            "mean_us" : self.total / self.count / 1000 if self.count else 0.0,
+            "p50_us" : self.percentile(0.5) / 1000,
+            "p99_us" : self.percentile(0.99) / 1000,
+            "max_us" : self.max / 1000,
+            "buckets" : {str(1 << index) : count for index, count in enumerate(self.buckets) if count},
+        }
+
+
+Function = TypeVar("Function", bound=Callable[..., Any])
+
+class Instruments:
+    # Named spans timed into histograms, and counters. Disabled, timed hands the
+    # function back undecorated and span is a shared empty context, so nothing is
+    # measured and nothing is paid. Decorators are applied at import, so enabling
+    # is decided by MOUSE_INSTRUMENTS=1 in the environment before the run starts
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.spans: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        self._disabledSpan = contextlib.nullcontext()
+
+    def timed(self, name: str) -> Callable[[Function], Function]:
+        def decorate(function: Function) -> Function:
+            if not self.enabled:
+                return function
+            histogram = self.spans.setdefault(name, Histogram())
+            clock = time.perf_counter_ns
+
+            @functools.wraps(function)
+            def timedFunction(*args: Any, **kwargs: Any) -> Any:
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    histogram.add(clock() - start)
+            return timedFunction  # type: ignore[return-value]
+        return decorate
+
+    def span(self, name: str) -> contextlib.AbstractContextManager[None]:
+        # For timing a block rather than a whole function
+        if not self.enabled:
+            return self._disabledSpan
+        return self._span(self.spans.setdefault(name, Histogram()))
+
+    @contextlib.contextmanager
+    def _span(self, histogram: Histogram) -> Iterator[None]:
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            histogram.add(time.perf_counter_ns() - start)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self) -> None:
+        for name in self.spans:
+            self.spans[name] = Histogram()
+        self.counters.clear()
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "spans" : {name : histogram.summary() for name, histogram in self.spans.items() if histogram.count},
+            "counters" : dict(self.counters),
+        }
+
+    def report(self) -> str:
+        lines = [f"{'span':<24}{'count':>9}{'mean us':>11}{'p50 us':>11}{'p99 us':>11}{'max us':>11}"]
+        for name, span in self.summary()["spans"].items():
+            lines.append(f"{name:<24}{span['count']:>9}{span['mean_us']:>11.1f}{span['p50_us']:>11.1f}{span['p99_us']:>11.1f}{span['max_us']:>11.1f}")
+        for name, value in self.counters.items():
+            lines.append(f"{name:<24}{value:>9}")
+        return "\n".join(lines)
+
+    def dump(self, stream: TextIO | None = None) -> None:
+        # stdout carries the protocol, so the report goes to stderr by default,
+        # looked up when called so redirecting stderr catches it
+        if stream is None:
+            stream = sys.stderr
+        stream.write(self.report() + "\n")
+        stream.flush()
+
+INSTRUMENTS = Instruments(os.environ.get("MOUSE_INSTRUMENTS") == "1")
+
+
 class MouseCrashedError(Exception):
     pass
 
@@ -20,16 +143,90 @@ class PythonActionType(Enum):
     DEBUG = 3
     TERMINATE = 4
     DISPLAY_ROUTE = 5
+    SET_WALL = 6
+    SET_COLOR = 7
+    CLEAR_ALL_COLOR = 8
+
+class Framing(Enum):
+    # Line delimited nested JSON, what the host expects unless it asks otherwise
+    JSON = 0
+    # Length prefixed struct packed actions, see Actions.encodeBinary
+    BINARY = 1
 
 class PythonAction:
-    def __init__(self, actionType : PythonActionType, jsonBody : str) -> None:
+    def __init__(self, actionType : PythonActionType, jsonBody : str | None = None, values : tuple[Any, ...] = ()) -> None:
+        # Fixed shape actions keep their values and are encoded from a template,
+        # everything else keeps its already encoded body
         self.actionType = actionType.value
         self.jsonBody = jsonBody
+        self.values = values
+
+def _encodeValue(value : Any) -> str:
+    # Same text json.dumps gives for a number or bool, which needs no escaping
+    # however deeply it is nested inside JSON strings
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if type(value) is int:
+        return int.__repr__(value)
+    if isinstance(value, float) and math.isfinite(value):
+        return float.__repr__(value)
+    return json.dumps(value)
+
+def _escape(text : str) -> str:
+    # Contents of text encoded as a JSON string, without the surrounding quotes
+    return encode_basestring_ascii(text)[1:-1]
+
+class ActionTemplate:
+    # An action as it appears in the JSON line, split around its values, so it can
+    # be written in one pass instead of encoding the body, action and line separately
+    def __init__(self, actionType : PythonActionType, fields : tuple[str, ...], binaryFormat : str) -> None:
+        self.fields = fields
+        sentinels = [str(987654321 + index) for index in range(len(fields))]
+        body = json.dumps({field : int(sentinel) for field, sentinel in zip(fields, sentinels)})
+        encoded = json.dumps(json.dumps({"actionType" : actionType.value, "jsonBody" : body}))
+
+        self.pieces : list[str] = []
+        for sentinel in sentinels:
+            piece, encoded = encoded.split(sentinel)
+            self.pieces.append(piece)
+        self.pieces.append(encoded)
+
+        self.binary = struct.Struct("<B" + binaryFormat)
+
+    def encode(self, values : tuple[Any, ...]) -> str:
+        pieces = self.pieces
+        encoded = pieces[0]
+        for index, value in enumerate(values, 1):
+            encoded += _encodeValue(value) + pieces[index]
+        return encoded
+
+ACTION_TEMPLATES : dict[int, ActionTemplate] = {
+    PythonActionType.SET_VELOCITIES.value : ActionTemplate(PythonActionType.SET_VELOCITIES, ("left", "right"), "ff"),
+    PythonActionType.SET_CELL_VALUE.value : ActionTemplate(PythonActionType.SET_CELL_VALUE, ("x", "y", "value"), "HHi"),
+    PythonActionType.SET_EXPLORED.value : ActionTemplate(PythonActionType.SET_EXPLORED, ("x", "y", "explored"), "HH?"),
+    PythonActionType.SET_WALL.value : ActionTemplate(PythonActionType.SET_WALL, ("x", "y", "direction"), "HHB"),
+}
+
+# Start of an encoded action without a template, up to its body
+ACTION_PREFIXES : dict[int, str] = {
+    actionType.value : json.dumps(json.dumps({"actionType" : actionType.value, "jsonBody" : ""}))[:-4]
+    for actionType in PythonActionType
+}
 
 class Actions:
+    framing = Framing.JSON
+
     def __init__(self) -> None:
         self.actions: list[PythonAction] = []
 
+    @staticmethod
+    def negotiateFraming(requested : str | None) -> Framing:
+        # The host asks for a framing by name, anything unknown keeps JSON
+        Actions.framing = Framing.BINARY if requested == "binary" else Framing.JSON
+        return Actions.framing
+
     def _addToActions(
         self, actionType: PythonActionType, body: dict[str, Any] = {}
     ) -> None:
@@ -41,58 +238,128 @@ class Actions:
     def _addToActionsStr(self, actionType: PythonActionType, body: str) -> None:
         self.actions.append(PythonAction(actionType, body))
 
-    def setVelocities(self, left: int, right: int) -> None:
-        self._addToActions(
-            PythonActionType.SET_VELOCITIES, {"left": left, "right": right}
-        )
+    def _addToActionsValues(self, actionType: PythonActionType, *values: Any) -> None:
+        self.actions.append(PythonAction(actionType, values=values))
+
+    def setVelocities(self, left: float, right: float) -> None:
+        self._addToActionsValues(PythonActionType.SET_VELOCITIES, left, right)
 
     def setCellValue(self, x: int, y: int, value: int) -> None:
-        self._addToActions(
-            PythonActionType.SET_CELL_VALUE, {"x": x, "y": y, "value": value}
-        )
+        self._addToActionsValues(PythonActionType.SET_CELL_VALUE, x, y, value)
 
     def setExplored(self, x: int, y: int, explored: bool) -> None:
-        self._addToActions(
-            PythonActionType.SET_EXPLORED, {"x": x, "y": y, "explored": explored}
-        )
+        self._addToActionsValues(PythonActionType.SET_EXPLORED, x, y, explored)
+
+    def setWall(self, x: int, y: int, direction: int) -> None:
+        # direction is a Direction value
+        self._addToActionsValues(PythonActionType.SET_WALL, x, y, direction)
+
+    def setColor(self, x: int, y: int, color: str) -> None:
+        # An empty color clears the cell
+        self._addToActions(PythonActionType.SET_COLOR, {"x": x, "y": y, "color": color})
+
+    def clearAllColor(self) -> None:
+        self._addToActionsStr(PythonActionType.CLEAR_ALL_COLOR, "{}")
 
     def debugPrint(self, message: str) -> None:
-        self._addToActions(PythonActionType.DEBUG, {"message": message})
+        self._addToActionsStr(PythonActionType.DEBUG, '{"message": ' + encode_basestring_ascii(message) + "}")
 
     def terminate(self) -> None:
-        self._addToActions(PythonActionType.TERMINATE)
+        # Sending it also dumps the instruments, when they are enabled
+        self._addToActionsStr(PythonActionType.TERMINATE, "{}")
+
+    def debugInstruments(self) -> None:
+        # The instrument readings so far, shown by the host like any debug message
+        self._addToActionsStr(PythonActionType.DEBUG, json.dumps({"message" : json.dumps(INSTRUMENTS.summary())}))
 
     def displayRoute(self, route: "Route") -> None:
         self._addToActionsStr(PythonActionType.DISPLAY_ROUTE, route.to_json())
 
+    def encode(self) -> str:
+        # The JSON line for these actions, built in one pass. Byte for byte the same as
+        # json.dumps({"actions": [json.dumps(action) for action in actions]})
+        encoded = []
+        for action in self.actions:
+            if action.jsonBody is None:
+                encoded.append(ACTION_TEMPLATES[action.actionType].encode(action.values))
+            else:
+                encoded.append(ACTION_PREFIXES[action.actionType] + _escape(_escape(action.jsonBody)) + '\\"}"')
+        return '{"actions": [' + ", ".join(encoded) + "]}"
+
+    def encodeBinary(self) -> bytes:
+        # Frame = uint32 payload length, then uint16 action count and the actions.
+        # Fixed shape actions are packed with their template's struct, others are the
+        # action type, a uint32 length and the UTF-8 JSON body
+        payload = [struct.pack("<H", len(self.actions))]
+        for action in self.actions:
+            if action.jsonBody is None:
+                payload.append(ACTION_TEMPLATES[action.actionType].binary.pack(action.actionType, *action.values))
+            else:
+                body = action.jsonBody.encode()
+                payload.append(struct.pack("<BI", action.actionType, len(body)) + body)
+        joined = b"".join(payload)
+        return struct.pack("<I", len(joined)) + joined
 
     def send(self) -> None:
-        actionsToSend = [json.dumps(action.__dict__) for action in self.actions]
-        sys.stdout.write(json.dumps({"actions": actionsToSend}) + "\n")
-        sys.stdout.flush()
+        self.write(sys.stdout)
+
+    @INSTRUMENTS.timed("send")
+    def write(self, stream: TextIO) -> None:
+        if Actions.framing == Framing.BINARY:
+            encoded = self.encodeBinary()
+            stream.buffer.write(encoded)
+            stream.buffer.flush()
+            size = len(encoded)
+        else:
+            line = self.encode() + "\n"
+            stream.write(line)
+            stream.flush()
+            # The line is all ASCII, so its length is its size in bytes
+            size = len(line)
+        if INSTRUMENTS.enabled:
+            INSTRUMENTS.count("actions sent", len(self.actions))
+            INSTRUMENTS.count("bytes sent", size)
+            # The run ends once the host has this, so it is the last chance to report
+            if any(action.actionType == PythonActionType.TERMINATE.value for action in self.actions):
+                INSTRUMENTS.dump()
 
 def log(message: str) -> None:
     sys.stdout.write(message + "\n")
     sys.stdout.flush()
 
+
+# Simulator units per cell, the host sends positions in these
+CELL_SIZE = 18.0
+
+# (attribute, JSON key, divisor) of every InputData field, in order.
+# Positions arrive in simulator units and are converted to cells
+INPUT_FIELDS : tuple[tuple[str, str, float], ...] = (
+    ("leftDistance", "leftDistance", 1.0),
+    ("left45Distance", "left45Distance", 1.0),
+    ("forwardDistance", "forwardDistance", 1.0),
+    ("right45Distance", "right45Distance", 1.0),
+    ("rightDistance", "rightDistance", 1.0),
+    ("directionRad", "directionRad", 1.0),
+    ("actualPositionX", "actualPositionX", CELL_SIZE),
+    ("actualPositionY", "actualPositionY", CELL_SIZE),
+    ("actualDirectionRad", "actualDirectionRad", 1.0),
+)
+
 class InputData:
+    __slots__ = tuple(field for field, _, _ in INPUT_FIELDS)
+
     @staticmethod
     def get_from_unity() -> "InputData":
-        inputObj = json.loads(input())
-
-        inputData = InputData(
-            inputObj["leftDistance"],
-            inputObj["left45Distance"],
-            inputObj["forwardDistance"],
-            inputObj["right45Distance"],
-            inputObj["rightDistance"],
-            inputObj["directionRad"],
-            inputObj["actualPositionX"] / 18.0,
-            inputObj["actualPositionY"] / 18.0,
-            inputObj["actualDirectionRad"],
-        )
+        return InputData.from_json(input())
+
+    @staticmethod
+    @INSTRUMENTS.timed("parse")
+    def from_json(line: str) -> "InputData":
+        inputObj = json.loads(line)
+        if "framing" in inputObj:
+            Actions.negotiateFraming(inputObj["framing"])
 
-        return inputData
+        return InputData(*[inputObj[key] / divisor for _, key, divisor in INPUT_FIELDS])
 
     def __init__(
         self,
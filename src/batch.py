@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator
+
+from old_main import Maze, Mouse, MouseState, centreGoal
+from src.cell import Direction, MouseDirection, WALL_BITS
+from src.path import Path
+from src.snapshot import MAGIC, Snapshot
+
+# Headless solves of many mazes. Each maze is explored by a mouse that reads its
+# walls from the maze file instead of the simulator, then the best route is
+# calculated from what it explored. Run from the repository root:
+#   python -m src.batch mazes/ [--workers N] [--output results.jsonl]
+# mazes may be a directory, a .zip or a .tar(.gz) of maze.json style files or snapshots
+
+# Suffixes of the files read from a directory or archive
+MAZE_SUFFIXES = (".json", ".mzs")
+
+
+class OracleMouse(Mouse):
+    # A Mouse whose sensors and moves work on a known maze instead of the
+    # simulator, with nothing drawn. Counts its moves and turns, and the commands
+    # and sensor reads the simulator would have been sent
+    def __init__(self, cells : list[list[int]], useNumpyMaze : bool = False, goal : list[tuple[int, int]] | None = None) -> None:
+        super().__init__(useNumpyMaze, len(cells), len(cells[0]), goal)
+        self.trueCells = cells
+        self.steps = 0
+        self.turns = 0
+        self.commands = 0
+
+    def wallTowards(self, mouseDirection : MouseDirection) -> bool:
+        direction = Direction.fromMouseDirection(self.direction, mouseDirection)
+        return bool(self.trueCells[self.x][self.y] & WALL_BITS[direction.value])
+
+    def getSensors(self) -> tuple[bool, bool, bool]:
+        self.commands += 3
+        return (self.wallTowards(MouseDirection.LEFT), self.wallTowards(MouseDirection.FORWARD), self.wallTowards(MouseDirection.RIGHT))
+
+    def TurnMouse(self, newDirection : Direction) -> None:
+        turns = len(self.direction.turnsTo(newDirection))
+        self.turns += turns
+        self.commands += turns
+        self.direction = newDirection
+
+    def MoveForward(self, cells : int = 1) -> None:
+        self.commands += 1
+        dx, dy = self.direction.vector
+        for _ in range(cells):
+            if self.wallTowards(MouseDirection.FORWARD):
+                raise Exception(f"Drove into a wall at ({self.x}, {self.y}) facing {self.direction.name}")
+            self.steps += 1
+            self.x += dx
+            self.y += dy
+
+    def drawRoute(self) -> None:
+        pass
+
+    def flushDisplay(self) -> None:
+        pass
+
+    def explore(self, maxSteps : int) -> bool:
+        # Explores until the next move would enter the goal, False if that takes more than maxSteps
+        while not self.exploringMove(self.goal, False, MouseState.EXPLORING):
+            if self.steps > maxSteps:
+                return False
+        return True
+
+
+def readMazes(source : str) -> Iterator[tuple[str, bytes]]:
+    # (name, file contents) of every maze in a directory, zip or tar, sorted by name
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.endswith(MAZE_SUFFIXES):
+                    path = os.path.join(root, name)
+                    with open(path, "rb") as f:
+                        yield os.path.relpath(path, source), f.read()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for name in sorted(archive.namelist()):
+                if name.endswith(MAZE_SUFFIXES):
+                    yield name, archive.read(name)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in sorted(archive.getmembers(), key=lambda member: member.name):
+                if member.isfile() and member.name.endswith(MAZE_SUFFIXES):
+                    memberFile = archive.extractfile(member)
+                    assert memberFile is not None
+                    yield member.name, memberFile.read()
+    else:
+        with open(source, "rb") as f:
+            yield os.path.basename(source), f.read()
+
+
+def parseCells(data : bytes) -> list[list[int]]:
+    # Wall bits indexed cells[x][y], from a maze.json style file or a snapshot
+    cells : list[list[int]] = Snapshot(data).cells.tolist() if data.startswith(MAGIC) else json.loads(data)["cells"]
+    return cells
+
+
+def solveMaze(task : tuple[str, bytes, bool]) -> dict[str, Any]:
+    # Explores one maze and calculates its best route, as one line of the report
+    name, data, useNumpyMaze = task
+    result : dict[str, Any] = {"name" : name}
+    try:
+        cells = parseCells(data)
+        width, height = len(cells), len(cells[0])
+        goal = centreGoal(width, height)
+
+        # Shortest route with every wall known, to compare the explored one against
+        oracle = Maze(None, width, height)
+        oracle.cells = [row.copy() for row in cells]
+        oracle.recalculate(goal, updateDisplay=False)
+        result["optimalLength"] = oracle.flood[0][0] + 1 if oracle.flood[0][0] >= 0 else None
+
+        # The solver logs every move to stdout, which would drown the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            mouse = OracleMouse(cells, useNumpyMaze, goal)
+            explored = mouse.explore(4 * width * height)
+            routes : list[Path] = []
+            if explored:
+                if len(goal) == 4:
+                    mouse.markOutCenter()
+                # The mouse stops next to the goal, it is known to be enterable from there
+                for x, y in goal:
+                    mouse.maze.setExplored(x, y)
+                # Routes only through what was explored
+                mouse.maze.blockUnexplored()
+                routes = mouse.maze.calculateBestRoutes((0, 0), Direction.NORTH, goal)
+            result["solveTime"] = time.perf_counter() - start
+
+        result["explored"] = explored
+        result["steps"] = mouse.steps
+        result["exploreTurns"] = mouse.turns
+        result["commands"] = mouse.commands
+        result["cellsExplored"] = sum(sum(1 for cell in column if cell) for column in mouse.maze.explored)
+        result["routeLength"] = len(routes[0]) if routes else None
+        result["routeTurns"] = routes[0].getNumberOfTurns() if routes else None
+    except Exception as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Explore and solve every maze in a directory or archive")
+    parser.add_argument("source", help="directory, .zip or .tar of maze.json style files or snapshots")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes to solve on")
+    parser.add_argument("--numpy", action="store_true", help="solve with NumpyMaze")
+    parser.add_argument("--output", help="save every result as a JSON line to this file")
+    args = parser.parse_args()
+
+    tasks = ((name, data, args.numpy) for name, data in readMazes(args.source))
+    output = open(args.output, "w") if args.output else None
+    results = []
+    start = time.perf_counter()
+    print(f"{'maze':<40}{'steps':>7}{'cmds':>7}{'route':>7}{'best':>6}{'turns':>7}{'ms':>9}")
+    with ProcessPoolExecutor(args.workers) as pool:
+        # Results come back in order, a few mazes at a time so small ones are not dominated by the handoff
+        for result in pool.map(solveMaze, tasks, chunksize=4):
+            results.append(result)
+            if output is not None:
+                output.write(json.dumps(result) + "\n")
+            if "error" in result:
+                print(f"{result['name']:<40} {result['error']}")
+            else:
+                print(f"{result['name']:<40}{result['steps']:>7}{result['commands']:>7}{str(result['routeLength']):>7}{str(result['optimalLength']):>6}{str(result['routeTurns']):>7}{result['solveTime'] * 1000:>9.1f}")
+    if output is not None:
+        output.close()
+
+    solved = [result for result in results if "error" not in result and result["routeLength"] is not None]
+    failed = len(results) - len(solved)
+    print(f"{len(results)} mazes in {time.perf_counter() - start:.2f} s, {failed} unsolved")
+    if solved:
+        print(f"Mean steps: {sum(result['steps'] for result in solved) / len(solved):.1f}, "
+            f"mean commands: {sum(result['commands'] for result in solved) / len(solved):.1f}, "
+            f"mean route length: {sum(result['routeLength'] for result in solved) / len(solved):.1f}, "
+            f"optimal routes: {sum(result['routeLength'] == result['optimalLength'] for result in solved)}, "
+            f"mean solve time: {sum(result['solveTime'] for result in solved) / len(solved) * 1000:.1f} ms")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
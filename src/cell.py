@@ -1,5 +1,5 @@
 from enum import Enum
-from tools import log
+from functools import lru_cache
 
 class MouseDirection(Enum):
     LEFT = -1
@@ -15,68 +15,49 @@ class Direction(Enum):
 
     @staticmethod
     def fromMouseDirection(mouseDirection : "Direction", relativeDirection : "MouseDirection") -> "Direction":
-        return Direction((mouseDirection.value + relativeDirection.value) % 4)
+        return RELATIVE_DIRECTIONS[mouseDirection.value][relativeDirection.value]
 
     @staticmethod
     def fromVector(vector : tuple[int, int]) -> "Direction":
-        match (vector):
-            case (-1, 0):
-                return Direction.WEST
-            case (0, 1):
-                return Direction.NORTH
-            case (1, 0):
-                return Direction.EAST
-            case (0, -1):
-                return Direction.SOUTH
-            case _:
-                raise Exception("Invalid vector")
-        
-    
-    def turnsTo(self, turnTo : "Direction") -> list["MouseDirection"]:
-        if (self.value != turnTo.value):
-            log(f"Turning from {self.name} to {turnTo.name}")
-
-        match (turnTo.value - self.value):
-            case 0:
-                return []
-            case -1 | 3:
-                return [MouseDirection.LEFT]
-            case -2 | 2:
-                return [MouseDirection.LEFT, MouseDirection.LEFT]
-            case -3 | 1:
-                return [MouseDirection.RIGHT]
-            case _:
-                raise Exception("Invalid turnTo")
-            
-    
+        direction = VECTOR_DIRECTIONS.get(vector)
+        if direction is None:
+            raise Exception("Invalid vector")
+        return direction
+
+    def turnsTo(self, turnTo : "Direction") -> tuple["MouseDirection", ...]:
+        return TURNS[self.value][turnTo.value]
 
     @property
     def vector(self) -> tuple[int, int]:
-        match (self.value):
-            case Direction.WEST.value:
-                return (-1, 0)
-            case Direction.NORTH.value:
-                return (0, 1)
-            case Direction.EAST.value:
-                return (1, 0)
-            case Direction.SOUTH.value:
-                return (0, -1)
-            case _:
-                return (0,0) 
-            
+        return DIRECTION_VECTORS[self.value]
+
     @property
     def opposite(self) -> "Direction":
-        match (self.value):
-            case Direction.WEST.value:
-                return Direction.EAST
-            case Direction.NORTH.value:
-                return Direction.SOUTH
-            case Direction.EAST.value:
-                return Direction.WEST
-            case Direction.SOUTH.value:
-                return Direction.NORTH
-            case _:
-                return Direction.NORTH
+        return OPPOSITE_DIRECTIONS[self.value]
+
+# Lookup tables indexed by Direction.value, so hot paths avoid enum dispatch
+DIRECTION_VECTORS : tuple[tuple[int, int], ...] = ((-1, 0), (0, 1), (1, 0), (0, -1))
+VECTOR_DIRECTIONS : dict[tuple[int, int], Direction] = {vector : Direction(value) for value, vector in enumerate(DIRECTION_VECTORS)}
+OPPOSITE_DIRECTIONS : tuple[Direction, ...] = tuple(Direction((value + 2) % 4) for value in range(4))
+
+# RELATIVE_DIRECTIONS[direction][mouseDirection], MouseDirection.LEFT = -1 indexes the last entry
+RELATIVE_DIRECTIONS : tuple[tuple[Direction, ...], ...] = tuple(
+    tuple(Direction((value + offset) % 4) for offset in range(4)) for value in range(4)
+)
+
+# TURNS[from][to], turns needed to face a new direction
+TURNS : tuple[tuple[tuple[MouseDirection, ...], ...], ...] = tuple(
+    tuple(
+        {
+            0: (),
+            1: (MouseDirection.RIGHT,),
+            2: (MouseDirection.LEFT, MouseDirection.LEFT),
+            3: (MouseDirection.LEFT,),
+        }[(to - start) % 4]
+        for to in range(4)
+    )
+    for start in range(4)
+)
 
 # Cell Calculation
 # ULRD
@@ -103,28 +84,43 @@ def set_bit(value : int, bit : int) -> int:
 def clear_bit(value : int, bit : int) -> int:
     return value & ~(1 << bit)
 
+# Bit of the cell value holding the wall in each direction, indexed by Direction.value
+WALL_BITS : tuple[int, ...] = (1 << 2, 1 << 3, 1 << 1, 1 << 0)
+
+# CLEAR_DIRECTIONS[cellValue], directions without a wall, in the order NORTH, WEST, EAST, SOUTH
+CLEAR_DIRECTIONS : tuple[tuple[Direction, ...], ...] = tuple(
+    tuple(direction for direction in (Direction.NORTH, Direction.WEST, Direction.EAST, Direction.SOUTH) if not cellValue & WALL_BITS[direction.value])
+    for cellValue in range(16)
+)
+
 class Cell:
     @staticmethod
     def addWall(cellValue : int, directionOfWall : "Direction") -> int:
-        match directionOfWall:
-            case Direction.NORTH:
-                return set_bit(cellValue, 3)
-            case Direction.WEST:
-                return set_bit(cellValue, 2)
-            case Direction.EAST:
-                return set_bit(cellValue, 1)
-            case Direction.SOUTH:
-                return set_bit(cellValue, 0)
-            
+        return cellValue | WALL_BITS[directionOfWall.value]
+
     @staticmethod
     def getClearDirections(cellValue : int) -> list[Direction]:
-        directions = []
-        if cellValue & (1 << 3) == 0:
-            directions.append(Direction.NORTH)
-        if cellValue & (1 << 2) == 0:
-            directions.append(Direction.WEST)
-        if cellValue & (1 << 1) == 0:
-            directions.append(Direction.EAST)
-        if cellValue & (1 << 0) == 0:
-            directions.append(Direction.SOUTH)
-        return directions
\ No newline at end of file
+        return list(CLEAR_DIRECTIONS[cellValue])
+
+# Neighbour = (direction, x, y)
+Neighbour = tuple[Direction, int, int]
+
+@lru_cache(maxsize=None)
+def neighbourTable(width : int, height : int) -> tuple[tuple[tuple[tuple[Neighbour, ...], ...], ...], ...]:
+    # neighbourTable(width, height)[x][y][cellValue], the in bounds cells reachable
+    # from (x, y) for every possible cell value. Built once per maze size and
+    # indexed by the live cell value, so it stays correct as walls are added
+    return tuple(tuple(_cellNeighbours(x, y, width, height) for y in range(height)) for x in range(width))
+
+def _cellNeighbours(x : int, y : int, width : int, height : int) -> tuple[tuple[Neighbour, ...], ...]:
+    # The 16 entries of one cell share its at most 4 neighbours, which keeps the
+    # table small enough for 64x64 mazes and up
+    inBounds : dict[Direction, Neighbour] = {}
+    for direction in Direction:
+        dx, dy = DIRECTION_VECTORS[direction.value]
+        if 0 <= x + dx < width and 0 <= y + dy < height:
+            inBounds[direction] = (direction, x + dx, y + dy)
+    return tuple(
+        tuple(inBounds[direction] for direction in CLEAR_DIRECTIONS[cellValue] if direction in inBounds)
+        for cellValue in range(16)
+    )
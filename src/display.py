@@ -0,0 +1,139 @@
+from typing import Any, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from api import Actions
+
+# Wall bits, matching the cell values in cell.py
+NORTH_WALL = 1 << 3
+WEST_WALL = 1 << 2
+EAST_WALL = 1 << 1
+SOUTH_WALL = 1 << 0
+
+# Wall bit -> (direction value sent to the host, dx, dy, wall bit on the neighbour's side)
+WALL_SIDES : tuple[tuple[int, int, int, int, int], ...] = (
+    (NORTH_WALL, 1, 0, 1, SOUTH_WALL),
+    (WEST_WALL, 0, -1, 0, EAST_WALL),
+    (EAST_WALL, 2, 1, 0, WEST_WALL),
+    (SOUTH_WALL, 3, 0, -1, NORTH_WALL),
+)
+
+# Keeps a copy of what the host is showing, so a tick only sends what changed.
+# Drawing calls only update the wanted state, flush adds the differences to one
+# batch of actions
+class Display:
+    def __init__(self, width : int = 16, height : int = 16) -> None:
+        self.width = width
+        self.height = height
+
+        # What the host is showing
+        self.shownValues : list[list[int | None]] = [[None for _ in range(height)] for _ in range(width)]
+        self.shownWalls = [[0 for _ in range(height)] for _ in range(width)]
+        self.shownExplored : list[list[bool | None]] = [[None for _ in range(height)] for _ in range(width)]
+        self.shownColors : dict[tuple[int, int], str] = {}
+
+        # What it should be showing after the next flush
+        self.values = [row.copy() for row in self.shownValues]
+        self.walls = [row.copy() for row in self.shownWalls]
+        self.explored = [row.copy() for row in self.shownExplored]
+        self.colors : dict[tuple[int, int], str] = {}
+
+        # Cells that may differ between the two
+        self.changedValues : set[tuple[int, int]] = set()
+        self.changedWalls : set[tuple[int, int]] = set()
+        self.changedExplored : set[tuple[int, int]] = set()
+        self.changedColors : set[tuple[int, int]] = set()
+
+    def setCellValue(self, x : int, y : int, value : int) -> None:
+        if self.values[x][y] != value:
+            self.values[x][y] = value
+            self.changedValues.add((x, y))
+
+    def setWalls(self, x : int, y : int, walls : int) -> None:
+        if self.walls[x][y] | walls != self.walls[x][y]:
+            self.walls[x][y] |= walls
+            self.changedWalls.add((x, y))
+
+    def setExplored(self, x : int, y : int, explored : bool) -> None:
+        if self.explored[x][y] != explored:
+            self.explored[x][y] = explored
+            self.changedExplored.add((x, y))
+
+    def setColor(self, x : int, y : int, color : str) -> None:
+        if self.colors.get((x, y)) != color:
+            self.colors[(x, y)] = color
+            self.changedColors.add((x, y))
+
+    def clearAllColor(self) -> None:
+        self.changedColors.update(self.colors)
+        self.colors.clear()
+
+    def showGrids(self, values : Any, walls : Any, explored : Any) -> None:
+        # Wants a whole maze shown. Rows are compared whole first, so unchanged
+        # rows cost one comparison instead of one per cell
+        values = _asRows(values)
+        walls = _asRows(walls)
+        explored = _asRows(explored)
+        for x in range(self.width):
+            if values[x] != self.values[x]:
+                for y, value in enumerate(values[x]):
+                    self.setCellValue(x, y, value)
+            if walls[x] != self.walls[x]:
+                for y, cellWalls in enumerate(walls[x]):
+                    self.setWalls(x, y, cellWalls)
+            if explored[x] != self.explored[x]:
+                for y, cellExplored in enumerate(explored[x]):
+                    self.setExplored(x, y, cellExplored)
+
+    def flush(self, actions : "Actions") -> int:
+        # Adds everything that changed since the last flush to actions, returns how many were added
+        added = len(actions.actions)
+
+        for x, y in sorted(self.changedValues):
+            value = self.values[x][y]
+            if value != self.shownValues[x][y] and value is not None:
+                actions.setCellValue(x, y, value)
+                self.shownValues[x][y] = value
+
+        for x, y in sorted(self.changedWalls):
+            # A wall is shared by two cells, so it is only sent once
+            newWalls = self.walls[x][y] & ~self.shownWalls[x][y]
+            for wall, direction, dx, dy, neighbourWall in WALL_SIDES:
+                if not newWalls & wall:
+                    continue
+                actions.setWall(x, y, direction)
+                self.shownWalls[x][y] |= wall
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < self.width and 0 <= ny < self.height:
+                    self.shownWalls[nx][ny] |= neighbourWall
+
+        for x, y in sorted(self.changedExplored):
+            explored = self.explored[x][y]
+            if explored != self.shownExplored[x][y] and explored is not None:
+                actions.setExplored(x, y, explored)
+                self.shownExplored[x][y] = explored
+
+        # Clearing everything and redrawing is cheaper when most coloured cells changed
+        changedColors = [cell for cell in sorted(self.changedColors) if self.colors.get(cell) != self.shownColors.get(cell)]
+        if 1 + len(self.colors) < len(changedColors):
+            actions.clearAllColor()
+            self.shownColors.clear()
+            changedColors = sorted(self.colors)
+        for x, y in changedColors:
+            color = self.colors.get((x, y))
+            actions.setColor(x, y, "" if color is None else color)
+            if color is None:
+                del self.shownColors[(x, y)]
+            else:
+                self.shownColors[(x, y)] = color
+
+        self.changedValues.clear()
+        self.changedWalls.clear()
+        self.changedExplored.clear()
+        self.changedColors.clear()
+        return len(actions.actions) - added
+
+
+def _asRows(grid : Any) -> Sequence[list[Any]]:
+    # Nested lists are used as they are, numpy arrays are converted to them
+    rows : Sequence[list[Any]] = grid.tolist() if hasattr(grid, "tolist") else grid
+    return rows
@@ -0,0 +1,63 @@
+import json
+import numpy as np
+
+from api import Actions, INPUT_FIELDS, InputData
+
+FIELD_NAMES : tuple[str, ...] = tuple(field for field, _, _ in INPUT_FIELDS)
+FIELD_INDEXES : dict[str, int] = {field : index for index, field in enumerate(FIELD_NAMES)}
+POSE_INDEXES : tuple[int, int, int] = (FIELD_INDEXES["actualPositionX"], FIELD_INDEXES["actualPositionY"], FIELD_INDEXES["actualDirectionRad"])
+
+class FrameBuffer:
+    # Fixed capacity history of sensor frames, one column per InputData field.
+    # Every frame is written twice, capacity rows apart, so the newest n frames are
+    # always one contiguous slice and windows are numpy views, never copies
+    def __init__(self, capacity : int = 1024) -> None:
+        self.capacity = capacity
+        self._columns = np.zeros((len(FIELD_NAMES), 2 * capacity))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append_values(self, values : tuple[float, ...] | list[float]) -> None:
+        # values in INPUT_FIELDS order, already converted
+        self._columns[:, self._next] = values
+        self._columns[:, self._next + self.capacity] = values
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def append(self, inputData : InputData) -> None:
+        self.append_values([getattr(inputData, field) for field in FIELD_NAMES])
+
+    def append_json(self, line : str) -> None:
+        # Parses a frame from the host straight into the buffer, without an InputData
+        inputObj = json.loads(line)
+        if "framing" in inputObj:
+            Actions.negotiateFraming(inputObj["framing"])
+        self.append_values([inputObj[key] / divisor for _, key, divisor in INPUT_FIELDS])
+
+    def window(self, n : int | None = None) -> np.ndarray:
+        # The newest n frames (all stored frames by default), oldest first, as a
+        # (field, frame) view. It is overwritten as new frames arrive
+        if n is None or n > self._count:
+            n = self._count
+        end = self._next + self.capacity
+        return self._columns[:, end - n:end]
+
+    def column(self, field : str, n : int | None = None) -> np.ndarray:
+        column : np.ndarray = self.window(n)[FIELD_INDEXES[field]]
+        return column
+
+    def pose(self) -> tuple[float, float, float]:
+        # actualPositionX, actualPositionY and actualDirectionRad of the newest frame
+        if self._count == 0:
+            raise IndexError("FrameBuffer is empty")
+        newest = self._columns[:, self._next + self.capacity - 1]
+        x, y, direction = POSE_INDEXES
+        return float(newest[x]), float(newest[y]), float(newest[direction])
+
+    def latest(self) -> InputData:
+        if self._count == 0:
+            raise IndexError("FrameBuffer is empty")
+        return InputData(*self.window(1)[:, 0].tolist())
@@ -1,34 +1,227 @@
-from copy import copy
-from src.cell import Direction
-import src.api as api
-import math
+from typing import Iterable, Iterator, Sequence, cast, overload
+from src.cell import Direction, DIRECTION_VECTORS, VECTOR_DIRECTIONS
 
+# Vector between neighbouring cells -> Direction value of the move
+MOVE_VALUES : dict[tuple[int, int], int] = {vector : direction.value for vector, direction in VECTOR_DIRECTIONS.items()}
+
+# Packed byte -> the 4 moves in it, first move first
+BYTE_MOVES : tuple[tuple[int, ...], ...] = tuple(tuple((byte >> shift) & 3 for shift in (0, 2, 4, 6)) for byte in range(256))
+
+
+def countTurns(cells : Sequence[tuple[int, int]]) -> int:
+    # Path(cells).getNumberOfTurns() without building the path
+    turns = 0
+    for index in range(len(cells) - 2):
+        (x0, y0), (x1, y1), (x2, y2) = cells[index], cells[index + 1], cells[index + 2]
+        if (x1 - x0, y1 - y0) != (x2 - x1, y2 - y1):
+            turns += 1
+    return turns
+
+
+class PathMoves:
+    # Moves packed 4 to a byte, 2 bits each holding a Direction value. Shared by a
+    # path and its copies, length is how many moves have been written, so only the
+    # path ending there may append in place
+    __slots__ = ("data", "length")
+
+    def __init__(self, data : bytearray, length : int) -> None:
+        self.data = data
+        self.length = length
+
+
+# A route through the maze, stored as its first cell and the moves from there.
+# The turn count and last cell are kept up to date as cells are appended, the
+# hash is cached once worked out, and copies share the moves until one of them appends
+class Path:
+    __slots__ = ("start", "end", "_moves", "_length", "_hash", "_turns", "_lastMove", "_cells")
+
+    def __init__(self, args : Iterable[tuple[int, int]] | None = None) -> None:
+        self.start : tuple[int, int] | None = None
+        self.end : tuple[int, int] | None = None
+        self._moves = PathMoves(bytearray(), 0)
+        # Number of moves in this path, the shared moves may go further
+        self._length = 0
+        self._hash : int | None = None
+        self._turns = 0
+        self._lastMove = -1
+        # Cells decoded for indexing, dropped when the path changes
+        self._cells : list[tuple[int, int]] | None = None
 
-class Path(list[tuple[int, int]]):
-    def __init__(self, args : list[tuple[int, int]] | None = None) -> None:
         if (args is not None):
-            super().__init__(args)
+            self.extend(args)
+
+    def append(self, cell : tuple[int, int]) -> None:
+        end = self.end
+        if end is None:
+            self.start = self.end = cell
+            self._hash = self._cells = None
+            return
+
+        move = MOVE_VALUES.get((cell[0] - end[0], cell[1] - end[1]))
+        if move is None:
+            raise ValueError(f"{cell} is not next to {end}")
+
+        moves = self._moves
+        length = self._length
+        if moves.length != length:
+            moves = self._unshare()
+        if length & 3:
+            moves.data[length >> 2] |= move << ((length & 3) << 1)
         else:
-            super().__init__()
+            moves.data.append(move)
+        moves.length = self._length = length + 1
+
+        if move != self._lastMove and length:
+            self._turns += 1
+        self._lastMove = move
+        self.end = cell
+        self._hash = self._cells = None
+
+    def extend(self, cells : Iterable[tuple[int, int]]) -> None:
+        cells = list(cells)
+        if not cells:
+            return
+        end = self.end
+        if end is None:
+            end = cells[0]
+            self.append(end)
+            del cells[0]
+            if not cells:
+                return
+
+        # Moves are all checked before any is written, so a bad cell leaves the path as it was
+        previous = [end] + cells[:-1]
+        found = [MOVE_VALUES.get((x1 - x0, y1 - y0)) for (x0, y0), (x1, y1) in zip(previous, cells)]
+        if None in found:
+            index = found.index(None)
+            raise ValueError(f"{cells[index]} is not next to {previous[index]}")
+        moves = cast(list[int], found)
+
+        turns = self._turns
+        lastMove = self._lastMove if self._length else moves[0]
+        for move in moves:
+            if move != lastMove:
+                turns += 1
+                lastMove = move
+
+        # Top up the partial last byte, then pack the rest 4 at a time
+        length = self._length
+        data = self._moves.data if self._moves.length == length else self._unshare().data
+        index = 0
+        while length & 3 and index < len(moves):
+            data[length >> 2] |= moves[index] << ((length & 3) << 1)
+            length += 1
+            index += 1
+        rest = moves[index:] + [0] * (-(len(moves) - index) % 4)
+        data.extend([a | b << 2 | c << 4 | d << 6 for a, b, c, d in zip(rest[0::4], rest[1::4], rest[2::4], rest[3::4])])
+
+        self._moves.length = self._length = self._length + len(moves)
+        self._turns = turns
+        self._lastMove = lastMove
+        self.end = cells[-1]
+        self._hash = self._cells = None
+
+    def _unshare(self) -> PathMoves:
+        # A copy has appended past the end of this path, take the moves so far
+        length = self._length
+        data = self._moves.data[:(length + 3) // 4]
+        if length & 3:
+            data[-1] &= (1 << ((length & 3) << 1)) - 1
+        self._moves = PathMoves(data, length)
+        return self._moves
+
+    def packedMoves(self) -> bytes:
+        # The moves of this path only, 4 to a byte as stored, with any a copy wrote
+        # past the end masked out
+        length = self._length
+        data = bytes(self._moves.data[:(length + 3) // 4])
+        if length & 3:
+            data = data[:-1] + bytes([data[-1] & ((1 << ((length & 3) << 1)) - 1)])
+        return data
+
+    @classmethod
+    def fromPackedMoves(cls, start : tuple[int, int], length : int, data : bytes) -> "Path":
+        # The path from start taking length moves, packed as packedMoves returns them
+        data = bytes(data[:(length + 3) // 4])
+        moves = [move for byte in data for move in BYTE_MOVES[byte]][:length]
+        if len(moves) != length:
+            raise ValueError(f"{len(data)} bytes hold fewer than {length} moves")
+
+        path = cls()
+        path.start = start
+        path.end = (
+            start[0] + moves.count(Direction.EAST.value) - moves.count(Direction.WEST.value),
+            start[1] + moves.count(Direction.NORTH.value) - moves.count(Direction.SOUTH.value),
+        )
+        path._moves = PathMoves(bytearray(data), length)
+        path._length = length
+        path._turns = sum(1 for before, after in zip(moves, moves[1:]) if before != after)
+        path._lastMove = moves[-1] if moves else -1
+        if length % 4:
+            # Anything past the last move must be clear for appending and comparing
+            path._moves.data[-1] &= (1 << (2 * (length % 4))) - 1
+        return path
 
     def copy(self) -> "Path":
-        return copy(self)
-    
-    
-    def __hash__(self) -> int: # type: ignore
-        hash = ""
-        for i in range(len(self) - 1):
-            vector = (self[i + 1][0] - self[i][0], self[i + 1][1] - self[i][1])
-            hash += str(Direction.fromVector(vector).value)
-        return hash.__hash__()
-    
+        # O(1), the copy shares the moves written so far
+        path = Path.__new__(Path)
+        path.start = self.start
+        path.end = self.end
+        path._moves = self._moves
+        path._length = self._length
+        path._hash = self._hash
+        path._turns = self._turns
+        path._lastMove = self._lastMove
+        path._cells = None
+        return path
+
+    def moves(self) -> Iterator[Direction]:
+        data = self._moves.data
+        for index in range(self._length):
+            yield Direction((data[index // 4] >> (2 * (index % 4))) & 3)
+
+    def cells(self) -> list[tuple[int, int]]:
+        if self._cells is None:
+            if self.start is None:
+                self._cells = []
+            else:
+                x, y = self.start
+                cells = [(x, y)]
+                for direction in self.moves():
+                    dx, dy = DIRECTION_VECTORS[direction.value]
+                    x += dx
+                    y += dy
+                    cells.append((x, y))
+                self._cells = cells
+        return self._cells
+
     def getNumberOfTurns(self) -> int:
-        turns = 0
-        for i in range(len(self) - 2):
-            vector1 = (self[i + 1][0] - self[i][0], self[i + 1][1] - self[i][1])
-            vector2 = (self[i + 2][0] - self[i + 1][0], self[i + 2][1] - self[i + 1][1])
-            if (Direction.fromVector(vector1) != Direction.fromVector(vector2)):
-                turns += 1
-                # api.setColor(self[i + 1][0], self[i + 1][1], "y")
-        return turns
-    
\ No newline at end of file
+        return self._turns
+
+    def __len__(self) -> int:
+        return 0 if self.start is None else self._length + 1
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        return iter(self.cells())
+
+    @overload
+    def __getitem__(self, index : int) -> tuple[int, int]: ...
+    @overload
+    def __getitem__(self, index : slice) -> list[tuple[int, int]]: ...
+    def __getitem__(self, index : int | slice) -> tuple[int, int] | list[tuple[int, int]]:
+        return self.cells()[index]
+
+    def __hash__(self) -> int:
+        # Worked out from the packed moves the first time it is needed after a change
+        if self._hash is None:
+            self._hash = hash((self.start, self._length, self.packedMoves()))
+        return self._hash
+
+    def __eq__(self, other : object) -> bool:
+        # Only another Path, so equal paths always hash the same. Compare list(path) with cells
+        if isinstance(other, Path):
+            return self.start == other.start and self._length == other._length and self.packedMoves() == other.packedMoves()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Path({self.cells()!r})"
@@ -0,0 +1,156 @@
+import numpy as np
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from cell import Direction, DIRECTION_VECTORS, VECTOR_DIRECTIONS
+from route import Route, SAMPLE_T
+
+# Pieces a path of cells is split into
+STRAIGHT = "straight"
+LEFT = "left"
+RIGHT = "right"
+U_TURN_LEFT = "u_turn_left"
+U_TURN_RIGHT = "u_turn_right"
+
+# Quarter turns clockwise each piece makes. Direction values go clockwise, so
+# turning right adds one
+TURN_STEPS: Dict[str, int] = {STRAIGHT: 0, LEFT: 3, RIGHT: 1, U_TURN_LEFT: 2, U_TURN_RIGHT: 2}
+
+# Curves of each turning piece when heading north, starting at the middle of the
+# edge it enters its first cell through. x is to the right, y ahead, in cells, so
+# cell centres are whole numbers as on the route
+TURN_CURVES: Dict[str, List[Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]]] = {
+    LEFT: [((0, 0), (0, 0.5), (-0.5, 0.5))],
+    RIGHT: [((0, 0), (0, 0.5), (0.5, 0.5))],
+    # Through two cells side by side, leaving back the way it came
+    U_TURN_LEFT: [((0, 0), (0, 0.5), (-0.5, 0.5)), ((-0.5, 0.5), (-1, 0.5), (-1, 0))],
+    U_TURN_RIGHT: [((0, 0), (0, 0.5), (0.5, 0.5)), ((0.5, 0.5), (1, 0.5), (1, 0))],
+}
+
+# Straights up to this many half cells are built when the module is loaded, longer ones on first use
+PRECOMPUTED_HALF_CELLS = 64
+
+# A piece of a path, its kind and for straights the length in half cells
+Piece = Tuple[str, int]
+
+
+class Primitive:
+    # One piece turned to face one heading, as curves relative to where it starts,
+    # with the points of each curve at SAMPLE_T worked out up front
+    def __init__(self, curves: np.ndarray, heading: Direction) -> None:
+        # (curve, control point, xy)
+        self.curves = curves
+        self.control_points = [((p0[0], p0[1]), (p1[0], p1[1]), (p2[0], p2[1])) for p0, p1, p2 in curves.tolist()]
+
+        t = SAMPLE_T[np.newaxis, :, np.newaxis]
+        p0, p1, p2 = curves[:, np.newaxis, 0], curves[:, np.newaxis, 1], curves[:, np.newaxis, 2]
+        # (curve, sample, xy)
+        self.samples = (1 - t) * (1 - t) * p0 + 2 * (1 - t) * t * p1 + t * t * p2
+
+        # Offset from the start to the end, and the heading at the end
+        self.end = (float(curves[-1, 2, 0]), float(curves[-1, 2, 1]))
+        self.heading = heading
+
+
+_library: Dict[Tuple[str, Direction, int], Primitive] = {}
+
+
+def _make_primitive(kind: str, heading: Direction, half_cells: int) -> Primitive:
+    if kind == STRAIGHT:
+        length = half_cells / 2
+        curves = [((0.0, 0.0), (0.0, length / 2), (0.0, length))]
+    else:
+        curves = TURN_CURVES[kind]
+
+    # (right, ahead) -> world, turned to face heading
+    forward = np.array(DIRECTION_VECTORS[heading.value], dtype=float)
+    right = np.array((forward[1], -forward[0]))
+    return Primitive(np.array(curves, dtype=float) @ np.array((right, forward)), Direction((heading.value + TURN_STEPS[kind]) % 4))
+
+
+def primitive(kind: str, heading: Direction, half_cells: int = 0) -> Primitive:
+    # The piece from the library, heading is the direction it starts moving in and
+    # half_cells the length of a straight
+    key = (kind, heading, half_cells if kind == STRAIGHT else 0)
+    found = _library.get(key)
+    if found is None:
+        found = _library[key] = _make_primitive(*key)
+    return found
+
+
+def build_library(max_half_cells: int = PRECOMPUTED_HALF_CELLS) -> None:
+    for heading in Direction:
+        for kind in TURN_CURVES:
+            primitive(kind, heading)
+        for half_cells in range(1, max_half_cells + 1):
+            primitive(STRAIGHT, heading, half_cells)
+
+
+def split_path(cells: Sequence[Tuple[int, int]]) -> Tuple[Direction, List[Piece]]:
+    # The heading of the first move and the pieces of a path of neighbouring cells.
+    # The route starts and ends at the centres of the first and last cells, each
+    # cell in between is crossed straight or turned in, and two turns the same way
+    # in neighbouring cells make one U-turn
+    moves: List[int] = []
+    for (x0, y0), (x1, y1) in zip(cells, cells[1:]):
+        direction = VECTOR_DIRECTIONS.get((x1 - x0, y1 - y0))
+        if direction is None:
+            raise ValueError(f"{(x1, y1)} is not next to {(x0, y0)}")
+        moves.append(direction.value)
+    if not moves:
+        return Direction.NORTH, []
+
+    # turns[i] is the turn made in cell i + 1
+    turns = [(after - before) % 4 for before, after in zip(moves, moves[1:])]
+    if 2 in turns:
+        raise ValueError(f"The path turns back on itself at {cells[turns.index(2) + 1]}")
+
+    pieces: List[Piece] = []
+    # From the centre of the first cell to its edge
+    half_cells = 1
+    index = 0
+    while index < len(turns):
+        turn = turns[index]
+        if turn == 0:
+            half_cells += 2
+            index += 1
+            continue
+
+        if half_cells:
+            pieces.append((STRAIGHT, half_cells))
+            half_cells = 0
+        if index + 1 < len(turns) and turns[index + 1] == turn:
+            pieces.append((U_TURN_RIGHT if turn == 1 else U_TURN_LEFT, 0))
+            index += 2
+        else:
+            pieces.append((RIGHT if turn == 1 else LEFT, 0))
+            index += 1
+    # From the edge of the last cell to its centre
+    pieces.append((STRAIGHT, half_cells + 1))
+    return Direction(moves[0]), pieces
+
+
+def route_from_cells(cells: Iterable[Tuple[int, int]]) -> Route:
+    # A Route along a path of cells, such as a solved Path, built from the library
+    # pieces by moving each to where the last one ended
+    cells = list(cells)
+    route = Route()
+    heading, pieces = split_path(cells)
+    if not pieces:
+        return route
+
+    x, y = float(cells[0][0]), float(cells[0][1])
+    curves: List[Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]] = []
+    samples: List[np.ndarray] = []
+    for kind, half_cells in pieces:
+        piece = primitive(kind, heading, half_cells)
+        for p0, p1, p2 in piece.control_points:
+            curves.append(((p0[0] + x, p0[1] + y), (p1[0] + x, p1[1] + y), (p2[0] + x, p2[1] + y)))
+        samples.append(piece.samples + (x, y))
+        x += piece.end[0]
+        y += piece.end[1]
+        heading = piece.heading
+    route.add_curves(curves, np.concatenate(samples))
+    return route
+
+
+build_library()
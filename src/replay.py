@@ -0,0 +1,104 @@
+import json
+import sys
+import time
+import numpy as np
+from typing import Any, Callable, Iterator, List, TextIO, Tuple
+
+from api import Actions, InputData
+
+# A recorded frame, seconds since the first frame and the raw line from the host
+RecordedFrame = Tuple[float, str]
+
+class RecordingStream:
+    # Wraps the input stream and writes every line read from it, with its time,
+    # to a recording file that replay can feed back in later
+    def __init__(self, stream: TextIO, recording: TextIO) -> None:
+        self.stream = stream
+        self.recording = recording
+        self._start: float | None = None
+
+    def readline(self) -> str:
+        line = self.stream.readline()
+        if line.strip():
+            now = time.perf_counter()
+            if self._start is None:
+                self._start = now
+            self.recording.write(json.dumps({"time": now - self._start, "line": line.rstrip("\n")}) + "\n")
+            self.recording.flush()
+        return line
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+def load_recording(path: str) -> List[RecordedFrame]:
+    with open(path, "r") as f:
+        return [(frame["time"], frame["line"]) for frame in map(json.loads, f) if frame]
+
+
+class ReplayResult:
+    def __init__(self, outputs: List[Any], latencies: List[float], duration: float) -> None:
+        # What the controller returned for each frame
+        self.outputs = outputs
+        # Time to turn each frame into encoded output, in seconds
+        self.latencies = np.array(latencies)
+        # Wall clock time of the whole replay, in seconds
+        self.duration = duration
+
+    @property
+    def ticks(self) -> int:
+        return len(self.outputs)
+
+    @property
+    def throughput(self) -> float:
+        # Ticks per second
+        return self.ticks / self.duration if self.duration else 0.0
+
+    def summary(self) -> str:
+        if not self.ticks:
+            return "No frames replayed"
+        mean, p50, p99, worst = (
+            self.latencies.mean() * 1e6, np.percentile(self.latencies, 50) * 1e6,
+            np.percentile(self.latencies, 99) * 1e6, self.latencies.max() * 1e6,
+        )
+        return f"{self.ticks} ticks, {self.throughput:.0f} ticks/s, latency us mean {mean:.1f} p50 {p50:.1f} p99 {p99:.1f} max {worst:.1f}"
+
+
+def replay_lines(recording: List[RecordedFrame], respond: Callable[[str], Any], realtime: bool = False) -> ReplayResult:
+    # Feeds every recorded line to respond in process. As fast as possible by
+    # default, or at the pace it was recorded with realtime
+    outputs = []
+    latencies = []
+    start = time.perf_counter()
+    for frameTime, line in recording:
+        if realtime:
+            delay = start + frameTime - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        tickStart = time.perf_counter()
+        outputs.append(respond(line))
+        latencies.append(time.perf_counter() - tickStart)
+    return ReplayResult(outputs, latencies, time.perf_counter() - start)
+
+
+def replay(recording: List[RecordedFrame], controller: Callable[[InputData], Actions], realtime: bool = False) -> ReplayResult:
+    # Replays into a controller as route.py runs it, timing parsing, the controller
+    # and encoding the actions. outputs holds the Actions of each tick
+    def respond(line: str) -> Actions:
+        actions = controller(InputData.from_json(line))
+        actions.encode()
+        return actions
+
+    return replay_lines(recording, respond, realtime)
+
+
+if __name__ == "__main__":
+    # replay.py frames.jsonl [--realtime], replays a recording into the route controller
+    from route import RouteController, example_route
+
+    result = replay(load_recording(sys.argv[1]), RouteController(example_route()).step, "--realtime" in sys.argv)
+    print(result.summary())
@@ -1,17 +1,111 @@
+import asyncio
 import json
+import math
 import sys
 import numpy as np
-from typing import Tuple, List
-from scipy.spatial.distance import cdist
+from typing import Iterable, Iterator, TextIO, Tuple, List, cast
 
-from api import Actions, InputData, log
+from api import Actions, InputData, INSTRUMENTS, log
+from frames import FrameBuffer
+from replay import RecordingStream
+from runner import run_controller
+
+# Each curve is sampled once when it is added to the route
+SAMPLES_PER_CURVE = 100
+SAMPLE_T = np.linspace(0, 1, SAMPLES_PER_CURVE, endpoint=True)
+
+# Side length of a square in the spatial index over the samples, in cells
+GRID_SIZE = 0.5
+
+
+def _cube_root(value: float) -> float:
+    return math.copysign(abs(value) ** (1 / 3), value)
 
 class Route:
     def __init__(self) -> None :
         self.curve_list: List[Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]] = []
 
+        # Control points of all curves in one array, row i is (p0, p1, p2) of curve i
+        self._control_points = np.empty((16, 3, 2))
+
+        # Samples of all curves in one array, sample j of curve i is row i * SAMPLES_PER_CURVE + j
+        self._samples = np.empty((16 * SAMPLES_PER_CURVE, 2))
+        self._sample_count = 0
+
+        # Upper bound on the distance along any curve between two neighbouring samples
+        self._max_sample_spacing = 0.0
+
+        # Uniform grid, maps a square to the indexes of the samples inside it, and to
+        # the indexes of the curves those samples are on
+        self._grid: dict[Tuple[int, int], List[int]] = {}
+        self._grid_curves: dict[Tuple[int, int], List[int]] = {}
+        self._grid_min = (0, 0)
+        self._grid_max = (0, 0)
+
+    @property
+    def sample_points(self) -> np.ndarray:
+        return self._samples[:self._sample_count]
+
     def add_curve(self, points: Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]) -> None:
-        self.curve_list.append(points)
+        self.add_curves([points])
+
+    def add_curves(self, curves: List[Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]], sample_points: np.ndarray | None = None) -> None:
+        # Adds the curves in order. sample_points are their points at SAMPLE_T as a
+        # (curve, sample, xy) array when they are already known, as for motion
+        # primitives, otherwise they are calculated here
+        if not curves:
+            return
+        first_curve = len(self.curve_list)
+        self.curve_list.extend(curves)
+        curve_count = len(self.curve_list)
+
+        # Grow storage by doubling, so adding curves stays amortised O(1)
+        if curve_count > len(self._control_points):
+            capacity = len(self._control_points)
+            while capacity < curve_count:
+                capacity *= 2
+            control_points = np.empty((capacity, 3, 2))
+            control_points[:first_curve] = self._control_points[:first_curve]
+            self._control_points = control_points
+            samples = np.empty((capacity * SAMPLES_PER_CURVE, 2))
+            samples[:self._sample_count] = self._samples[:self._sample_count]
+            self._samples = samples
+
+        new_points = self._control_points[first_curve:curve_count]
+        new_points[:] = curves
+
+        # The speed along a quadratic curve is largest at one of its ends
+        p0, p1, p2 = new_points[:, 0], new_points[:, 1], new_points[:, 2]
+        max_speed = 2 * max(np.linalg.norm(p1 - p0, axis=1).max(), np.linalg.norm(p2 - p1, axis=1).max())
+        self._max_sample_spacing = max(self._max_sample_spacing, max_speed / (SAMPLES_PER_CURVE - 1))
+
+        if sample_points is None:
+            t = SAMPLE_T[np.newaxis, :, np.newaxis]
+            u = 1 - t
+            sample_points = u * u * p0[:, np.newaxis] + 2 * u * t * p1[:, np.newaxis] + t * t * p2[:, np.newaxis]
+        first_index = self._sample_count
+        self._sample_count = curve_count * SAMPLES_PER_CURVE
+        curve_samples = self._samples[first_index:self._sample_count]
+        curve_samples[:] = sample_points.reshape(-1, 2)
+
+        squares = np.floor(curve_samples / GRID_SIZE).astype(int)
+        # Neighbouring samples are mostly in the same square, so they are added a run at a time
+        changes = (np.flatnonzero(np.any(squares[1:] != squares[:-1], axis=1)) + 1).tolist()
+        starts = [0] + changes
+        for start, end, (square_x, square_y) in zip(starts, changes + [len(squares)], squares[starts].tolist()):
+            self._grid.setdefault((square_x, square_y), []).extend(range(first_index + start, first_index + end))
+            # Curves are added in order, so each list stays sorted without repeats
+            square_curves = self._grid_curves.setdefault((square_x, square_y), [])
+            for curve in range((first_index + start) // SAMPLES_PER_CURVE, (first_index + end - 1) // SAMPLES_PER_CURVE + 1):
+                if not square_curves or square_curves[-1] != curve:
+                    square_curves.append(curve)
+
+        if first_index == 0:
+            self._grid_min = tuple(squares.min(axis=0).tolist())
+            self._grid_max = tuple(squares.max(axis=0).tolist())
+        else:
+            self._grid_min = tuple(np.minimum(self._grid_min, squares.min(axis=0)).tolist())
+            self._grid_max = tuple(np.maximum(self._grid_max, squares.max(axis=0)).tolist())
 
     def calculate_bezier_point(self, t: float, p0: Tuple[float, float], p1: Tuple[float, float], p2: Tuple[float, float]) -> Tuple:
         u = 1 - t
@@ -22,39 +116,214 @@ class Route:
         p += tt * np.array(p2)
         return tuple(p)
 
-    def calculate_errors(self, current_position: Tuple[float, float], current_direction: float) -> Tuple:
-        tangential_offset = None
-        rotational_offset = None
-        closest_curve = None
-        closest_point = None
+    def calculate_bezier_points(self, t: np.ndarray, p0: Tuple[float, float], p1: Tuple[float, float], p2: Tuple[float, float]) -> np.ndarray:
+        # calculate_bezier_point for an array of t, returns one row per t
+        t = t[:, np.newaxis]
+        u = 1 - t
+        points: np.ndarray = u * u * np.array(p0) + 2 * u * t * np.array(p1) + t * t * np.array(p2)
+        return points
+
+    def _square(self, position: Tuple[float, float]) -> Tuple[int, int]:
+        return math.floor(position[0] / GRID_SIZE), math.floor(position[1] / GRID_SIZE)
+
+    def _max_ring(self, square_x: int, square_y: int) -> int:
+        # Rings further out than this contain no samples
+        return max(
+            square_x - self._grid_min[0], self._grid_max[0] - square_x,
+            square_y - self._grid_min[1], self._grid_max[1] - square_y,
+        )
+
+    def _ring_samples(self, square_x: int, square_y: int, ring: int, grid: dict[Tuple[int, int], List[int]] | None = None) -> List[int]:
+        # Indexes of the samples in the squares exactly ring squares away, or of the
+        # curves when given _grid_curves
+        if grid is None:
+            grid = self._grid
+        indexes: List[int] = []
+        for x in range(square_x - ring, square_x + ring + 1):
+            indexes.extend(grid.get((x, square_y - ring), ()))
+            if ring != 0:
+                indexes.extend(grid.get((x, square_y + ring), ()))
+        for y in range(square_y - ring + 1, square_y + ring):
+            indexes.extend(grid.get((square_x - ring, y), ()))
+            indexes.extend(grid.get((square_x + ring, y), ()))
+        return indexes
+
+    def _closest_sample(self, current_position: Tuple[float, float]) -> Tuple[int, float]:
+        # Search rings of grid squares outwards from the square holding the position.
+        # Samples in ring r + 1 are at least r * GRID_SIZE away, so stop once the
+        # closest sample found is nearer than that
+        position = np.array(current_position, dtype=float)
+        square_x, square_y = self._square(current_position)
+        max_ring = self._max_ring(square_x, square_y)
+
+        best_index = -1
+        best_distance = math.inf
+        ring = 0
+        while ring <= max_ring:
+            indexes = self._ring_samples(square_x, square_y, ring)
+            if indexes:
+                # Sorted so ties go to the earliest curve on the route
+                index_array = np.sort(np.array(indexes))
+                offsets = self._samples[index_array] - position
+                distances = np.sqrt(np.einsum("ij,ij->i", offsets, offsets))
+                closest = int(np.argmin(distances))
+                distance = float(distances[closest])
+                index = int(index_array[closest])
+                if distance < best_distance or (distance == best_distance and index < best_index):
+                    best_index = index
+                    best_distance = distance
+
+            if best_distance <= ring * GRID_SIZE:
+                break
+            ring += 1
+
+        return best_index, best_distance
+
+    def _closest_route_point(self, current_position: Tuple[float, float]) -> Tuple[float, int, float, np.ndarray]:
+        # Exact closest point on the whole route, as _closest_point returns it. Every
+        # point of a curve is within half a sample spacing of one of its samples, so a
+        # curve with no samples in rings 0 to r is at least r * GRID_SIZE minus that
+        # away. The curves in the first two rings are projected onto, then those out to
+        # the ring that bound needs for the closest point found, with no sample distances
+        square_x, square_y = self._square(current_position)
+        max_ring = self._max_ring(square_x, square_y)
+        margin = self._max_sample_spacing / 2
+
+        projected: set[int] = set()
+        best: Tuple[float, int, float, np.ndarray] | None = None
+        ring = 0
+        last_ring = 1
+        while True:
+            curves: List[int] = []
+            while ring <= min(last_ring, max_ring):
+                curves.extend(self._ring_samples(square_x, square_y, ring, self._grid_curves))
+                ring += 1
+            new_curves = sorted(set(curves) - projected)
+            if new_curves:
+                projected.update(new_curves)
+                match = self._closest_point(current_position, new_curves)
+                # Ties go to the earliest curve on the route
+                if best is None or match[0] < best[0] or (match[0] == best[0] and match[1] < best[1]):
+                    best = match
+
+            if ring > max_ring:
+                break
+            if best is None:
+                last_ring = ring
+                continue
+            last_ring = math.ceil((best[0] + margin) / GRID_SIZE)
+            if last_ring < ring:
+                break
+
+        assert best is not None
+        return best
+
+    def _project_onto_curve(self, curve_index: int, x: float, y: float) -> Tuple[float, float, float, float]:
+        # Exact closest point on one curve, as (squared distance, t, offset from the
+        # position to the point). With A = p0 - 2 p1 + p2,
+        # B = p1 - p0 and M = p0 - position, the curve relative to the position is
+        # A t^2 + 2 B t + M, and the distance is stationary where (A t^2 + 2 B t + M) . (A t + B) = 0.
+        # Only a handful of curves are projected onto per call, so this is plain float
+        # arithmetic, numpy's per call overhead would cost far more than the solve
+        (x0, y0), (x1, y1), (x2, y2) = self._control_points[curve_index].tolist()
+        ax, ay = x0 - 2 * x1 + x2, y0 - 2 * y1 + y2
+        bx, by = x1 - x0, y1 - y0
+        mx, my = x0 - x, y0 - y
+
+        a = ax * ax + ay * ay
+        b = 3 * (ax * bx + ay * by)
+        c = 2 * (bx * bx + by * by) + ax * mx + ay * my
+        d = bx * mx + by * my
+
+        roots: List[float] = []
+        if a != 0:
+            # Cardano on the depressed cubic s^3 + p s + q, with t = s - b / 3a
+            b_n, c_n, d_n = b / a, c / a, d / a
+            p = c_n - b_n * b_n / 3
+            q = 2 * b_n ** 3 / 27 - b_n * c_n / 3 + d_n
+            shift = -b_n / 3
+            discriminant = q * q / 4 + p ** 3 / 27
+            if discriminant > 0:
+                # One real root
+                root_discriminant = math.sqrt(discriminant)
+                roots.append(_cube_root(-q / 2 + root_discriminant) + _cube_root(-q / 2 - root_discriminant) + shift)
+            else:
+                # Three real roots
+                radius = 2 * math.sqrt(max(-p / 3, 0))
+                angle = math.acos(min(max(3 * q / (p * radius), -1), 1)) / 3 if p * radius != 0 else 0
+                roots.extend(radius * math.cos(angle - 2 * math.pi * k / 3) + shift for k in range(3))
+        if c != 0:
+            # Straight curves with p1 at the middle have a = b = 0, leaving c t + d = 0
+            roots.append(-d / c)
+
+        candidates = [0.0, 1.0]
+        for root in roots:
+            t = 0.0 if root < 0 else 1.0 if root > 1 else root
+            candidates.append(t)
+            # A polished copy from Newton steps cleans up near degenerate cubics
+            for _ in range(2):
+                slope = (3 * a * t + 2 * b) * t + c
+                if slope != 0:
+                    t -= (((a * t + b) * t + c) * t + d) / slope
+                    t = 0.0 if t < 0 else 1.0 if t > 1 else t
+            candidates.append(t)
+
+        # Every candidate is a point on the curve, keep the closest one
+        best = (math.inf, 0.0, 0.0, 0.0)
+        for t in candidates:
+            offset_x = (ax * t + 2 * bx) * t + mx
+            offset_y = (ay * t + 2 * by) * t + my
+            distance = offset_x * offset_x + offset_y * offset_y
+            if distance < best[0]:
+                best = (distance, t, offset_x, offset_y)
+        return best
+
+    def _closest_point(self, current_position: Tuple[float, float], curve_indexes: Iterable[int]) -> Tuple[float, int, float, np.ndarray]:
+        # Exact closest point among the given curves, as (distance, curve index, t, point).
+        # Ties go to the curve given first
+        x, y = float(current_position[0]), float(current_position[1])
+        best = (math.inf, 0.0, 0.0, 0.0)
+        best_curve = -1
+        for curve_index in curve_indexes:
+            projection = self._project_onto_curve(curve_index, x, y)
+            if projection[0] < best[0]:
+                best = projection
+                best_curve = curve_index
+        distance, t, offset_x, offset_y = best
+        return math.sqrt(distance), best_curve, t, np.array((x + offset_x, y + offset_y))
 
-        for curve in self.curve_list:
-            # Calculate distance from current position to each point on the curve
-            curve_points = np.array([self.calculate_bezier_point(t, *curve) for t in np.linspace(0, 1, 100, endpoint=True)])
-            distances = cdist([current_position], curve_points)
-            closest_point_index = np.argmin(distances)
+    def _rotational_offset(self, curve_index: int, t: float, current_direction: float) -> float:
+        # Calculate the tangent at the closest point on the curve
+        p0, p1, p2 = self._control_points[curve_index]
+        tangent = -2 * (1 - t) * p0 + (2 - 4 * t) * p1 + 2 * t * p2
 
-            # Calculate tangential offset (minimum distance to the curve)
-            if tangential_offset is None or distances[0, closest_point_index] < tangential_offset:
-                tangential_offset = distances[0, closest_point_index]
-                closest_point = curve_points[closest_point_index]
+        # Calculate the direction that the mouse should be in
+        rotational_offset = current_direction - float(np.arctan2(tangent[1], tangent[0]))
+        # Normalize the direction to be between -pi and pi
+        if rotational_offset > np.pi:
+            rotational_offset -= 2 * np.pi
+        elif rotational_offset < -np.pi:
+            rotational_offset += 2 * np.pi
+        return rotational_offset
 
-                # Calculate the tangent at the closest point on the curve
-                t = closest_point_index / 100  # Because np.linspace(0, 1, 100) was used
-                p0, p1, p2 = curve
-                closest_curve = curve
-                # tangent = 2 * (1 - t) * np.array(p1) - 2 * t * np.array(p0) + 2 * t * np.array(p2)
-                tangent = -2 * (1 - t) * np.array(p0) + (2 - 4 * t) * np.array(p1) + 2 * t * np.array(p2)
+    @INSTRUMENTS.timed("calculate_errors")
+    def calculate_errors(self, current_position: Tuple[float, float], current_direction: float, analytic: bool = False) -> Tuple:
+        # With analytic, the closest point is solved exactly on the nearby curves
+        # instead of taken from the precomputed samples
+        if not self.curve_list:
+            return None, None, None, None
 
-                # Calculate the direction that the mouse should be in
-                rotational_offset = current_direction - np.arctan2(tangent[1], tangent[0]) 
-                # Normalize the direction to be between -pi and pi
-                if rotational_offset > np.pi:
-                    rotational_offset -= 2 * np.pi
-                elif rotational_offset < -np.pi:
-                    rotational_offset += 2 * np.pi
+        if analytic:
+            tangential_offset, curve_index, t, closest_point = self._closest_route_point(current_position)
+        else:
+            # Tangential offset is the minimum distance to the route
+            closest_point_index, tangential_offset = self._closest_sample(current_position)
+            curve_index = closest_point_index // SAMPLES_PER_CURVE
+            t = SAMPLE_T[closest_point_index % SAMPLES_PER_CURVE]
+            closest_point = self._samples[closest_point_index].copy()
 
-        return tangential_offset, rotational_offset, closest_point, closest_curve
+        rotational_offset = self._rotational_offset(curve_index, t, current_direction)
+        return tangential_offset, rotational_offset, closest_point, self.curve_list[curve_index]
 
 
 
@@ -62,10 +331,91 @@ class Route:
         return json.dumps({"curveList" : self.curve_list})
 
 
-if __name__ == "__main__":
-    sys.stdout.write('Ready\n')
-    sys.stdout.flush()
+class RouteController:
+    # Turns each sensor frame into the actions for that tick while following a route
+    def __init__(self, route: Route) -> None:
+        self.route = route
+        self.tracker = RouteTracker(route)
+        self.frames = FrameBuffer()
+        self.first_time = True
+
+    @INSTRUMENTS.timed("tick")
+    def step(self, inputData: InputData) -> Actions:
+        self.frames.append(inputData)
+        return self._act(inputData.actualPositionX, inputData.actualPositionY, inputData.actualDirectionRad)
+
+    @INSTRUMENTS.timed("tick")
+    def step_line(self, line: str) -> Actions:
+        # As step, from the host's line parsed straight into the frame history, so
+        # no InputData is made per tick
+        self.frames.append_json(line)
+        return self._act(*self.frames.pose())
+
+    def _act(self, x: float, y: float, direction: float) -> Actions:
+        actions = Actions()
+        if self.first_time:
+            actions.displayRoute(self.route)
+            self.first_time = False
+
+        tangentialError, directionError, closestPoint, closestCurve = self.tracker.update((x, y), direction)
+        actions.debugPrint(f"Tagential error: {tangentialError}, Direction error: {directionError * 180 / np.pi}, Direction of Mouse: {direction * 180 / np.pi}")
+
+        SPEED = 0.1, 0.1
+
+        # Adjust speed based on tangentail error error
+
+
+        return actions
+
+
+class RouteTracker:
+    # Follows the mouse along a route between frames. The mouse only moves a fraction
+    # of a cell per frame, so the closest point is searched for on the last matched
+    # curve and the few after it, and the whole route is only searched again when
+    # that match is further away than max_error
+    def __init__(self, route: Route, window: int = 2, max_error: float = 0.25) -> None:
+        self.route = route
+        self.window = window
+        self.max_error = max_error
+
+        self.curve_index: int | None = None
+        self.t = 0.0
+        self.global_searches = 0
 
+    def reset(self) -> None:
+        self.curve_index = None
+        self.t = 0.0
+
+    @INSTRUMENTS.timed("track")
+    def update(self, current_position: Tuple[float, float], current_direction: float) -> Tuple:
+        route = self.route
+        if not route.curve_list:
+            return None, None, None, None
+
+        match = None
+        if self.curve_index is not None:
+            # One curve back, in case the mouse overshot the end of the previous match
+            first = max(self.curve_index - 1, 0)
+            last = min(self.curve_index + self.window + 1, len(route.curve_list))
+            match = route._closest_point(current_position, range(first, last))
+            if match[0] > self.max_error:
+                match = None
+
+        if match is None:
+            self.global_searches += 1
+            match = route._closest_route_point(current_position)
+
+        tangential_offset, self.curve_index, self.t, closest_point = match
+        rotational_offset = route._rotational_offset(self.curve_index, self.t, current_direction)
+        return tangential_offset, rotational_offset, closest_point, route.curve_list[self.curve_index]
+
+    def track(self, frames: Iterable[InputData]) -> Iterator[Tuple[InputData, Tuple]]:
+        # Yields each frame with its errors, as calculate_errors would return them
+        for frame in frames:
+            yield frame, self.update((frame.actualPositionX, frame.actualPositionY), frame.actualDirectionRad)
+
+
+def example_route() -> Route:
     route = Route()
     route.add_curve(((0, 0), (0, 1), (0, 2.5)))
     route.add_curve(((0, 2.5), (0, 3), (0.5, 3)))
@@ -78,27 +428,23 @@ if __name__ == "__main__":
     route.add_curve(((0.5, 6), (0, 6), (0, 6.5)))
     route.add_curve(((0, 6.5), (0, 7), (0.5, 7)))
     route.add_curve(((0.5, 7), (1, 7), (1, 7.5)))
+    return route
 
-    first_time = True
-
-    while(True):
-        inputData = InputData.get_from_unity()
-        
-        actions = Actions()
-        if first_time:
-            actions.displayRoute(route)
-            first_time = False
-        
-        tangentialError, directionError, closestPoint, closestCurve = route.calculate_errors((inputData.actualPositionX, inputData.actualPositionY), inputData.actualDirectionRad)
-        actions.debugPrint(f"Tagential error: {tangentialError}, Direction error: {directionError * 180 / np.pi}, Direction of Mouse: {inputData.actualDirectionRad * 180 / np.pi}")
-        
-        SPEED = 0.1, 0.1
-
-        # Adjust speed based on tangentail error error
-        
-
-        actions.send()
 
+if __name__ == "__main__":
+    sys.stdout.write('Ready\n')
+    sys.stdout.flush()
 
+    # route.py --record frames.jsonl saves every frame from the host for replay.py
+    input_stream: TextIO = sys.stdin
+    if "--record" in sys.argv:
+        input_stream = cast(TextIO, RecordingStream(sys.stdin, open(sys.argv[sys.argv.index("--record") + 1], "w")))
 
+    # Lines go to the controller as they are, it parses them into its frame history
+    controller = RouteController(example_route())
+    stats = asyncio.run(run_controller(controller.step_line, input_stream, parse=str))
 
+    # stdout carries the protocol, so the summary goes to stderr
+    sys.stderr.write(f"Ticks: {stats.ticks}, dropped frames: {stats.frames_dropped}, mean latency: {stats.mean_latency * 1000:.2f} ms, max latency: {stats.max_latency * 1000:.2f} ms\n")
+    if INSTRUMENTS.enabled:
+        INSTRUMENTS.dump()
@@ -0,0 +1,160 @@
+import asyncio
+import sys
+import threading
+import time
+from typing import Any, Callable, Generic, TextIO, Tuple, TypeVar
+
+from api import Actions, InputData
+
+# What a frame's line is parsed into before the controller gets it
+Frame = TypeVar("Frame")
+
+class RunnerStats:
+    def __init__(self) -> None:
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.ticks = 0
+
+        # Time from reading a frame to its actions being written, in seconds
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.ticks if self.ticks else 0.0
+
+    def add_latency(self, latency: float) -> None:
+        self.ticks += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.last_latency = latency
+
+
+class LatestFrame(Generic[Frame]):
+    # One slot buffer between the reader and the controller. A frame that arrives
+    # before the previous one was taken replaces it, so the controller always acts
+    # on the newest sensor data instead of working through a backlog. Frames are
+    # kept with the perf_counter time their line was read
+    def __init__(self, stats: RunnerStats) -> None:
+        self.stats = stats
+        self._frame: Tuple[Frame, float] | None = None
+        self._closed = False
+        self._ready = asyncio.Event()
+
+    def put(self, frame: Tuple[Frame, float]) -> None:
+        if self._frame is not None:
+            self.stats.frames_dropped += 1
+        self._frame = frame
+        self._ready.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
+
+    async def get(self) -> Tuple[Frame, float] | None:
+        # The newest frame, or None once the input has ended and every frame was taken
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        frame = self._frame
+        self._frame = None
+        return frame
+
+
+async def _read_frames(stream: TextIO, parse: Callable[[str], Frame], latest: LatestFrame[Frame]) -> None:
+    # Lines are read on a daemon thread and handed to the loop. A readline in the
+    # loop's executor would keep asyncio.run from returning until the host sends
+    # another line, so a failing controller would hang the runner instead of exiting
+    loop = asyncio.get_running_loop()
+    ended = loop.create_future()
+
+    def deliver(line: str, received: float) -> None:
+        if ended.done() or not line.strip():
+            return
+        try:
+            frame = parse(line)
+        except Exception as error:
+            end(error)
+            return
+        latest.stats.frames_received += 1
+        latest.put((frame, received))
+
+    def end(error: Exception | None) -> None:
+        if ended.done():
+            return
+        if error is None:
+            ended.set_result(None)
+        else:
+            ended.set_exception(error)
+
+    def read() -> None:
+        error: Exception | None = None
+        try:
+            for line in iter(stream.readline, ""):
+                loop.call_soon_threadsafe(deliver, line, time.perf_counter())
+        except Exception as read_error:
+            error = read_error
+        try:
+            loop.call_soon_threadsafe(end, error)
+        except RuntimeError:
+            # The loop closed after the run was cancelled
+            pass
+
+    threading.Thread(target=read, name="frame reader", daemon=True).start()
+    try:
+        await ended
+    finally:
+        latest.close()
+
+
+async def _compute(controller: Callable[[Frame], Actions], latest: LatestFrame[Frame], outgoing: "asyncio.Queue[Tuple[Actions, float] | None]") -> None:
+    try:
+        while True:
+            frame = await latest.get()
+            if frame is None:
+                break
+            data, received = frame
+            # Off the loop, so the reader keeps taking frames off the pipe while the
+            # controller runs and only the newest is left for the next tick
+            actions = await asyncio.to_thread(controller, data)
+            # Waits while the previous tick is still being written, newer frames keep replacing this one meanwhile
+            await outgoing.put((actions, received))
+    finally:
+        await outgoing.put(None)
+
+
+async def _write_actions(stream: TextIO, outgoing: "asyncio.Queue[Tuple[Actions, float] | None]", stats: RunnerStats) -> None:
+    while True:
+        item = await outgoing.get()
+        if item is None:
+            break
+        actions, received = item
+        await asyncio.to_thread(actions.write, stream)
+        stats.add_latency(time.perf_counter() - received)
+
+
+async def run_controller(controller: Callable[[Any], Actions], input_stream: TextIO = sys.stdin, output_stream: TextIO = sys.stdout, parse: Callable[[str], Any] = InputData.from_json) -> RunnerStats:
+    # Runs controller on every frame read from input_stream until it ends, writing
+    # the actions it returns to output_stream. Reading, computing and writing run as
+    # separate tasks, the controller on a worker thread, and frames that arrive while
+    # a tick is running are dropped for the newest one. Each line is parsed into
+    # what the controller takes, an InputData unless parse says otherwise
+    stats = RunnerStats()
+    latest: LatestFrame[Any] = LatestFrame(stats)
+    outgoing: "asyncio.Queue[Tuple[Actions, float] | None]" = asyncio.Queue(maxsize=1)
+
+    tasks = [
+        asyncio.ensure_future(_read_frames(input_stream, parse, latest)),
+        asyncio.ensure_future(_compute(controller, latest, outgoing)),
+        asyncio.ensure_future(_write_actions(output_stream, outgoing, stats)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # When one fails the others are stopped rather than left reading and writing
+        for task in tasks:
+            task.cancel()
+    return stats
@@ -0,0 +1,366 @@
+import contextlib
+import json
+import math
+import struct
+import subprocess
+import sys
+import time
+import numpy as np
+from typing import Any, Callable, Dict, List, Tuple
+
+from api import ACTION_TEMPLATES, CELL_SIZE, Actions, Framing, InputData, PythonActionType
+
+
+# Wall bits of a cell value, matching cell.py
+NORTH_WALL = 1 << 3
+WEST_WALL = 1 << 2
+EAST_WALL = 1 << 1
+SOUTH_WALL = 1 << 0
+
+# Sensor name -> angle from the heading, in the order the host sends them
+SENSOR_ANGLES: Tuple[Tuple[str, float], ...] = (
+    ("leftDistance", math.pi / 2),
+    ("left45Distance", math.pi / 4),
+    ("forwardDistance", 0.0),
+    ("right45Distance", -math.pi / 4),
+    ("rightDistance", -math.pi / 2),
+)
+
+# A decoded action, its type and body
+SimulatorAction = Tuple[int, Dict[str, Any]]
+
+
+def load_maze(path: str) -> List[List[int]]:
+    # Wall bits of every cell, indexed cells[x][y], from a file saved like outputs/maze.json
+    with open(path, "r") as f:
+        cells: List[List[int]] = json.load(f)["cells"]
+    return cells
+
+
+def decode_actions(line: str) -> List[SimulatorAction]:
+    # The actions in a JSON line written by Actions.encode
+    return [(action["actionType"], json.loads(action["jsonBody"])) for action in map(json.loads, json.loads(line)["actions"])]
+
+
+def decode_binary_actions(frame: bytes) -> List[SimulatorAction]:
+    # The actions in a frame written by Actions.encodeBinary, without its length prefix
+    (count,) = struct.unpack_from("<H", frame)
+    offset = 2
+    actions = []
+    for _ in range(count):
+        action_type = frame[offset]
+        if action_type in ACTION_TEMPLATES:
+            template = ACTION_TEMPLATES[action_type]
+            values = template.binary.unpack_from(frame, offset)[1:]
+            actions.append((action_type, dict(zip(template.fields, values))))
+            offset += template.binary.size
+        else:
+            (length,) = struct.unpack_from("<I", frame, offset + 1)
+            actions.append((action_type, json.loads(frame[offset + 5:offset + 5 + length])))
+            offset += 5 + length
+    return actions
+
+
+class SimulatorStats:
+    def __init__(self) -> None:
+        self.ticks = 0
+        self.crashes = 0
+        self.actions = 0
+        # Simulated and wall clock time, in seconds
+        self.simulated_time = 0.0
+        self.wall_time = 0.0
+
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def speedup(self) -> float:
+        # How much faster than real time the run was
+        return self.simulated_time / self.wall_time if self.wall_time else 0.0
+
+    def summary(self) -> str:
+        return f"{self.ticks} ticks, {self.actions} actions, {self.crashes} crashes, {self.ticks_per_second:.0f} ticks/s, {self.speedup:.1f}x real time"
+
+
+class Simulator:
+    # Stands in for the Unity host. Each tick it sends a sensor frame, reads back one
+    # batch of actions and applies it, then moves the mouse for dt seconds of
+    # simulated time. The mouse starts in the middle of cell (0, 0) facing north,
+    # and cell (x, y) is centred on (x, y) * CELL_SIZE
+    def __init__(
+        self,
+        cells: List[List[int]],
+        dt: float = 1 / 60,
+        wheel_base: float = 7.0,
+        body_radius: float = 4.0,
+        velocity_scale: float = CELL_SIZE * 5,
+        sensor_range: float = CELL_SIZE * 16,
+        sensor_noise: float = 0.0,
+        seed: int = 0,
+        framing: str = "json",
+    ) -> None:
+        self.cells = cells
+        self.width = len(cells)
+        self.height = len(cells[0])
+
+        self.dt = dt
+        # Distance between the wheels and radius of the body, in simulator units
+        self.wheel_base = wheel_base
+        self.body_radius = body_radius
+        # Simulator units per second for a SET_VELOCITIES value of 1
+        self.velocity_scale = velocity_scale
+        self.sensor_range = sensor_range
+        self.sensor_noise = sensor_noise
+        self.rng = np.random.default_rng(seed)
+        self.framing = framing
+
+        # Pose in simulator units and radians from the x axis
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = math.pi / 2
+        self.left_velocity = 0.0
+        self.right_velocity = 0.0
+        # Whether the mouse is pressed against a wall, so a crash is only counted once
+        self.blocked = False
+
+        # What the host would be showing
+        self.cell_values: Dict[Tuple[int, int], int] = {}
+        self.explored: Dict[Tuple[int, int], bool] = {}
+        self.walls: Dict[Tuple[int, int], int] = {}
+        self.colors: Dict[Tuple[int, int], str] = {}
+        self.route: Dict[str, Any] | None = None
+        self.messages: List[str] = []
+
+        self.terminated = False
+        self.stats = SimulatorStats()
+
+    def has_wall(self, x: int, y: int, wall: int) -> bool:
+        # Either side of a wall is enough, as a saved maze may only know one of them.
+        # Everything outside the maze counts as wall
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return True
+        if self.cells[x][y] & wall:
+            return True
+        if wall == NORTH_WALL:
+            return y + 1 >= self.height or bool(self.cells[x][y + 1] & SOUTH_WALL)
+        if wall == SOUTH_WALL:
+            return y == 0 or bool(self.cells[x][y - 1] & NORTH_WALL)
+        if wall == EAST_WALL:
+            return x + 1 >= self.width or bool(self.cells[x + 1][y] & WEST_WALL)
+        return x == 0 or bool(self.cells[x - 1][y] & EAST_WALL)
+
+    def cast_ray(self, x: float, y: float, angle: float) -> float:
+        # Distance from (x, y) along angle to the first wall, in simulator units.
+        # Walks the cells the ray passes through, one cell edge at a time
+        gx = x / CELL_SIZE + 0.5
+        gy = y / CELL_SIZE + 0.5
+        dx = math.cos(angle)
+        dy = math.sin(angle)
+        cx = math.floor(gx)
+        cy = math.floor(gy)
+        max_distance = self.sensor_range / CELL_SIZE
+
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # Ray length to the next vertical and horizontal cell edge, and between edges
+        next_x = ((cx + 1 - gx) if dx > 0 else (gx - cx)) / abs(dx) if abs(dx) > 1e-12 else math.inf
+        next_y = ((cy + 1 - gy) if dy > 0 else (gy - cy)) / abs(dy) if abs(dy) > 1e-12 else math.inf
+        delta_x = 1 / abs(dx) if abs(dx) > 1e-12 else math.inf
+        delta_y = 1 / abs(dy) if abs(dy) > 1e-12 else math.inf
+
+        while True:
+            if next_x < next_y:
+                distance = next_x
+                if distance >= max_distance:
+                    return self.sensor_range
+                if self.has_wall(cx, cy, EAST_WALL if step_x > 0 else WEST_WALL):
+                    return distance * CELL_SIZE
+                cx += step_x
+                next_x += delta_x
+            else:
+                distance = next_y
+                if distance >= max_distance:
+                    return self.sensor_range
+                if self.has_wall(cx, cy, NORTH_WALL if step_y > 0 else SOUTH_WALL):
+                    return distance * CELL_SIZE
+                cy += step_y
+                next_y += delta_y
+
+    def frame(self) -> Dict[str, Any]:
+        # The sensor frame the host sends for the current pose
+        frame: Dict[str, Any] = {}
+        for name, angle in SENSOR_ANGLES:
+            distance = self.cast_ray(self.x, self.y, self.heading + angle)
+            if self.sensor_noise:
+                distance = max(0.0, distance + self.rng.normal(0, self.sensor_noise))
+            frame[name] = distance
+        frame["directionRad"] = self.heading + (self.rng.normal(0, self.sensor_noise / CELL_SIZE) if self.sensor_noise else 0.0)
+        frame["actualPositionX"] = self.x
+        frame["actualPositionY"] = self.y
+        frame["actualDirectionRad"] = self.heading
+        if self.stats.ticks == 0 and self.framing != "json":
+            frame["framing"] = self.framing
+        return frame
+
+    def frame_line(self) -> str:
+        return json.dumps(self.frame())
+
+    def apply(self, actions: List[SimulatorAction]) -> None:
+        self.stats.actions += len(actions)
+        for action_type, body in actions:
+            match action_type:
+                case PythonActionType.SET_VELOCITIES.value:
+                    self.left_velocity = body["left"]
+                    self.right_velocity = body["right"]
+                case PythonActionType.SET_EXPLORED.value:
+                    self.explored[(body["x"], body["y"])] = body["explored"]
+                case PythonActionType.SET_CELL_VALUE.value:
+                    self.cell_values[(body["x"], body["y"])] = body["value"]
+                case PythonActionType.DEBUG.value:
+                    self.messages.append(body["message"])
+                case PythonActionType.TERMINATE.value:
+                    self.terminated = True
+                case PythonActionType.DISPLAY_ROUTE.value:
+                    self.route = body
+                case PythonActionType.SET_WALL.value:
+                    wall = (WEST_WALL, NORTH_WALL, EAST_WALL, SOUTH_WALL)[body["direction"]]
+                    self.walls[(body["x"], body["y"])] = self.walls.get((body["x"], body["y"]), 0) | wall
+                case PythonActionType.SET_COLOR.value:
+                    if body["color"]:
+                        self.colors[(body["x"], body["y"])] = body["color"]
+                    else:
+                        self.colors.pop((body["x"], body["y"]), None)
+                case PythonActionType.CLEAR_ALL_COLOR.value:
+                    self.colors.clear()
+
+    def apply_response(self, response: str | bytes) -> None:
+        # A line from Actions.encode or a frame from Actions.encodeBinary
+        if isinstance(response, bytes):
+            self.apply(decode_binary_actions(response[4:]))
+        else:
+            self.apply(decode_actions(response))
+
+    def move(self) -> None:
+        # Differential drive over one tick, following the arc exactly
+        left = self.left_velocity * self.velocity_scale
+        right = self.right_velocity * self.velocity_scale
+        speed = (left + right) / 2
+        turn_rate = (right - left) / self.wheel_base
+        dt = self.dt
+
+        if abs(turn_rate) < 1e-9:
+            dx = speed * math.cos(self.heading) * dt
+            dy = speed * math.sin(self.heading) * dt
+        else:
+            radius = speed / turn_rate
+            new_heading = self.heading + turn_rate * dt
+            dx = radius * (math.sin(new_heading) - math.sin(self.heading))
+            dy = radius * (math.cos(self.heading) - math.cos(new_heading))
+
+        # A mouse that would hit a wall stops in front of it
+        travel = math.hypot(dx, dy)
+        if travel > 0:
+            clearance = self.cast_ray(self.x, self.y, math.atan2(dy, dx)) - self.body_radius
+            if travel > clearance:
+                scale = max(0.0, clearance) / travel
+                dx *= scale
+                dy *= scale
+                self.left_velocity = self.right_velocity = 0.0
+                if not self.blocked:
+                    self.stats.crashes += 1
+            self.blocked = travel > clearance
+
+        self.x += dx
+        self.y += dy
+        self.heading = (self.heading + turn_rate * dt + math.pi) % (2 * math.pi) - math.pi
+        self.stats.simulated_time += dt
+
+    def run(self, respond: Callable[[str], str | bytes], max_ticks: int = 10000) -> SimulatorStats:
+        # Runs in process against respond, which gets each frame line and returns what
+        # the controller would write, until it terminates or max_ticks have passed
+        start = time.perf_counter()
+        while not self.terminated and self.stats.ticks < max_ticks:
+            self.apply_response(respond(self.frame_line()))
+            self.stats.ticks += 1
+            self.move()
+        self.stats.wall_time = time.perf_counter() - start
+        return self.stats
+
+    def run_process(self, command: List[str], max_ticks: int = 10000) -> SimulatorStats:
+        # Runs a controller program, such as python route.py, over stdin and stdout like
+        # the host does. Lines before Ready and lines that are not JSON are log output
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=False)
+        assert process.stdin is not None and process.stdout is not None
+        stdin, stdout = process.stdin, process.stdout
+
+        def read_line() -> str:
+            while True:
+                line = stdout.readline()
+                if not line:
+                    raise EOFError("Controller exited")
+                text = line.decode()
+                if text.startswith("{"):
+                    return text
+                self.messages.append(text.rstrip("\n"))
+
+        def respond(frame: str) -> str | bytes:
+            try:
+                stdin.write(frame.encode() + b"\n")
+                stdin.flush()
+            except BrokenPipeError:
+                raise EOFError("Controller exited")
+            if self.framing == "binary":
+                header = stdout.read(4)
+                if len(header) < 4:
+                    raise EOFError("Controller exited")
+                return header + stdout.read(struct.unpack("<I", header)[0])
+            return read_line()
+
+        try:
+            # A controller that exits before it is ready never ran, which is an error
+            # rather than the end of a run
+            while True:
+                line = stdout.readline()
+                if not line:
+                    raise EOFError(f"Controller exited with code {process.wait()} before printing Ready")
+                if b"Ready" in line:
+                    break
+                self.messages.append(line.decode().rstrip("\n"))
+            try:
+                return self.run(respond, max_ticks)
+            except EOFError:
+                return self.stats
+        finally:
+            # Closing stdin flushes it, which fails once the controller is gone
+            with contextlib.suppress(BrokenPipeError):
+                stdin.close()
+            stdout.close()
+            process.wait()
+
+
+def controller_responder(controller: Callable[[InputData], Actions]) -> Callable[[str], str | bytes]:
+    # Wraps a controller such as RouteController.step so it answers frame lines,
+    # going through the same parsing and encoding as it would over stdin and stdout
+    def respond(line: str) -> str | bytes:
+        actions = controller(InputData.from_json(line))
+        if Actions.framing == Framing.BINARY:
+            return actions.encodeBinary()
+        return actions.encode()
+    return respond
+
+
+if __name__ == "__main__":
+    # simulator.py maze.json [ticks] [command ...], runs the route controller in
+    # process, or the given command as a separate program
+    simulator = Simulator(load_maze(sys.argv[1]))
+    max_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    if len(sys.argv) > 3:
+        try:
+            stats = simulator.run_process(sys.argv[3:], max_ticks)
+        except EOFError as error:
+            sys.exit(str(error))
+    else:
+        from route import RouteController, example_route
+        stats = simulator.run(controller_responder(RouteController(example_route()).step), max_ticks)
+    print(stats.summary())
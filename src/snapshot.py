@@ -0,0 +1,177 @@
+import json
+import mmap
+from functools import cached_property
+import struct
+import sys
+import numpy as np
+from typing import Any, Iterable, Sequence
+
+from src.path import Path
+
+# Binary snapshot of a maze, laid out to be read in place from a mapped file
+# instead of parsed. Little endian, offsets from the start of the file:
+#   header  HEADER
+#   cells   width * height uint8 x major, wall bits in the low nibble and EXPLORED_BIT
+#   flood   width * height int32 x major, distances to the goal cells, 4 byte aligned.
+#           Left out, with a zero offset, when no flood was saved
+#   goal    (x, y) uint16 pairs, the cells the flood is to
+#   routes  ROUTE entries, then the moves of every route packed as Path stores them
+MAGIC = b"MZSN"
+VERSION = 1
+
+# magic, version, width, height, goal cells, routes, flood offset, goal offset, routes offset
+HEADER = struct.Struct("<4sHHHHIIII")
+
+# start x, start y, number of moves, offset of the packed moves
+ROUTE = struct.Struct("<HHII")
+
+EXPLORED_BIT = 1 << 4
+WALL_MASK = 0xF
+
+
+class Snapshot:
+    # A snapshot read from bytes or a mapped file. rawCells and flood are numpy
+    # views into the buffer, nothing is copied to open it. cells and explored are
+    # split out of rawCells into arrays of their own the first time they are used,
+    # and routes are only decoded when asked for
+    def __init__(self, buffer : Any) -> None:
+        if len(buffer) < HEADER.size:
+            raise ValueError("Too short for a maze snapshot")
+        magic, version, width, height, goalCount, routeCount, floodOffset, goalOffset, routesOffset = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("Not a maze snapshot")
+        if version != VERSION:
+            raise ValueError(f"Unsupported maze snapshot version {version}")
+
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.routeCount = routeCount
+        self._routesOffset = routesOffset
+
+        size = width * height
+        self.rawCells = np.frombuffer(buffer, dtype=np.uint8, count=size, offset=HEADER.size).reshape(width, height)
+        self.flood = np.frombuffer(buffer, dtype="<i4", count=size, offset=floodOffset).reshape(width, height) if floodOffset else None
+        self.goal : list[tuple[int, int]] = [(x, y) for x, y in np.frombuffer(buffer, dtype="<u2", count=2 * goalCount, offset=goalOffset).reshape(goalCount, 2).tolist()]
+
+    @classmethod
+    def open(cls, filename : str) -> "Snapshot":
+        # Maps the file read only, it stays mapped while the snapshot or any of its arrays are in use
+        with open(filename, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @cached_property
+    def cells(self) -> np.ndarray:
+        return self.rawCells & WALL_MASK
+
+    @cached_property
+    def explored(self) -> np.ndarray:
+        explored : np.ndarray = (self.rawCells & EXPLORED_BIT) != 0
+        return explored
+
+    def route(self, index : int) -> Path:
+        if not 0 <= index < self.routeCount:
+            raise IndexError(f"Route {index} of {self.routeCount}")
+        x, y, length, offset = ROUTE.unpack_from(self.buffer, self._routesOffset + index * ROUTE.size)
+        return Path.fromPackedMoves((x, y), length, self.buffer[offset:offset + (length + 3) // 4])
+
+    def routes(self) -> list[Path]:
+        return [self.route(index) for index in range(self.routeCount)]
+
+
+def isSnapshot(filename : str) -> bool:
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def packSnapshot(cells : Any, explored : Any, flood : Any = None, goal : Sequence[tuple[int, int]] = (), routes : Iterable[Path] = ()) -> bytes:
+    # cells, explored and flood indexed [x][y], as lists or numpy arrays. The flood
+    # is only saved with the goal it was filled to
+    rawCells = (np.asarray(cells, dtype=np.uint8) & WALL_MASK) | np.where(np.asarray(explored, dtype=bool), EXPLORED_BIT, 0).astype(np.uint8)
+    width, height = rawCells.shape
+    routes = list(routes)
+
+    floodOffset = 0
+    offset = HEADER.size + rawCells.nbytes
+    if flood is not None:
+        floodOffset = offset = (offset + 3) // 4 * 4
+        offset += 4 * width * height
+    goalOffset = offset
+    routesOffset = goalOffset + 4 * len(goal)
+
+    entries = []
+    moves = []
+    movesOffset = routesOffset + ROUTE.size * len(routes)
+    for route in routes:
+        assert route.start is not None
+        packed = route.packedMoves()
+        entries.append(ROUTE.pack(route.start[0], route.start[1], len(route) - 1, movesOffset))
+        moves.append(packed)
+        movesOffset += len(packed)
+
+    parts = [
+        HEADER.pack(MAGIC, VERSION, width, height, len(goal), len(routes), floodOffset, goalOffset, routesOffset),
+        rawCells.tobytes(),
+    ]
+    if flood is not None:
+        parts.append(bytes(floodOffset - HEADER.size - rawCells.nbytes))
+        parts.append(np.asarray(flood, dtype="<i4").tobytes())
+    parts.append(np.asarray(goal, dtype="<u2").tobytes())
+    return b"".join(parts + entries + moves)
+
+
+def writeSnapshot(filename : str, *args : Any, **kwargs : Any) -> None:
+    # packSnapshot, saved to filename
+    with open(filename, "wb") as f:
+        f.write(packSnapshot(*args, **kwargs))
+
+
+def readJsonMaze(filename : str) -> tuple[list[list[int]], list[list[bool]]]:
+    # cells and explored from a file saved like outputs/maze.json
+    with open(filename, "r") as f:
+        maze = json.load(f)
+    return maze["cells"], maze["explored"]
+
+
+def readJsonRoutes(filename : str) -> list[Path]:
+    # Routes from a file saved like outputs/bestRoutes.json
+    with open(filename, "r") as f:
+        return [Path(tuple(cell) for cell in route) for route in json.load(f)["bestRoutes"]]
+
+
+def writeJson(snapshot : Snapshot, mazeFile : str, routesFile : str | None = None) -> None:
+    # The snapshot back as the JSON files it can be made from, the flood is left out
+    with open(mazeFile, "w") as f:
+        json.dump({"cells" : snapshot.cells.tolist(), "explored" : snapshot.explored.tolist()}, f)
+    if routesFile is not None:
+        with open(routesFile, "w") as f:
+            json.dump({"bestRoutes" : [[list(cell) for cell in route] for route in snapshot.routes()]}, f)
+
+
+def main() -> None:
+    # From the repository root:
+    #   python -m src.snapshot maze.json [bestRoutes.json] out.mzs   JSON to a snapshot, with the flood to the centre
+    #   python -m src.snapshot in.mzs maze.json [bestRoutes.json]    a snapshot back to JSON
+    args = sys.argv[1:]
+    if len(args) not in (2, 3):
+        sys.exit("Usage: python -m src.snapshot maze.json [bestRoutes.json] out.mzs | in.mzs maze.json [bestRoutes.json]")
+
+    if isSnapshot(args[0]):
+        writeJson(Snapshot.open(args[0]), args[1], args[2] if len(args) == 3 else None)
+        return
+
+    # The maze solver imports this module, so it is only loaded to fill the flood here
+    from old_main import NumpyMaze, centreGoal
+
+    cells, explored = readJsonMaze(args[0])
+    routes = readJsonRoutes(args[1]) if len(args) == 3 else []
+    maze = NumpyMaze(None, len(cells), len(cells[0]))
+    maze.cells = cells
+    maze.explored = explored
+    goal = centreGoal(maze.width, maze.height)
+    maze.recalculate(goal, updateDisplay=False)
+    writeSnapshot(args[-1], maze.cells, maze.explored, maze.flood, goal, routes)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,32 @@
 import sys
 import json
 
+def respond(received : str) -> str:
+    object = json.loads(received)
+    
+    respondBody = {
+        "actions" : [
+            {
+                "actionType" : 0,
+                "jsonBody" : json.dumps({
+                    "left" : 0,
+                    "right" : 0,
+                })
+            }
+        ]
+    }
+    return json.dumps(respondBody)
+
 def main() -> None:
     while(True):
         # Receive a message from the C# application on the
         # Stdin stream and store it inside a variable.
         received = input()
 
-        object = json.loads(received)
-        
-        respondBody = {
-            "actions" : [
-                {
-                    "actionType" : 0,
-                    "jsonBody" : json.dumps({
-                        "left" : 0,
-                        "right" : 0,
-                    })
-                }
-            ]
-        }
         # Send the message received from the C# application
         # back to the C# application through the Stdout stream
-        sys.stdout.write(json.dumps(respondBody) + '\n')
+        sys.stdout.write(respond(received) + '\n')
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,5 +1,34 @@
 import unittest
-from cell import Direction, MouseDirection, Cell
+import numpy as np
+from cell import Direction, MouseDirection, Cell, neighbourTable
+import asyncio
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from api import Actions, Histogram, InputData, Instruments, INSTRUMENTS
+from display import Display
+from frames import FrameBuffer
+from route import Route, RouteController, RouteTracker, SAMPLE_T
+from primitives import LEFT, RIGHT, STRAIGHT, U_TURN_LEFT, primitive, route_from_cells, split_path
+from replay import RecordingStream, load_recording, replay
+from runner import run_controller
+from simulator import Simulator, controller_responder, decode_actions, decode_binary_actions
+
+# The maze solver is at the repository root and imports the modules here through src
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import old_main
+from src.cell import Direction as MazeDirection
+from src.path import Path, countTurns
+import src.snapshot as snapshot
+import src.batch as batch
+import contextlib
+from unittest import mock
 
 class TestCellFunctions(unittest.TestCase):
     def test_relative_directions(self) -> None:
@@ -48,5 +77,994 @@ class TestCellFunctions(unittest.TestCase):
         self.assertEqual(Cell.getClearDirections(14), [Direction.SOUTH])
         self.assertEqual(Cell.getClearDirections(15), [])
 
+    def test_turns_to(self) -> None:
+        self.assertEqual(Direction.NORTH.turnsTo(Direction.NORTH), ())
+        self.assertEqual(Direction.NORTH.turnsTo(Direction.WEST), (MouseDirection.LEFT,))
+        self.assertEqual(Direction.NORTH.turnsTo(Direction.EAST), (MouseDirection.RIGHT,))
+        self.assertEqual(Direction.NORTH.turnsTo(Direction.SOUTH), (MouseDirection.LEFT, MouseDirection.LEFT))
+        self.assertEqual(Direction.WEST.turnsTo(Direction.SOUTH), (MouseDirection.LEFT,))
+        self.assertEqual(Direction.SOUTH.turnsTo(Direction.WEST), (MouseDirection.RIGHT,))
+
+    def test_neighbour_table(self) -> None:
+        neighbours = neighbourTable(16, 16)
+        self.assertEqual(neighbours[0][0][0], ((Direction.NORTH, 0, 1), (Direction.EAST, 1, 0)))
+        self.assertEqual(neighbours[5][5][Cell.addWall(0, Direction.NORTH)], ((Direction.WEST, 4, 5), (Direction.EAST, 6, 5), (Direction.SOUTH, 5, 4)))
+        self.assertEqual(neighbours[15][15][0], ((Direction.WEST, 14, 15), (Direction.SOUTH, 15, 14)))
+        self.assertEqual(neighbours[3][4][15], ())
+
+    def test_neighbour_table_other_sizes(self) -> None:
+        neighbours = neighbourTable(32, 5)
+        self.assertEqual(len(neighbours), 32)
+        self.assertEqual(len(neighbours[0]), 5)
+        self.assertEqual(neighbours[31][4][0], ((Direction.WEST, 30, 4), (Direction.SOUTH, 31, 3)))
+        self.assertEqual(neighbours[20][4][0], ((Direction.WEST, 19, 4), (Direction.EAST, 21, 4), (Direction.SOUTH, 20, 3)))
+
+def exampleRoute() -> Route:
+    route = Route()
+    route.add_curve(((0, 0), (0, 1), (0, 2.5)))
+    route.add_curve(((0, 2.5), (0, 3), (0.5, 3)))
+    route.add_curve(((0.5, 3), (1, 3), (1, 3.5)))
+    route.add_curve(((1, 3.5), (1, 4), (0.5, 4)))
+    route.add_curve(((0.5, 4), (0, 4), (0, 4.5)))
+    return route
+
+class TestRoute(unittest.TestCase):
+    def test_samples_match_curves(self) -> None:
+        route = exampleRoute()
+        self.assertEqual(route.sample_points.shape, (5 * len(SAMPLE_T), 2))
+        for index, curve in enumerate(route.curve_list):
+            for sampleIndex in (0, 37, len(SAMPLE_T) - 1):
+                expected = route.calculate_bezier_point(SAMPLE_T[sampleIndex], *curve)
+                np.testing.assert_allclose(route.sample_points[index * len(SAMPLE_T) + sampleIndex], expected)
+
+    def test_closest_sample_matches_exhaustive_search(self) -> None:
+        route = exampleRoute()
+        rng = np.random.default_rng(0)
+        for position in rng.uniform(-2, 6, size=(200, 2)):
+            tangentialOffset, _, closestPoint, _ = route.calculate_errors((position[0], position[1]), 0)
+            distances = np.linalg.norm(route.sample_points - position, axis=1)
+            self.assertAlmostEqual(tangentialOffset, distances.min())
+            np.testing.assert_allclose(closestPoint, route.sample_points[np.argmin(distances)])
+
+    def test_errors_on_route(self) -> None:
+        route = exampleRoute()
+        tangentialOffset, rotationalOffset, _, closestCurve = route.calculate_errors((0, 1), np.pi / 2)
+        self.assertLess(tangentialOffset, 0.02)
+        self.assertAlmostEqual(rotationalOffset, 0, places=5)
+        self.assertEqual(closestCurve, ((0, 0), (0, 1), (0, 2.5)))
+
+    def test_analytic_projection_is_exact(self) -> None:
+        route = exampleRoute()
+        tangentialOffset, rotationalOffset, closestPoint, closestCurve = route.calculate_errors((0.3, 1), np.pi / 2, analytic=True)
+        self.assertAlmostEqual(tangentialOffset, 0.3)
+        self.assertAlmostEqual(rotationalOffset, 0)
+        np.testing.assert_allclose(closestPoint, (0, 1), atol=1e-12)
+        self.assertEqual(closestCurve, ((0, 0), (0, 1), (0, 2.5)))
+
+    def test_analytic_projection_beats_dense_sampling(self) -> None:
+        route = exampleRoute()
+        t = np.linspace(0, 1, 5001)
+        densePoints = np.concatenate([route.calculate_bezier_points(t, *curve) for curve in route.curve_list])
+        rng = np.random.default_rng(1)
+        for position in rng.uniform(-2, 6, size=(100, 2)):
+            tangentialOffset, _, closestPoint, _ = route.calculate_errors((position[0], position[1]), 0, analytic=True)
+            self.assertLessEqual(tangentialOffset, np.linalg.norm(densePoints - position, axis=1).min() + 1e-12)
+            self.assertAlmostEqual(np.linalg.norm(closestPoint - position), tangentialOffset)
+
+    def test_analytic_matches_every_curve(self) -> None:
+        # The ring search only projects onto nearby curves, so compare it against
+        # projecting onto all of them, on random routes and from far off them
+        rng = np.random.default_rng(2)
+        for curves in (1, 7, 60):
+            steps = rng.uniform(-1, 1, size=(2 * curves, 2))
+            points = np.concatenate(([[0, 0]], np.cumsum(steps, axis=0)))
+            route = Route()
+            route.add_curves([(tuple(points[i]), tuple(points[i + 1]), tuple(points[i + 2])) for i in range(0, 2 * curves, 2)])
+            for position in rng.uniform(-10, 10, size=(100, 2)):
+                tangentialOffset, _, closestPoint, _ = route.calculate_errors((position[0], position[1]), 0, analytic=True)
+                expected = route._closest_point((position[0], position[1]), range(curves))
+                self.assertAlmostEqual(tangentialOffset, expected[0], places=12)
+                np.testing.assert_allclose(closestPoint, expected[3], atol=1e-9)
+
+    def test_empty_route(self) -> None:
+        self.assertEqual(Route().calculate_errors((0, 0), 0), (None, None, None, None))
+
+class TestRouteTracker(unittest.TestCase):
+    def frame(self, x : float, y : float, direction : float) -> InputData:
+        return InputData(0, 0, 0, 0, 0, direction, x, y, direction)
+
+    def test_tracking_matches_global_search(self) -> None:
+        route = exampleRoute()
+        tracker = RouteTracker(route)
+        rng = np.random.default_rng(2)
+
+        # Drive along the route with some noise
+        frames = []
+        for curve in route.curve_list:
+            for t in np.linspace(0, 1, 20, endpoint=False):
+                x, y = route.calculate_bezier_point(t, *curve) + rng.normal(0, 0.03, 2)
+                frames.append(self.frame(x, y, 1.0))
+
+        for frame, errors in tracker.track(frames):
+            expected = route.calculate_errors((frame.actualPositionX, frame.actualPositionY), 1.0, analytic=True)
+            self.assertAlmostEqual(errors[0], expected[0])
+            self.assertAlmostEqual(errors[1], expected[1])
+        self.assertEqual(tracker.global_searches, 1)
+
+    def test_falls_back_to_global_search(self) -> None:
+        route = exampleRoute()
+        tracker = RouteTracker(route)
+        tracker.update((0, 0.5), 0)
+        tangentialOffset, _, _, closestCurve = tracker.update((0.6, 4.1), 0)
+        self.assertEqual(tracker.global_searches, 2)
+        expected = route.calculate_errors((0.6, 4.1), 0, analytic=True)
+        self.assertAlmostEqual(tangentialOffset, expected[0])
+        self.assertEqual(closestCurve, expected[3])
+
+class TestPrimitives(unittest.TestCase):
+    # The cells of exampleRoute, ending at the centre of the cell it stops in
+    CELLS = [(0, 0), (0, 1), (0, 2), (0, 3), (1, 3), (1, 4), (0, 4), (0, 5)]
+
+    def test_split_path(self) -> None:
+        heading, pieces = split_path(self.CELLS)
+        self.assertEqual(heading, Direction.NORTH)
+        self.assertEqual(pieces, [(STRAIGHT, 5), (RIGHT, 0), (U_TURN_LEFT, 0), (RIGHT, 0), (STRAIGHT, 1)])
+        self.assertEqual(split_path([(2, 2), (1, 2)]), (Direction.WEST, [(STRAIGHT, 2)]))
+        self.assertEqual(split_path([(2, 2)]), (Direction.NORTH, []))
+
+    def test_bad_paths(self) -> None:
+        with self.assertRaises(ValueError):
+            split_path([(0, 0), (0, 2)])
+        with self.assertRaises(ValueError):
+            split_path([(0, 0), (0, 1), (0, 0)])
+
+    def test_route_follows_example(self) -> None:
+        route = route_from_cells(self.CELLS)
+        example = exampleRoute()
+        # Same curves, only the straight's middle control point is placed differently
+        self.assertEqual([(curve[0], curve[2]) for curve in route.curve_list[:5]], [(curve[0], curve[2]) for curve in example.curve_list])
+        self.assertEqual(route.curve_list[1:5], example.curve_list[1:])
+        self.assertEqual(route.curve_list[-1][2], (0, 5))
+
+    def test_samples(self) -> None:
+        route = route_from_cells(self.CELLS)
+        for index, curve in enumerate(route.curve_list):
+            np.testing.assert_allclose(route.sample_points[index * len(SAMPLE_T):(index + 1) * len(SAMPLE_T)], route.calculate_bezier_points(SAMPLE_T, *curve), atol=1e-12)
+
+        turn = primitive(LEFT, Direction.EAST)
+        np.testing.assert_allclose(turn.control_points, [((0, 0), (0.5, 0), (0.5, 0.5))])
+        self.assertEqual(turn.heading, Direction.NORTH)
+        self.assertIs(primitive(LEFT, Direction.EAST), turn)
+
+    def test_route_is_smooth(self) -> None:
+        cells = [(x, y if x % 2 == 0 else 5 - y) for x in range(6) for y in range(6)] + [(5, -1), (4, -1), (4, -2)]
+        route = route_from_cells(cells)
+        for before, after in zip(route.curve_list, route.curve_list[1:]):
+            self.assertEqual(before[2], after[0])
+            # Same direction leaving one curve and entering the next
+            outgoing = np.subtract(before[2], before[1])
+            incoming = np.subtract(after[1], after[0])
+            self.assertAlmostEqual(outgoing[0] * incoming[1] - outgoing[1] * incoming[0], 0)
+            self.assertGreater(np.dot(outgoing, incoming), 0)
+        self.assertEqual(route.curve_list[0][0], (0, 0))
+        self.assertEqual(route.curve_list[-1][2], (4, -2))
+
+    def test_empty_path(self) -> None:
+        self.assertEqual(route_from_cells([(3, 3)]).curve_list, [])
+
+class TestActions(unittest.TestCase):
+    def test_encode_matches_nested_json(self) -> None:
+        route = exampleRoute()
+        actions = Actions()
+        actions.setVelocities(1, 2)
+        actions.setVelocities(0.1, -3.5e-7)
+        actions.setCellValue(3, 4, -1)
+        actions.setExplored(1, 2, True)
+        actions.debugPrint('Tagential "error" \\ \u00e9\n')
+        actions.terminate()
+        actions.displayRoute(route)
+
+        bodies = [
+            (0, {"left": 1, "right": 2}),
+            (0, {"left": 0.1, "right": -3.5e-7}),
+            (2, {"x": 3, "y": 4, "value": -1}),
+            (1, {"x": 1, "y": 2, "explored": True}),
+            (3, {"message": 'Tagential "error" \\ \u00e9\n'}),
+            (4, {}),
+        ]
+        expected = [json.dumps({"actionType": actionType, "jsonBody": json.dumps(body)}) for actionType, body in bodies]
+        expected.append(json.dumps({"actionType": 5, "jsonBody": route.to_json()}))
+        self.assertEqual(actions.encode(), json.dumps({"actions": expected}))
+        self.assertEqual(Actions().encode(), json.dumps({"actions": []}))
+
+    def test_encode_binary(self) -> None:
+        actions = Actions()
+        actions.setVelocities(1, 2)
+        actions.setCellValue(3, 4, -1)
+        actions.setExplored(5, 6, True)
+        actions.terminate()
+        frame = actions.encodeBinary()
+
+        self.assertEqual(struct.unpack_from("<I", frame)[0], len(frame) - 4)
+        self.assertEqual(struct.unpack_from("<H", frame, 4)[0], 4)
+        self.assertEqual(struct.unpack_from("<Bff", frame, 6), (0, 1.0, 2.0))
+        self.assertEqual(struct.unpack_from("<BHHi", frame, 15), (2, 3, 4, -1))
+        self.assertEqual(struct.unpack_from("<BHH?", frame, 24), (1, 5, 6, True))
+        self.assertEqual(struct.unpack_from("<BI", frame, 30), (4, 2))
+        self.assertEqual(frame[35:], b"{}")
+
+class TestInstruments(unittest.TestCase):
+    def test_disabled_costs_nothing(self) -> None:
+        instruments = Instruments(False)
+        def function() -> int:
+            return 1
+        self.assertIs(instruments.timed("function")(function), function)
+        self.assertIs(instruments.span("a"), instruments.span("b"))
+        self.assertEqual(instruments.summary(), {"spans" : {}, "counters" : {}})
+
+    def test_spans_and_counters(self) -> None:
+        instruments = Instruments(True)
+        timed = instruments.timed("sleep")(time.sleep)
+        for _ in range(3):
+            timed(0.001)
+        with instruments.span("block"):
+            pass
+        instruments.count("things", 2)
+        instruments.count("things")
+
+        summary = instruments.summary()
+        self.assertEqual(summary["spans"]["sleep"]["count"], 3)
+        self.assertGreaterEqual(summary["spans"]["sleep"]["mean_us"], 1000)
+        self.assertEqual(summary["spans"]["block"]["count"], 1)
+        self.assertEqual(summary["counters"], {"things" : 3})
+        self.assertIn("sleep", instruments.report())
+
+        instruments.reset()
+        self.assertEqual(instruments.summary(), {"spans" : {}, "counters" : {}})
+
+    def test_histogram_buckets(self) -> None:
+        histogram = Histogram()
+        for nanoseconds in [100] * 98 + [5000, 70000]:
+            histogram.add(nanoseconds)
+        # 100 has bit length 7, so its bucket is [64, 128)
+        self.assertEqual(histogram.buckets[7], 98)
+        self.assertEqual(histogram.percentile(0.5), 127)
+        self.assertEqual(histogram.percentile(0.99), 8191)
+        self.assertEqual(histogram.percentile(1), 70000)
+        self.assertEqual(histogram.max, 70000)
+
+    def test_counts_what_is_sent(self) -> None:
+        actions = Actions()
+        actions.setVelocities(1, 2)
+        actions.debugInstruments()
+        stream = io.StringIO()
+        enabled = INSTRUMENTS.enabled
+        INSTRUMENTS.enabled = True
+        INSTRUMENTS.reset()
+        try:
+            actions.write(stream)
+            self.assertEqual(INSTRUMENTS.counters, {"actions sent" : 2, "bytes sent" : len(stream.getvalue())})
+        finally:
+            INSTRUMENTS.enabled = enabled
+            INSTRUMENTS.reset()
+        message = json.loads(json.loads(json.loads(stream.getvalue())["actions"][1])["jsonBody"])["message"]
+        self.assertEqual(set(json.loads(message)), {"spans", "counters"})
+
+    def test_dumps_when_terminate_is_sent(self) -> None:
+        enabled = INSTRUMENTS.enabled
+        INSTRUMENTS.enabled = True
+        INSTRUMENTS.reset()
+        try:
+            with contextlib.redirect_stderr(io.StringIO()) as dumped:
+                actions = Actions()
+                actions.terminate()
+                # Built but not sent yet
+                self.assertEqual(dumped.getvalue(), "")
+                actions.write(io.StringIO())
+            self.assertIn("actions sent", dumped.getvalue())
+        finally:
+            INSTRUMENTS.enabled = enabled
+            INSTRUMENTS.reset()
+
+class TestDisplay(unittest.TestCase):
+    def test_only_changes_are_sent(self) -> None:
+        display = Display(4, 4)
+        values = [[x + y for y in range(4)] for x in range(4)]
+        walls = [[0 for _ in range(4)] for _ in range(4)]
+        explored = [[False for _ in range(4)] for _ in range(4)]
+
+        display.showGrids(values, walls, explored)
+        self.assertEqual(display.flush(Actions()), 32)
+
+        # Nothing changed
+        display.showGrids(values, walls, explored)
+        self.assertEqual(display.flush(Actions()), 0)
+
+        values[1][2] = 7
+        explored[3][3] = True
+        display.showGrids(values, walls, explored)
+        actions = Actions()
+        self.assertEqual(display.flush(actions), 2)
+        self.assertEqual([action.values for action in actions.actions], [(1, 2, 7), (3, 3, True)])
+
+    def test_shared_wall_sent_once(self) -> None:
+        display = Display(4, 4)
+        display.setWalls(1, 1, Cell.addWall(0, Direction.NORTH))
+        display.setWalls(1, 2, Cell.addWall(0, Direction.SOUTH))
+        actions = Actions()
+        self.assertEqual(display.flush(actions), 1)
+        self.assertEqual(actions.actions[0].values, (1, 1, Direction.NORTH.value))
+
+    def test_colors_are_diffed(self) -> None:
+        display = Display(4, 4)
+        for y in range(4):
+            display.setColor(0, y, "g")
+        self.assertEqual(display.flush(Actions()), 4)
+
+        # Redrawing the same route sends nothing, moving one cell sends two
+        display.clearAllColor()
+        for y in range(3):
+            display.setColor(0, y, "g")
+        display.setColor(1, 3, "g")
+        actions = Actions()
+        self.assertEqual(display.flush(actions), 2)
+        self.assertEqual(json.loads(actions.actions[0].jsonBody or ""), {"x": 0, "y": 3, "color": ""})
+
+        # Replacing most of the colours clears them all at once
+        display.clearAllColor()
+        display.setColor(3, 3, "y")
+        actions = Actions()
+        self.assertEqual(display.flush(actions), 2)
+        self.assertEqual(actions.actions[0].actionType, 8)
+
+def frameLine(x : float, y : float, direction : float) -> str:
+    return json.dumps({
+        "leftDistance": 1, "left45Distance": 1, "forwardDistance": 1, "right45Distance": 1, "rightDistance": 1,
+        "directionRad": direction, "actualPositionX": x * 18, "actualPositionY": y * 18, "actualDirectionRad": direction,
+    })
+
+class TestRunner(unittest.TestCase):
+    def test_slow_ticks_drop_stale_frames(self) -> None:
+        # Frames written to a real pipe every half millisecond, to a controller
+        # taking 5 ms a tick
+        readFd, writeFd = os.pipe()
+
+        def produce() -> None:
+            with os.fdopen(writeFd, "w") as stream:
+                for index in range(400):
+                    stream.write(frameLine(0, index / 100, np.pi / 2) + "\n")
+                    stream.flush()
+                    time.sleep(0.0005)
+
+        seen = []
+
+        def controller(inputData : InputData) -> Actions:
+            seen.append(inputData.actualPositionY)
+            time.sleep(0.005)
+            actions = Actions()
+            actions.setVelocities(0.1, 0.1)
+            return actions
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        output = io.StringIO()
+        with os.fdopen(readFd, "r") as stream:
+            stats = asyncio.run(run_controller(controller, stream, output))
+        producer.join()
+
+        self.assertEqual(stats.frames_received, 400)
+        self.assertEqual(stats.ticks + stats.frames_dropped, 400)
+        self.assertGreater(stats.frames_dropped, 200)
+        self.assertEqual(len(output.getvalue().splitlines()), stats.ticks)
+        # The last tick acts on the newest frame, and no tick goes back in time
+        self.assertAlmostEqual(seen[-1], 3.99)
+        self.assertEqual(seen, sorted(seen))
+        self.assertGreater(stats.max_latency, 0)
+
+    def test_controller_error_ends_the_run(self) -> None:
+        # The host sends one frame and then waits, so the reader is blocked on the
+        # pipe when the controller fails
+        readFd, writeFd = os.pipe()
+        errors : list[ValueError] = []
+
+        def controller(inputData : InputData) -> Actions:
+            raise ValueError("bad frame")
+
+        def run() -> None:
+            try:
+                asyncio.run(run_controller(controller, stream, io.StringIO()))
+            except ValueError as error:
+                errors.append(error)
+
+        with os.fdopen(readFd, "r") as stream, os.fdopen(writeFd, "w") as host:
+            host.write(frameLine(0, 0.5, np.pi / 2) + "\n")
+            host.flush()
+            runner = threading.Thread(target=run, daemon=True)
+            runner.start()
+            runner.join(5)
+            self.assertFalse(runner.is_alive())
+        self.assertEqual([str(error) for error in errors], ["bad frame"])
+
+    def test_route_controller(self) -> None:
+        controller = RouteController(exampleRoute())
+        first = controller.step(InputData.from_json(frameLine(0, 0.5, np.pi / 2)))
+        second = controller.step(InputData.from_json(frameLine(0, 0.6, np.pi / 2)))
+        self.assertEqual([action.actionType for action in first.actions], [5, 3])
+        self.assertEqual([action.actionType for action in second.actions], [3])
+
+    def test_step_line_matches_step(self) -> None:
+        lines = [frameLine(0.1 * index, 0.5 + 0.2 * index, np.pi / 2) for index in range(5)]
+        fromData = RouteController(exampleRoute())
+        fromLines = RouteController(exampleRoute())
+        for line in lines:
+            self.assertEqual(fromLines.step_line(line).encode(), fromData.step(InputData.from_json(line)).encode())
+        np.testing.assert_allclose(fromLines.frames.window(), fromData.frames.window())
+        np.testing.assert_allclose(fromLines.frames.pose(), (0.4, 1.3, np.pi / 2))
+
+    def test_runs_on_lines(self) -> None:
+        lines = "".join(frameLine(0, 0.5 + index / 100, np.pi / 2) + "\n" for index in range(5))
+        controller = RouteController(exampleRoute())
+        output = io.StringIO()
+        stats = asyncio.run(run_controller(controller.step_line, io.StringIO(lines), output, parse=str))
+        self.assertEqual(stats.frames_received, 5)
+        self.assertEqual(len(output.getvalue().splitlines()), stats.ticks)
+        self.assertEqual(len(controller.frames), stats.ticks)
+
+class TestFrameBuffer(unittest.TestCase):
+    def test_windows_are_views_of_newest_frames(self) -> None:
+        frames = FrameBuffer(4)
+        for index in range(6):
+            frames.append_json(frameLine(index, 0, 0.1 * index))
+
+        self.assertEqual(len(frames), 4)
+        np.testing.assert_allclose(frames.column("actualPositionX"), [2, 3, 4, 5])
+        np.testing.assert_allclose(frames.column("directionRad", 2), [0.4, 0.5])
+        self.assertIsNotNone(frames.window(3).base)
+
+        latest = frames.latest()
+        self.assertAlmostEqual(latest.actualPositionX, 5)
+        self.assertAlmostEqual(latest.actualDirectionRad, 0.5)
+
+    def test_append_input_data(self) -> None:
+        frames = FrameBuffer(8)
+        inputData = InputData.from_json(frameLine(1, 2, 0.3))
+        frames.append(inputData)
+        np.testing.assert_allclose(frames.window()[:, 0], [1, 1, 1, 1, 1, 0.3, 1, 2, 0.3])
+        self.assertFalse(hasattr(inputData, "__dict__"))
+
+class TestReplay(unittest.TestCase):
+    def test_record_and_replay(self) -> None:
+        lines = "".join(frameLine(0, index / 10, np.pi / 2) + "\n" for index in range(5))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "frames.jsonl")
+            with open(path, "w") as recording:
+                stream = RecordingStream(io.StringIO(lines), recording)
+                self.assertEqual("".join(stream), lines)
+            frames = load_recording(path)
+
+        self.assertEqual([line + "\n" for _, line in frames], lines.splitlines(keepends=True))
+        self.assertEqual([time for time, _ in frames], sorted(time for time, _ in frames))
+
+        result = replay(frames, RouteController(exampleRoute()).step)
+        self.assertEqual(result.ticks, 5)
+        self.assertEqual([action.actionType for action in result.outputs[0].actions], [5, 3])
+        self.assertEqual(len(result.latencies), 5)
+        self.assertIn("5 ticks", result.summary())
+
+class TestSimulator(unittest.TestCase):
+    # A 2x3 maze, open from (0, 0) north to (0, 2), with (1, y) walled off
+    CELLS = [[6, 6, 14], [15, 15, 15]]
+
+    def test_controller_exits_before_ready(self) -> None:
+        simulator = Simulator(self.CELLS)
+        with self.assertRaises(EOFError):
+            simulator.run_process([sys.executable, "-c", "print('starting'); raise SystemExit(3)"])
+        self.assertEqual(simulator.messages, ["starting"])
+        self.assertEqual(simulator.stats.ticks, 0)
+
+    def test_controller_exits_mid_run(self) -> None:
+        # Answers two frames, then exits
+        script = "import sys\nprint('Ready', flush=True)\nfor _ in range(2):\n    sys.stdin.readline()\n    print('{\"actions\": []}', flush=True)\n"
+        simulator = Simulator(self.CELLS)
+        stats = simulator.run_process([sys.executable, "-c", script], 50)
+        self.assertEqual(stats.ticks, 2)
+
+    def test_sensors_and_walls(self) -> None:
+        simulator = Simulator(self.CELLS)
+        frame = simulator.frame()
+        self.assertAlmostEqual(frame["leftDistance"], 9)
+        self.assertAlmostEqual(frame["rightDistance"], 9)
+        self.assertAlmostEqual(frame["forwardDistance"], 45)
+        self.assertAlmostEqual(frame["left45Distance"], 9 * np.sqrt(2))
+
+        def respond(line : str) -> str:
+            actions = Actions()
+            actions.setVelocities(0.2, 0.2)
+            actions.setCellValue(0, 1, 4)
+            return actions.encode()
+
+        stats = simulator.run(respond, 300)
+        self.assertEqual(stats.ticks, 300)
+        self.assertEqual(stats.crashes, 1)
+        self.assertAlmostEqual(simulator.y, 45 - simulator.body_radius)
+        self.assertAlmostEqual(simulator.x, 0)
+        self.assertEqual(simulator.cell_values, {(0, 1) : 4})
+
+    def test_decode_matches_encode(self) -> None:
+        actions = Actions()
+        actions.setVelocities(0.5, 0.25)
+        actions.setWall(1, 2, 3)
+        actions.debugPrint("hello")
+        actions.terminate()
+        expected = [(0, {"left" : 0.5, "right" : 0.25}), (6, {"x" : 1, "y" : 2, "direction" : 3}), (3, {"message" : "hello"}), (4, {})]
+        self.assertEqual(decode_actions(actions.encode()), expected)
+        self.assertEqual(decode_binary_actions(actions.encodeBinary()[4:]), expected)
+
+    def test_route_controller_until_terminate(self) -> None:
+        simulator = Simulator(self.CELLS)
+        respond = controller_responder(RouteController(exampleRoute()).step)
+
+        def respondThenTerminate(line : str) -> str | bytes:
+            if simulator.stats.ticks == 5:
+                actions = Actions()
+                actions.terminate()
+                return actions.encode()
+            return respond(line)
+
+        stats = simulator.run(respondThenTerminate, 100)
+        self.assertTrue(simulator.terminated)
+        self.assertEqual(stats.ticks, 6)
+        self.assertIsNotNone(simulator.route)
+        self.assertEqual(len(simulator.messages), 5)
+
+def randomMaze(rng : random.Random, width : int, height : int, loops : int = 0) -> list[list[int]]:
+    # cells[x][y] wall bits of a maze carved by depth first search, with loops
+    # extra walls knocked out so there is more than one route
+    cells = [[15] * height for _ in range(width)]
+    seen = {(0, 0)}
+    stack = [(0, 0)]
+    while stack:
+        x, y = stack[-1]
+        options = [direction for direction in MazeDirection
+            if 0 <= x + direction.vector[0] < width and 0 <= y + direction.vector[1] < height
+            and (x + direction.vector[0], y + direction.vector[1]) not in seen]
+        if not options:
+            stack.pop()
+            continue
+        direction = rng.choice(options)
+        nx, ny = x + direction.vector[0], y + direction.vector[1]
+        cells[x][y] &= ~old_main.WALL_BITS[direction.value]
+        cells[nx][ny] &= ~old_main.WALL_BITS[direction.opposite.value]
+        seen.add((nx, ny))
+        stack.append((nx, ny))
+    for _ in range(loops):
+        x, y = rng.randrange(1, width - 1), rng.randrange(1, height - 1)
+        direction = rng.choice(list(MazeDirection))
+        nx, ny = x + direction.vector[0], y + direction.vector[1]
+        cells[x][y] &= ~old_main.WALL_BITS[direction.value]
+        cells[nx][ny] &= ~old_main.WALL_BITS[direction.opposite.value]
+    return cells
+
+def knownMaze(cells : list[list[int]], mazeType : type[old_main.Maze] = old_main.Maze) -> old_main.Maze:
+    # A maze with every wall of cells known and explored
+    maze = mazeType(None, len(cells), len(cells[0]))
+    maze.cells = [column.copy() for column in cells]
+    maze.explored = [[True] * len(cells[0]) for _ in cells]
+    return maze
+
+def fullFlood(maze : old_main.Maze, goal : list[tuple[int, int]]) -> list[list[int]]:
+    # The flood to goal filled from scratch on a copy of maze's walls
+    copy = old_main.Maze(None, maze.width, maze.height)
+    copy.cells = [[int(cell) for cell in column] for column in maze.cells]
+    copy.recalculate(goal, updateDisplay=False, incremental=False)
+    return copy.flood
+
+class TestFloodRepair(unittest.TestCase):
+    def test_repair_matches_full_flood(self) -> None:
+        rng = random.Random(1)
+        for trial in range(40):
+            width, height = rng.choice([(5, 5), (8, 6), (16, 16)])
+            walls = randomMaze(rng, width, height, loops=width * height // 8)
+            goal = rng.choice([old_main.centreGoal(width, height), [(rng.randrange(width), rng.randrange(height))]])
+            maze = old_main.Maze(None, width, height)
+            # Blocked cells are left unreachable, which the display check rejects
+            maze.updateDisplay = lambda: None # type: ignore[method-assign]
+            maze.recalculate(goal, updateDisplay=False)
+
+            # Walls turn up a few at a time, as they do while exploring
+            for step in range(30):
+                for _ in range(rng.randrange(1, 6)):
+                    x, y = rng.randrange(width), rng.randrange(height)
+                    for direction in MazeDirection:
+                        if walls[x][y] & old_main.WALL_BITS[direction.value]:
+                            maze.addWall(x, y, direction)
+                    maze.setExplored(x, y)
+                if step == 20 and trial % 2:
+                    maze.blockUnexplored()
+                maze.recalculate(goal, updateDisplay=False)
+                self.assertEqual(maze.flood, fullFlood(maze, goal), (trial, step))
+
+class TestNumpyMaze(unittest.TestCase):
+    def test_flood_matches_maze(self) -> None:
+        rng = random.Random(2)
+        for trial in range(30):
+            width, height = rng.choice([(5, 7), (16, 16), (32, 20)])
+            walls = randomMaze(rng, width, height, loops=rng.choice([0, width * height // 4]))
+            goal = rng.choice([old_main.centreGoal(width, height), [(rng.randrange(width), rng.randrange(height))]])
+            numpyMaze = knownMaze(walls, old_main.NumpyMaze)
+            numpyMaze.recalculate(goal, updateDisplay=False)
+            self.assertEqual(numpyMaze.flood.tolist(), fullFlood(numpyMaze, goal))
+
+            # And again after walls are added
+            for _ in range(5):
+                numpyMaze.addWall(rng.randrange(width), rng.randrange(height), rng.choice(list(MazeDirection)))
+            numpyMaze.recalculate(goal, updateDisplay=False)
+            self.assertEqual(numpyMaze.flood.tolist(), fullFlood(numpyMaze, goal))
+
+    def test_open_maze(self) -> None:
+        maze = old_main.NumpyMaze(None, 8, 8)
+        maze.recalculate([(0, 0)], updateDisplay=False)
+        self.assertEqual(maze.flood.tolist(), [[x + y for y in range(8)] for x in range(8)])
+
+def simpleRoutes(maze : old_main.Maze, start : tuple[int, int], goal : list[tuple[int, int]], passable : list[list[bool]]) -> list[list[tuple[int, int]]]:
+    # Every route from start that ends on entering the goal, visiting no cell twice
+    # and only passable cells, by brute force
+    routes = []
+    route = [start]
+
+    def search(x : int, y : int) -> None:
+        if (x, y) in goal:
+            routes.append(list(route))
+            return
+        for _, nx, ny in maze.neighbours[x][y][maze.cells[x][y]]:
+            if passable[nx][ny] and (nx, ny) not in route:
+                route.append((nx, ny))
+                search(nx, ny)
+                route.pop()
+
+    search(*start)
+    return routes
+
+class TestKShortestRoutes(unittest.TestCase):
+    def test_lengths_match_brute_force(self) -> None:
+        rng = random.Random(3)
+        for trial in range(40):
+            width, height = rng.choice([(4, 4), (5, 4), (5, 5)])
+            goal = old_main.centreGoal(width, height)
+            maze = knownMaze(randomMaze(rng, width, height, loops=rng.randrange(6)))
+            maze.explored = [[rng.random() < 0.85 for _ in range(height)] for _ in range(width)]
+            for x, y in [(0, 0)] + goal:
+                maze.explored[x][y] = True
+            k = rng.randrange(1, 12)
+
+            routes = maze.kShortestRoutes((0, 0), goal, k)
+            everyRoute = simpleRoutes(maze, (0, 0), goal, maze.passableCells())
+            self.assertEqual([len(route) for route in routes], sorted(len(route) for route in everyRoute)[:k], trial)
+            self.assertEqual(len(set(routes)), len(routes))
+            for route in routes:
+                self.assertIn(list(route), everyRoute)
+
+    def test_pool_matches_serial(self) -> None:
+        rng = random.Random(4)
+        maze = knownMaze(randomMaze(rng, 16, 16, loops=40))
+        goal = old_main.centreGoal(16, 16)
+        serial = maze.kShortestRoutes((0, 0), goal, 12)
+        pooled = maze.kShortestRoutes((0, 0), goal, 12, workers=2)
+        self.assertEqual(len(serial), 12)
+        self.assertEqual([list(route) for route in pooled], [list(route) for route in serial])
+
+class TestFastestRoute(unittest.TestCase):
+    def test_matches_brute_force(self) -> None:
+        rng = random.Random(5)
+        for trial in range(40):
+            width, height = rng.choice([(4, 4), (5, 4), (5, 5)])
+            goal = old_main.centreGoal(width, height)
+            maze = knownMaze(randomMaze(rng, width, height, loops=rng.randrange(8)))
+            model = old_main.DriveModel(turnTime=rng.choice([0.1, 0.3, 1.0]), acceleration=rng.choice([1.0, 4.0]))
+
+            route = maze.fastestRoute((0, 0), MazeDirection.NORTH, goal, model)
+            assert route is not None
+            everyRoute = simpleRoutes(maze, (0, 0), goal, maze.passableCells())
+            self.assertIn(list(route), everyRoute)
+            self.assertAlmostEqual(
+                model.routeTime(list(route), MazeDirection.NORTH),
+                min(model.routeTime(other, MazeDirection.NORTH) for other in everyRoute),
+                msg=str(trial),
+            )
+
+def randomWalk(rng : random.Random, length : int) -> list[tuple[int, int]]:
+    cells = [(rng.randrange(-5, 5), rng.randrange(-5, 5))]
+    for _ in range(length - 1):
+        dx, dy = rng.choice(list(MazeDirection)).vector
+        cells.append((cells[-1][0] + dx, cells[-1][1] + dy))
+    return cells
+
+class TestPath(unittest.TestCase):
+    def test_copies_share_until_append(self) -> None:
+        path = Path([(0, 0), (0, 1), (0, 2)])
+        copy = path.copy()
+        copy.append((1, 2))
+        path.append((0, 3))
+        copy.append((2, 2))
+        self.assertEqual(list(path), [(0, 0), (0, 1), (0, 2), (0, 3)])
+        self.assertEqual(list(copy), [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2)])
+        self.assertEqual(path.getNumberOfTurns(), 0)
+        self.assertEqual(copy.getNumberOfTurns(), 1)
+
+    def test_extend(self) -> None:
+        rng = random.Random(6)
+        for length in range(1, 40):
+            cells = randomWalk(rng, length)
+            split = rng.randrange(length + 1)
+            path = Path(cells[:split])
+            path.extend(cells[split:])
+            self.assertEqual(list(path), cells)
+            self.assertEqual(len(path), length)
+            self.assertEqual(path.getNumberOfTurns(), countTurns(cells))
+            self.assertEqual(path, Path(cells))
+
+        # A cell that is not next to the last leaves the path as it was
+        path = Path([(0, 0), (0, 1)])
+        with self.assertRaises(ValueError):
+            path.extend([(0, 2), (0, 4)])
+        self.assertEqual(list(path), [(0, 0), (0, 1)])
+
+    def test_packed_moves_round_trip(self) -> None:
+        rng = random.Random(7)
+        for length in range(1, 40):
+            cells = randomWalk(rng, length)
+            path = Path(cells)
+            copy = Path.fromPackedMoves(cells[0], length - 1, path.packedMoves())
+            self.assertEqual(list(copy), cells)
+            self.assertEqual(copy, path)
+            self.assertEqual(copy.end, cells[-1])
+            self.assertEqual(copy.getNumberOfTurns(), countTurns(cells))
+            copy.append((cells[-1][0] + 1, cells[-1][1]))
+            self.assertEqual(list(copy), cells + [(cells[-1][0] + 1, cells[-1][1])])
+
+    def test_equal_paths_hash_equal(self) -> None:
+        rng = random.Random(8)
+        for length in range(1, 30):
+            cells = randomWalk(rng, length)
+            built = Path()
+            for cell in cells:
+                built.append(cell)
+            branched = Path(cells[:-1]).copy() if length > 1 else Path()
+            branched.extend(cells[-1:] if length > 1 else cells)
+            for other in (built, branched, Path(cells)):
+                self.assertEqual(other, Path(cells))
+                self.assertEqual(hash(other), hash(Path(cells)))
+            self.assertIn(built, {Path(cells)})
+            # Paths are only equal to paths
+            self.assertNotEqual(built, tuple(cells))
+            self.assertNotEqual(built, cells)
+
+OUTPUTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "outputs")
+
+class TestSnapshot(unittest.TestCase):
+    def test_json_round_trip(self) -> None:
+        mazeFile = os.path.join(OUTPUTS, "maze.json")
+        routesFile = os.path.join(OUTPUTS, "bestRoutes.json")
+        with tempfile.TemporaryDirectory() as directory:
+            snapshotFile = os.path.join(directory, "maze.mzs")
+            with mock.patch.object(sys, "argv", ["snapshot", mazeFile, routesFile, snapshotFile]):
+                snapshot.main()
+            with mock.patch.object(sys, "argv", ["snapshot", snapshotFile, os.path.join(directory, "maze.json"), os.path.join(directory, "bestRoutes.json")]):
+                snapshot.main()
+            for name in ("maze.json", "bestRoutes.json"):
+                with open(os.path.join(OUTPUTS, name)) as original, open(os.path.join(directory, name)) as copy:
+                    self.assertEqual(json.load(copy), json.load(original))
+
+            saved = snapshot.Snapshot.open(snapshotFile)
+            cells, explored = snapshot.readJsonMaze(mazeFile)
+            self.assertEqual(saved.cells.tolist(), cells)
+            self.assertEqual(saved.explored.tolist(), explored)
+            self.assertEqual(saved.routes(), snapshot.readJsonRoutes(routesFile))
+            goal = old_main.centreGoal(saved.width, saved.height)
+            self.assertEqual(saved.goal, goal)
+            assert saved.flood is not None
+            self.assertEqual(saved.flood.tolist(), fullFlood(knownMaze(cells), goal))
+            # Split out of the mapping once, then kept
+            self.assertIs(saved.cells, saved.cells)
+
+    def test_without_flood(self) -> None:
+        rng = random.Random(9)
+        cells = randomMaze(rng, 7, 5)
+        explored = [[rng.random() < 0.5 for _ in range(5)] for _ in range(7)]
+        # Starts are stored unsigned
+        routes = [Path((x + 10, y + 10) for x, y in randomWalk(rng, length)) for length in (1, 2, 9)]
+        with tempfile.TemporaryDirectory() as directory:
+            snapshotFile = os.path.join(directory, "maze.mzs")
+            snapshot.writeSnapshot(snapshotFile, cells, explored, routes=routes)
+            saved = snapshot.Snapshot.open(snapshotFile)
+            self.assertIsNone(saved.flood)
+            self.assertEqual(saved.goal, [])
+            self.assertEqual((saved.width, saved.height), (7, 5))
+            self.assertEqual(saved.cells.tolist(), cells)
+            self.assertEqual(saved.explored.tolist(), explored)
+            self.assertEqual(saved.routes(), routes)
+            with self.assertRaises(IndexError):
+                saved.route(saved.routeCount)
+
+    def test_load_maze_skips_fill(self) -> None:
+        fills = []
+
+        class CountingMaze(old_main.Maze):
+            def fullFlood(self, goal : list[tuple[int, int]]) -> None:
+                fills.append(goal)
+                super().fullFlood(goal)
+
+        maze = knownMaze(randomMaze(random.Random(10), 6, 6, loops=4))
+        goal = old_main.centreGoal(6, 6)
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            withFlood = os.path.join(directory, "flood.mzs")
+            withoutFlood = os.path.join(directory, "walls.mzs")
+            maze.recalculate(goal, updateDisplay=False)
+            maze.saveSnapshot(withFlood)
+            snapshot.writeSnapshot(withoutFlood, maze.cells, maze.explored)
+
+            mouse = old_main.Mouse(width=6, height=6)
+            mouse.mazeType = CountingMaze
+            mouse.loadMaze(withFlood)
+            self.assertEqual(fills, [])
+            self.assertEqual(mouse.maze.flood, maze.flood)
+
+            mouse.loadMaze(withoutFlood)
+            self.assertEqual(fills, [goal])
+            self.assertEqual(mouse.maze.flood, maze.flood)
+
+class TestBatch(unittest.TestCase):
+    def test_solve_saved_maze(self) -> None:
+        with open(os.path.join(OUTPUTS, "maze.json"), "rb") as f:
+            data = f.read()
+        results = [batch.solveMaze(("maze.json", data, useNumpyMaze)) for useNumpyMaze in (False, True)]
+        for result in results:
+            self.assertNotIn("error", result)
+            self.assertTrue(result["explored"])
+            self.assertEqual(result["optimalLength"], fullFlood(knownMaze(json.loads(data)["cells"]), old_main.centreGoal(16, 16))[0][0] + 1)
+            self.assertGreaterEqual(result["routeLength"], result["optimalLength"])
+            del result["solveTime"]
+        self.assertEqual(results[0], results[1])
+
+    def test_main_over_directory(self) -> None:
+        rng = random.Random(11)
+        with tempfile.TemporaryDirectory() as directory:
+            cells = randomMaze(rng, 8, 8, loops=6)
+            with open(os.path.join(directory, "a.json"), "w") as f:
+                json.dump({"cells" : cells, "explored" : [[False] * 8 for _ in range(8)]}, f)
+            snapshot.writeSnapshot(os.path.join(directory, "b.mzs"), randomMaze(rng, 6, 10), [[False] * 10 for _ in range(6)])
+            output = os.path.join(directory, "results.jsonl")
+            with mock.patch.object(sys, "argv", ["batch", directory, "--workers", "1", "--output", output]), contextlib.redirect_stdout(io.StringIO()) as printed:
+                batch.main()
+            with open(output) as f:
+                results = [json.loads(line) for line in f]
+
+        self.assertEqual([result["name"] for result in results], ["a.json", "b.mzs"])
+        for result in results:
+            self.assertIsNotNone(result["routeLength"])
+        self.assertIn("2 mazes in", printed.getvalue())
+
+class TestMazeOverlay(unittest.TestCase):
+    def test_matches_copied_maze(self) -> None:
+        rng = random.Random(12)
+        for trial in range(30):
+            width, height = rng.choice([(5, 5), (8, 6), (16, 16)])
+            goal = old_main.centreGoal(width, height)
+            base = knownMaze(randomMaze(rng, width, height, loops=width * height // 6))
+            base.explored = [[rng.random() < 0.8 for _ in range(height)] for _ in range(width)]
+            base.recalculate(goal, updateDisplay=False)
+            before = ([column.copy() for column in base.cells], [column.copy() for column in base.explored], [column.copy() for column in base.flood])
+
+            # Two overlays stacked on the base, against copies that take the same walls
+            overlay = old_main.MazeOverlay(base)
+            copy = knownMaze(base.cells)
+            copy.explored = [column.copy() for column in base.explored]
+            for _ in range(rng.randrange(1, 6)):
+                x, y, direction = rng.randrange(width), rng.randrange(height), rng.choice(list(MazeDirection))
+                for maze in (overlay, copy):
+                    maze.addWall(x, y, direction)
+                    maze.setExplored(x, y)
+            top = old_main.MazeOverlay(overlay)
+            topCopy = knownMaze(copy.cells)
+            topCopy.explored = [column.copy() for column in copy.explored]
+            x, y, direction = rng.randrange(width), rng.randrange(height), rng.choice(list(MazeDirection))
+            top.addWall(x, y, direction)
+            topCopy.addWall(x, y, direction)
+
+            for maze, expected in ((overlay, copy), (top, topCopy)):
+                maze.recalculate(goal, updateDisplay=False)
+                expected.recalculate(goal, updateDisplay=False)
+                self.assertEqual(maze.cells, expected.cells, trial)
+                self.assertEqual(maze.explored, expected.explored, trial)
+                self.assertEqual(maze.flood, expected.flood, trial)
+            with contextlib.redirect_stdout(io.StringIO()):
+                routes = top.calculateBestRoutes((0, 0), MazeDirection.NORTH, goal, True, 4)
+                expectedRoutes = topCopy.calculateBestRoutes((0, 0), MazeDirection.NORTH, goal, True, 4)
+            self.assertEqual([list(route) for route in routes], [list(route) for route in expectedRoutes], trial)
+            self.assertEqual((base.cells, base.explored, base.flood), before, trial)
+
+    def test_draws_on_its_own_display(self) -> None:
+        display = Display(6, 6)
+        base = old_main.Maze(display, 6, 6)
+        base.recalculate([(0, 0)])
+        shown = [column.copy() for column in display.values]
+        overlay = old_main.MazeOverlay(base)
+        overlay.addWall(0, 0, MazeDirection.NORTH)
+        overlay.recalculate([(0, 0)])
+        self.assertIsNot(overlay.display, display)
+        self.assertEqual(overlay.display.values, overlay.flood)
+
+        # Route search colours the cells it visits
+        routes = old_main.MazeOverlay(base)
+        with contextlib.redirect_stdout(io.StringIO()):
+            routes.calculateBestRoutes((5, 5), MazeDirection.SOUTH, [(0, 0)])
+        self.assertIsNot(routes.display, display)
+        self.assertNotEqual(routes.display.colors, {})
+        self.assertEqual(display.values, shown)
+        self.assertEqual(display.colors, {})
+
+class TestFloodCache(unittest.TestCase):
+    def test_hit_after_switching_goals(self) -> None:
+        for mazeType in (old_main.Maze, old_main.NumpyMaze):
+            fills = []
+
+            class CountingMaze(mazeType): # type: ignore[valid-type, misc]
+                def fullFlood(self, goal : list[tuple[int, int]]) -> None:
+                    fills.append(goal)
+                    super().fullFlood(goal)
+
+            maze = knownMaze(randomMaze(random.Random(13), 8, 8, loops=10), CountingMaze)
+            centre, corner = old_main.centreGoal(8, 8), [(0, 0)]
+            maze.recalculate(centre, updateDisplay=False)
+            maze.recalculate(corner, updateDisplay=False)
+            self.assertEqual(fills, [centre, corner])
+
+            # Switching back takes the flood from the cache
+            for goal in (centre, corner, centre):
+                maze.recalculate(goal, updateDisplay=False)
+                self.assertEqual(np.asarray(maze.flood).tolist(), fullFlood(maze, goal))
+            self.assertEqual(len(fills), 2, mazeType)
+
+            # A wall makes every cached flood stale
+            direction = next(direction for direction in MazeDirection if not maze.cells[3][3] & old_main.WALL_BITS[direction.value])
+            maze.addWall(3, 3, direction)
+            maze.recalculate(corner, updateDisplay=False)
+            self.assertEqual(fills[2:], [corner], mazeType)
+            self.assertEqual(np.asarray(maze.flood).tolist(), fullFlood(maze, corner))
+
+class NeverSensed(set):
+    # Makes a mouse sense every cell again, so it walks one cell at a time
+    def __contains__(self, cell : object) -> bool:
+        return False
+
+class TestKnownMoves(unittest.TestCase):
+    def walk(self, cells : list[list[int]], stepByStep : bool) -> tuple[tuple[int, ...], tuple[int, ...], list[list[int]], int]:
+        # Explores to the goal, steps in, then explores back to the start
+        mouse = batch.OracleMouse(cells, goal=old_main.centreGoal(len(cells), len(cells[0])))
+        if stepByStep:
+            mouse.sensedCells = NeverSensed()
+        maxSteps = 4 * len(cells) * len(cells[0])
+        self.assertTrue(mouse.explore(maxSteps))
+        there = (mouse.steps, mouse.turns, mouse.x, mouse.y, mouse.direction.value)
+        mouse.TurnMouse(mouse.FindBestDirection())
+        mouse.MoveForward()
+        commands = mouse.commands
+        while not mouse.exploringMove([(0, 0)], True, old_main.MouseState.EXPLORING):
+            self.assertLess(mouse.steps, 2 * maxSteps)
+        back = (mouse.steps, mouse.turns, mouse.x, mouse.y, mouse.direction.value)
+        return there, back, [list(column) for column in mouse.maze.cells], mouse.commands - commands
+
+    def test_same_walk_as_step_by_step(self) -> None:
+        rng = random.Random(14)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for trial in range(12):
+                width, height = rng.choice([(6, 6), (8, 8), (16, 16)])
+                cells = randomMaze(rng, width, height, loops=rng.choice([0, width * height // 8]))
+                planned = self.walk(cells, stepByStep=False)
+                stepped = self.walk(cells, stepByStep=True)
+                self.assertEqual(planned[:3], stepped[:3], trial)
+                # The way back crosses sensed cells, driven as straight runs
+                self.assertLess(planned[3], stepped[3], trial)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file